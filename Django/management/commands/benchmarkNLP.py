@@ -0,0 +1,128 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from Django.management.commands.reportPipelineProfiles import ANALYSIS_PARAMS
+from benchmarks.syntheticNotes import SyntheticNoteGenerator, DEFAULT_SIZES
+from Utility.profiling import RequestProfiler
+import platform
+import statistics
+import json
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks LanguageProcessor throughput, latency and per-stage durations on synthetic notes of increasing size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Note sizes in characters.")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of timed runs per note size.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic note generator.")
+        parser.add_argument('--output', help="Optional path of a json file to write the results to.")
+        parser.add_argument('--baseline', help="Optional json results of a previous run to compare with.")
+        parser.add_argument('--profile', action='store_true',
+                            help="Save a cProfile and collapsed-stack profile of each note size in settings.NLP_PROFILE_DIR.")
+
+    def _runSize(self, langProcessor, note, repeat):
+        '''Returns latencies and stage durations of repeat analyses of note, each in seconds.'''
+        # one untimed run, so that lazily built state is not counted in the first timed run
+        langProcessor.analyzeText(note, **ANALYSIS_PARAMS)
+
+        latencies = []
+        stageRuns = []
+        for _ in range(repeat):
+            # repeated runs of the same note would otherwise be served from the section memo
+            langProcessor.sectionMemo.clear()
+            start = time.perf_counter()
+            results = langProcessor.analyzeText(note, **ANALYSIS_PARAMS)
+            latencies.append(time.perf_counter() - start)
+            stageRuns.append(results['stats']['timings'])
+
+        stages = dict()
+        for stage in stageRuns[0]:
+            stages[stage] = statistics.median(run.get(stage, 0) for run in stageRuns)
+
+        return latencies, stages, results
+
+    def handle(self, *args, **options):
+        from NLP.languageProcessor import LanguageProcessor
+        import spacy
+
+        langProcessor = LanguageProcessor()
+        generator = SyntheticNoteGenerator(seed=options['seed'])
+
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'spacy': spacy.__version__,
+                'profile': langProcessor.profile,
+                'pipelineVersion': langProcessor.pipelineVersion,
+            },
+            'params': {**ANALYSIS_PARAMS, 'seed': options['seed'], 'repeat': options['repeat']},
+            'sizes': [],
+        }
+
+        for size in options['sizes']:
+            note = generator.makeNote(size)
+            print("Benchmarking", len(note), "character note...")
+
+            if options['profile']:
+                with RequestProfiler(settings.NLP_PROFILE_DIR, 'benchmarkNLP-%d' % size):
+                    latencies, stages, results = self._runSize(langProcessor, note, options['repeat'])
+            else:
+                latencies, stages, results = self._runSize(langProcessor, note, options['repeat'])
+
+            medianLatency = statistics.median(latencies)
+            report['sizes'].append({
+                'size': size,
+                'chars': len(note),
+                'tokens': len(results['tokens']),
+                'entities': len(results['entities']),
+                'medianSeconds': medianLatency,
+                'minSeconds': min(latencies),
+                'maxSeconds': max(latencies),
+                'charsPerSecond': len(note) / medianLatency,
+                'stageSeconds': stages,
+            })
+
+        self._printReport(report)
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                self._printComparison(report, json.load(file))
+
+        if options['output']:
+            with open(options['output'], mode='w') as file:
+                json.dump(report, file, indent=2)
+
+    def _printReport(self, report):
+        stageNames = sorted(set(stage for result in report['sizes'] for stage in result['stageSeconds'] if stage != 'total'))
+
+        print("%10s %10s %12s %12s" % ('chars', 'entities', 'median (ms)', 'chars/s'))
+        for result in report['sizes']:
+            print("%10d %10d %12.1f %12.0f" % (result['chars'], result['entities'],
+                                               result['medianSeconds'] * 1000, result['charsPerSecond']))
+
+        print("\nMedian stage durations (ms):")
+        print("%18s" % 'stage' + ''.join("%12d" % result['chars'] for result in report['sizes']))
+        for stage in stageNames:
+            print("%18s" % stage + ''.join("%12.2f" % (result['stageSeconds'].get(stage, 0) * 1000) for result in report['sizes']))
+
+    def _printComparison(self, report, baseline):
+        '''Prints the ratio of median durations to those of the baseline run, per size and stage, < 1 is faster.'''
+        baselineSizes = {result['size']: result for result in baseline['sizes']}
+
+        if baseline.get('environment', {}).get('pipelineVersion') != report['environment']['pipelineVersion']:
+            print("\nNote: the baseline was run with another pipeline version, outputs may differ.")
+
+        print("\nDuration relative to baseline:")
+        for result in report['sizes']:
+            baselineResult = baselineSizes.get(result['size'])
+            if not baselineResult:
+                continue
+
+            ratios = ["total %.2fx" % (result['medianSeconds'] / baselineResult['medianSeconds'])]
+            for stage, seconds in sorted(result['stageSeconds'].items()):
+                baselineSeconds = baselineResult['stageSeconds'].get(stage)
+                if stage != 'total' and baselineSeconds:
+                    ratios.append("%s %.2fx" % (stage, seconds / baselineSeconds))
+
+            print("%10d chars: %s" % (result['chars'], ', '.join(ratios)))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from NLP.knowledgeBundle import compileBundle, SPACY_MODEL
+import spacy
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compiles the NLP knowledge source files into a versioned bundle for fast LanguageProcessor startup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.NLP_KNOWLEDGE_BUNDLE,
+                            help="Path of the bundle file to write, defaults to settings.NLP_KNOWLEDGE_BUNDLE.")
+
+    def handle(self, *args, **options):
+        startTime = time.time()
+
+        # must be a fresh model, pattern phrases are tokenized with the model's default tokenizer
+        nlp = spacy.load(SPACY_MODEL)
+        bundle = compileBundle(nlp, options['output'])
+
+        print("Keyword phrases:", len(bundle['icdKeywordPhrases']))
+        print("Normalization phrases:", len(bundle['normalizationDict']))
+        print("Section aliases:", sum(len(aliases) for aliases in bundle['sections'].values()))
+        print("Knowledge bundle version", bundle['version'], "written to", options['output'],
+              "in %.1f seconds" % (time.time() - startTime))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from oauth2_provider.models import get_application_model
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Creates (or resets) the admin user and OAuth application used by benchmarks/loadTest.py, prints the client id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='loadtest')
+        parser.add_argument('--password', default='loadtest-password')
+
+    def handle(self, *args, **options):
+        # admin role, getAllAnnots is only available to admins
+        user, created = CustomUser.objects.get_or_create(username=options['username'], defaults={
+            'email': options['username'] + '@localhost',
+            'role': 'admin',
+            'verified': True,
+        })
+        user.set_password(options['password'])
+        user.save()
+        print("Created user" if created else "Reset password of user", options['username'])
+
+        Application = get_application_model()
+        application, created = Application.objects.get_or_create(name='loadtest', user=user, defaults={
+            'client_type': Application.CLIENT_PUBLIC,
+            'authorization_grant_type': Application.GRANT_PASSWORD,
+        })
+        print("OAuth application client id:", application.client_id)
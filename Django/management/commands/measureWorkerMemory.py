@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from Utility.memory import getMemoryUsage
+import multiprocessing
+import json
+import gc
+
+SAMPLE_TEXT = ("\nHistory of present illness:\nPatient presented with chest pain and shortness of breath. "
+               "No fever. History of hypertension and type 2 diabetes mellitus.\n\nPlan:\n1. Start metformin.\n")
+
+
+def _worker(langProcessor, connection):
+    '''Simulates a server worker: builds its own LanguageProcessor unless one was inherited from the parent, then serves a request.'''
+    if langProcessor is None:
+        from NLP.languageProcessor import LanguageProcessor
+        langProcessor = LanguageProcessor()
+
+    langProcessor.analyzeText(SAMPLE_TEXT, scope='section', sectionsIgnored=['fam_hist'])
+    connection.send(getMemoryUsage())
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Measures per-worker memory of forked NLP workers, with the LanguageProcessor built per worker and built once before fork'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Number of worker processes to fork.")
+        parser.add_argument('--output', help="Optional path of a json file to write the measurements to.")
+
+    def _runWorkers(self, numWorkers, langProcessor):
+        '''Forks workers that stay alive until all of them are measured, so shared pages are counted while shared.'''
+        context = multiprocessing.get_context('fork')
+        processes = []
+        receivers = []
+
+        for _ in range(numWorkers):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_worker, args=(langProcessor, sender))
+            process.start()
+            processes.append(process)
+            receivers.append(receiver)
+
+        usages = [receiver.recv() for receiver in receivers]
+
+        for process in processes:
+            process.join()
+
+        return self._summarize(usages)
+
+    def _summarize(self, usages):
+        summary = dict()
+        for key in ('rss', 'pss', 'shared', 'private'):
+            values = [usage[key] for usage in usages if usage[key] is not None]
+            summary[key + 'MB'] = round(sum(values) / len(values) / 2**20, 1) if values else None
+        return summary
+
+    def handle(self, *args, **options):
+        numWorkers = options['workers']
+        report = dict()
+
+        print("Measuring", numWorkers, "workers each building their own LanguageProcessor...")
+        report['perWorker'] = self._runWorkers(numWorkers, None)
+
+        print("Measuring", numWorkers, "workers sharing a LanguageProcessor built before fork...")
+        from NLP.languageProcessor import LanguageProcessor
+        langProcessor = LanguageProcessor()
+        gc.collect()
+        gc.freeze()
+        report['prefork'] = self._runWorkers(numWorkers, langProcessor)
+
+        print("Average per-worker memory:")
+        print(json.dumps(report, indent=2))
+
+        if options['output']:
+            with open(options['output'], mode='w') as file:
+                json.dump(report, file, indent=2)
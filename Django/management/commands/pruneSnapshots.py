@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.utils import timezone
+from documents.models import ParsedDocument
+from datetime import timedelta
+
+
+class Command(BaseCommand):
+    help = 'Deletes saved snapshots of parsed documents of other pipeline versions than the current one, and those older than a maximum age'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-days', type=int, default=settings.NLP_SNAPSHOT_MAX_AGE_DAYS,
+                            help="Snapshots older than this are deleted, default settings.NLP_SNAPSHOT_MAX_AGE_DAYS.")
+        parser.add_argument('--pipeline-version',
+                            help="Current pipeline version, whose snapshots are kept. Computed by loading the LanguageProcessor when not given.")
+        parser.add_argument('--dry-run', action='store_true', help="Only print the numbers of snapshots that would be deleted.")
+
+    def handle(self, *args, **options):
+        pipelineVersion = options['pipeline_version']
+        if pipelineVersion is None:
+            from NLP.languageProcessor import LanguageProcessor
+            pipelineVersion = LanguageProcessor().pipelineVersion
+
+        # snapshots of other versions are never used again, reanalyzeDoc looks them up by the current version
+        staleVersions = ParsedDocument.objects.exclude(pipelineVersion=pipelineVersion)
+        expired = ParsedDocument.objects.filter(pipelineVersion=pipelineVersion,
+                                                created__lt=timezone.now() - timedelta(days=options['max_age_days']))
+
+        print("Snapshots of other pipeline versions:", staleVersions.count())
+        print("Snapshots older than %d days:" % options['max_age_days'], expired.count())
+
+        if options['dry_run']:
+            return
+
+        staleVersions.delete()
+        expired.delete()
+        print("Deleted.")
@@ -0,0 +1,135 @@
+from django.core.management.base import BaseCommand, CommandError
+from NLP.pipelineProfiles import PIPELINE_PROFILES
+from Utility.memory import getMemoryUsage
+from Utility.profiling import RequestProfiler
+from django.conf import settings
+import multiprocessing
+import json
+import glob
+import os
+import time
+
+# same analysis parameters as UploadDoc.analysisParams
+ANALYSIS_PARAMS = {'scope': 'section', 'removeNested': True, 'maxSentDist': 2, 'sectionsIgnored': ['fam_hist'], 'phraseNorm': True}
+
+
+def _analyzeCorpus(langProcessor, texts):
+    '''Returns outputs to compare between profiles, and the latency of each text.'''
+    outputs = []
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        results = langProcessor.analyzeText(text, **ANALYSIS_PARAMS)
+        latencies.append(time.perf_counter() - start)
+        outputs.append({
+            'entities': sorted((e['start'], e['end'], e['tag'], e['type']) for e in results['entities']),
+            'sentences': [(s['start'], s['end']) for s in results['sentences']],
+            'sections': [(s['start'], s['end'], s['tag']) for s in results['sections']],
+        })
+    return (outputs, latencies)
+
+
+def _runProfile(profile, texts, connection, profileDir=None):
+    '''Runs in a forked child process, so that memory of each profile is measured in a fresh process.'''
+    from NLP.languageProcessor import LanguageProcessor
+
+    memoryBefore = getMemoryUsage()
+    loadStart = time.perf_counter()
+    langProcessor = LanguageProcessor(profile=profile)
+    loadTime = time.perf_counter() - loadStart
+    memoryLoaded = getMemoryUsage()
+
+    if profileDir:
+        # profile of the corpus run, not of loading the model
+        with RequestProfiler(profileDir, 'pipelineProfile-' + profile):
+            outputs, latencies = _analyzeCorpus(langProcessor, texts)
+    else:
+        outputs, latencies = _analyzeCorpus(langProcessor, texts)
+
+    connection.send({
+        'loadSeconds': loadTime,
+        'rssBeforeLoad': memoryBefore['rss'],
+        'rssLoaded': memoryLoaded['rss'],
+        'rssAfterRun': getMemoryUsage()['rss'],
+        'latencies': latencies,
+        'outputs': outputs,
+    })
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Reports throughput, resident memory and output differences against the full profile for each NLP pipeline profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('corpus', help="Directory of .txt documents to analyze.")
+        parser.add_argument('--profiles', nargs='+', default=list(PIPELINE_PROFILES.keys()),
+                            help="Profiles to report, see NLP/pipelineProfiles.py.")
+        parser.add_argument('--output', help="Optional path of a json file to write the report to.")
+        parser.add_argument('--profile', action='store_true',
+                            help="Save a cProfile and collapsed-stack profile of each run in settings.NLP_PROFILE_DIR.")
+
+    def _readCorpus(self, corpusDir):
+        texts = []
+        for path in sorted(glob.glob(os.path.join(corpusDir, '*.txt'))):
+            with open(path) as file:
+                texts.append(file.read())
+        if not texts:
+            raise CommandError("No .txt documents found in " + corpusDir)
+        return texts
+
+    def _diffOutputs(self, outputs, referenceOutputs, key):
+        '''Returns counts of items missing from and added to outputs compared with referenceOutputs, summed over documents.'''
+        missing = 0
+        added = 0
+        for output, reference in zip(outputs, referenceOutputs):
+            items = set(map(tuple, output[key]))
+            referenceItems = set(map(tuple, reference[key]))
+            missing += len(referenceItems - items)
+            added += len(items - referenceItems)
+        return {'missing': missing, 'added': added}
+
+    def handle(self, *args, **options):
+        for profile in options['profiles']:
+            if profile not in PIPELINE_PROFILES:
+                raise CommandError("Unknown profile: " + profile)
+
+        texts = self._readCorpus(options['corpus'])
+        totalChars = sum(len(text) for text in texts)
+        print("Corpus:", len(texts), "documents,", totalChars, "characters")
+
+        # the full profile is the reference for output differences
+        profiles = ['full'] + [profile for profile in options['profiles'] if profile != 'full']
+        context = multiprocessing.get_context('fork')
+        runs = dict()
+
+        for profile in profiles:
+            print("Running profile", profile)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_runProfile, args=(
+                profile, texts, sender, settings.NLP_PROFILE_DIR if options['profile'] else None))
+            process.start()
+            runs[profile] = receiver.recv()
+            process.join()
+
+        report = dict()
+        for profile in profiles:
+            run = runs[profile]
+            totalSeconds = sum(run['latencies'])
+            latencies = sorted(run['latencies'])
+            report[profile] = {
+                'loadSeconds': round(run['loadSeconds'], 2),
+                'docsPerSecond': round(len(texts) / totalSeconds, 2),
+                'charsPerSecond': round(totalChars / totalSeconds),
+                'p50LatencyMs': round(latencies[len(latencies) // 2] * 1000, 1),
+                'maxLatencyMs': round(latencies[-1] * 1000, 1),
+                'modelRssMB': round((run['rssLoaded'] - run['rssBeforeLoad']) / 2**20, 1),
+                'peakRssMB': round(max(run['rssLoaded'], run['rssAfterRun']) / 2**20, 1),
+                'diffFromFull': {key: self._diffOutputs(run['outputs'], runs['full']['outputs'], key)
+                                 for key in ('entities', 'sentences', 'sections')},
+            }
+
+        print(json.dumps(report, indent=2))
+
+        if options['output']:
+            with open(options['output'], mode='w') as file:
+                json.dump(report, file, indent=2)
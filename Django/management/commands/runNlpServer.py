@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from NLP.inferenceServer import InferenceServer
+from NLP.inferenceProtocol import MAX_MESSAGE_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Runs the NLP inference server that UploadDoc forwards documents to when settings.NLP_INFERENCE_SERVER is set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default=settings.NLP_INFERENCE_SERVER or 'unix:/tmp/autocoder-nlp.sock',
+                            help="'unix:/path/to/socket' or 'host:port' to listen on, defaults to settings.NLP_INFERENCE_SERVER.")
+        parser.add_argument('--max-batch-size', type=int, default=16,
+                            help="Maximum number of documents analyzed together in one nlp.pipe() batch.")
+        parser.add_argument('--max-wait-ms', type=float, default=5,
+                            help="Maximum time in milliseconds a document waits for others to fill its batch.")
+        parser.add_argument('--max-message-bytes', type=int, default=MAX_MESSAGE_SIZE,
+                            help="Maximum size of a request, larger requests get an error reply and their connection is closed.")
+
+    def handle(self, *args, **options):
+        from NLP.languageProcessor import LanguageProcessor
+
+        server = InferenceServer(LanguageProcessor(), options['address'],
+                                 maxBatchSize=options['max_batch_size'], maxWait=options['max_wait_ms'] / 1000,
+                                 maxMessageSize=options['max_message_bytes'])
+
+        print("NLP inference server listening on", options['address'])
+        server.serveForever()
@@ -52,6 +52,8 @@ INSTALLED_APPS = [
     'corsheaders',
     'oauth2_provider',
     'annotations',
+    'jobs',
+    'documents',
     'Django',
     'ICD'
 ]
@@ -150,3 +152,54 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
+
+# Precompiled NLP knowledge assets, built with 'python manage.py compileNlpBundle'
+NLP_KNOWLEDGE_BUNDLE = os.environ.get('DJANGO_NLP_KNOWLEDGE_BUNDLE', 'NLP/knowledge.bundle')
+
+# Spacy pipeline profile of the NLP module: 'full', 'lean' or 'tokens-only', see NLP/pipelineProfiles.py
+NLP_PIPELINE_PROFILE = os.environ.get('DJANGO_NLP_PIPELINE_PROFILE', 'full')
+
+# NLP module switches, manage.py overrides these from its command line options
+ENABLE_NLP = True
+ENABLE_SECTIONIZER = True
+ENABLE_TOKENIZER = True
+ENABLE_SENTENCIZER = True
+ENABLE_ENTITYMATCHER = True
+ENABLE_PHRASENORMALIZER = True
+
+# Build the LanguageProcessor in the WSGI master process before workers are forked (eg: gunicorn --preload),
+# so workers share its memory pages copy-on-write instead of loading their own copy
+NLP_PREFORK = os.environ.get('DJANGO_NLP_PREFORK', 'false').lower() == 'true'
+
+# Optional path of a .npy file to memory-map the word vectors from, shared between processes through the page cache
+NLP_VECTORS_MMAP = os.environ.get('DJANGO_NLP_VECTORS_MMAP')
+
+# Address of the NLP inference server ('unix:/path/to/socket' or 'host:port'), see runNlpServer command.
+# When set, UploadDoc forwards documents to the server instead of loading its own LanguageProcessor
+NLP_INFERENCE_SERVER = os.environ.get('DJANGO_NLP_INFERENCE_SERVER')
+
+# Number of background threads processing asynchronous analysis jobs (uploadDoc/?async=true)
+NLP_JOB_WORKERS = int(os.environ.get('DJANGO_NLP_JOB_WORKERS', '2'))
+
+# Seconds after which a job still pending or running is reported failed, jobs in the worker threads are lost when a process restarts
+NLP_JOB_TIMEOUT = int(os.environ.get('DJANGO_NLP_JOB_TIMEOUT', '3600'))
+
+# Comma separated host names that analysis job callback urls may point to, callbacks are refused when empty
+NLP_JOB_CALLBACK_HOSTS = [host for host in os.environ.get('DJANGO_NLP_JOB_CALLBACK_HOSTS', '').split(',') if host]
+
+# Size in bytes of the in-process cache of uploadDoc results, and optional directory of a persistent cache shared by all processes
+NLP_RESULT_CACHE_BYTES = int(os.environ.get('DJANGO_NLP_RESULT_CACHE_BYTES', str(64 * 2**20)))
+NLP_RESULT_CACHE_DIR = os.environ.get('DJANGO_NLP_RESULT_CACHE_DIR')
+
+# Maximum number of keyword and ICD matches kept in the LanguageProcessor's memo of recently analyzed sections
+NLP_SECTION_MEMO_SIZE = int(os.environ.get('DJANGO_NLP_SECTION_MEMO_SIZE', '100000'))
+
+# Save the parsed document of each uploadDoc in the database, so reanalyzeDoc only re-runs the parameter dependent stages
+# Off by default, saved snapshots are only deleted by the pruneSnapshots command
+NLP_STORE_SNAPSHOTS = os.environ.get('DJANGO_NLP_STORE_SNAPSHOTS', 'false').lower() == 'true'
+
+# Days after which pruneSnapshots deletes saved snapshots
+NLP_SNAPSHOT_MAX_AGE_DAYS = int(os.environ.get('DJANGO_NLP_SNAPSHOT_MAX_AGE_DAYS', '30'))
+
+# Directory where profiles of uploadDoc/?profile=true requests and --profile runs of NLP commands are saved
+NLP_PROFILE_DIR = os.environ.get('DJANGO_NLP_PROFILE_DIR', 'profiles')
@@ -7,10 +7,22 @@ For more information on this file, see
 https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 """
 
+import gc
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Django.settings')
 
 application = get_wsgi_application()
+
+if settings.NLP_PREFORK and settings.ENABLE_NLP:
+    # Importing the views builds UploadDoc.langProcessor in this (master) process. When the server forks its workers
+    # after loading the application, they share the processor's pages copy-on-write.
+    import api.views
+
+    # Move everything allocated so far out of the garbage collector's reach, otherwise collections in the workers
+    # write to the objects' headers and copy the shared pages.
+    gc.collect()
+    gc.freeze()
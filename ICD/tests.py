@@ -1,3 +1,217 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+from NLP.icdKeywordMatcher import IcdKeywordMatcher
+from NLP.entityPostProcessor import EntityPostProcessor, ChainWindow
+from NLP.matcherPatterns import Labels
+from NLP.spanRecord import SpanRecord, toDicts
+from benchmarks.icdKeywordMatcher import LegacyIcdKeywordMatcher
+import csv
+import itertools
+import os
+import random
+import shutil
+import tempfile
 
-# Create your tests here.
+# (icd_code, seq_id, level, phrase) rows of a small ICD index
+FIXTURE_INDEX = [
+    # level 1 only
+    ('A00', '1', 1, 'cholera'),
+    # three levels, with two phrases on level 2
+    ('I46.8', '2', 1, 'arrest'),
+    ('I46.8', '2', 2, 'cardiac'),
+    ('I46.8', '2', 2, 'heart'),
+    ('I46.8', '2', 3, 'sudden'),
+    # level 2 missing, the search ends at the missing level
+    ('B34.9', '3', 1, 'infection'),
+    ('B34.9', '3', 3, 'viral'),
+    # the same level 1 term in two sequences
+    ('I10', '4', 1, 'hypertension'),
+    ('I15.9', '5', 1, 'hypertension'),
+    ('I15.9', '5', 2, 'secondary'),
+]
+
+
+def writeIndex(path, rows):
+    '''Writes rows in the csv layout read by IcdKeywordMatcher.createSearchAssetFromCSV().'''
+    with open(path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['index', 'icd_code', 'seq_id', 'level', 'phrase', 'parent', 'level_final'])
+        for i, (code, seq_id, level, phrase) in enumerate(rows):
+            writer.writerow([i, code, seq_id, level, phrase, '', level])
+
+
+def makeTokens(*texts):
+    '''Returns keyword match dictionaries of texts, one position apart.'''
+    return [{'start': i * 10, 'end': i * 10 + len(text), 'text': text} for i, text in enumerate(texts)]
+
+
+class IcdKeywordMatcherTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        indexPath = os.path.join(cls.directory, 'icd_index.csv')
+        writeIndex(indexPath, FIXTURE_INDEX)
+        cls.matcher = IcdKeywordMatcher(indexPath)
+        cls.legacyMatcher = LegacyIcdKeywordMatcher(indexPath)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def assertSameAsLegacy(self, tokens):
+        self.assertEqual(self.matcher.getICDforTokens(tokens), self.legacyMatcher.getICDforTokens(tokens))
+
+    def test_levelOneOnly(self):
+        tokens = makeTokens('patient', 'cholera')
+        self.assertEqual(self.matcher.getICDforTokens(tokens), [('A00', [tokens[1]])])
+        self.assertSameAsLegacy(tokens)
+
+    def test_multiLevel(self):
+        tokens = makeTokens('sudden', 'cardiac', 'arrest')
+        self.assertEqual(self.matcher.getICDforTokens(tokens), [('I46.8', [tokens[2], tokens[1], tokens[0]])])
+        self.assertSameAsLegacy(tokens)
+
+    def test_multiLevelIncomplete(self):
+        tokens = makeTokens('cardiac', 'arrest')
+        self.assertEqual(self.matcher.getICDforTokens(tokens), [])
+        self.assertSameAsLegacy(tokens)
+
+    def test_missingMiddleLevel(self):
+        # levels after a missing level are not searched, the level 1 term alone gives the code
+        tokens = makeTokens('viral', 'infection')
+        self.assertEqual(self.matcher.getICDforTokens(tokens), [('B34.9', [tokens[1]])])
+        self.assertSameAsLegacy(tokens)
+
+    def test_duplicateTerm(self):
+        tokens = makeTokens('hypertension', 'secondary', 'hypertension')
+        self.assertEqual(self.matcher.getICDforTokens(tokens), [
+            ('I10', [tokens[0]]),
+            ('I15.9', [tokens[0], tokens[1]]),
+            ('I10', [tokens[2]]),
+            ('I15.9', [tokens[2], tokens[1]]),
+        ])
+        self.assertSameAsLegacy(tokens)
+
+    def test_triggerPosition(self):
+        # the trigger of a level is the first token matching any of its phrases, wherever the level 1 token is
+        tokens = makeTokens('cardiac', 'sudden', 'heart', 'arrest', 'cardiac', 'sudden')
+        codes = self.matcher.getICDforTokens(tokens)
+        self.assertEqual(codes, [('I46.8', [tokens[3], tokens[0], tokens[1]])])
+        self.assertIs(codes[0][1][1], tokens[0])
+        self.assertSameAsLegacy(tokens)
+
+        tokens = makeTokens('heart', 'arrest', 'cardiac', 'sudden')
+        self.assertIs(self.matcher.getICDforTokens(tokens)[0][1][1], tokens[0])
+        self.assertSameAsLegacy(tokens)
+
+    def test_stringTokens(self):
+        self.assertEqual(self.matcher.getICDforTokens(['sudden', 'heart', 'arrest']), [('I46.8', ['arrest', 'heart', 'sudden'])])
+
+    def test_sameAsLegacyOnAllSequences(self):
+        terms = ['cholera', 'arrest', 'cardiac', 'heart', 'sudden', 'infection', 'viral', 'hypertension', 'secondary', 'other']
+        for length in range(1, 4):
+            for texts in itertools.product(terms, repeat=length):
+                self.assertSameAsLegacy(makeTokens(*texts))
+
+    def test_annotationChain(self):
+        tokens = makeTokens('sudden', 'cardiac', 'arrest')
+        records = [SpanRecord(token['start'], token['end'], text=token['text']) for token in tokens]
+        annotations = self.matcher.getIcdAnnotations(records, False)
+
+        self.assertEqual([(annotation.start, annotation.tag, annotation.type) for annotation in annotations],
+                         [(0, 'I46.8', Labels.ICD_KEYWORD_LABEL), (10, 'I46.8', Labels.ICD_KEYWORD_LABEL),
+                          (20, 'I46.8', Labels.ICD_KEYWORD_LABEL)])
+        self.assertIs(annotations[0].next, annotations[1])
+        self.assertIs(annotations[1].next, annotations[2])
+        self.assertIsNone(annotations[2].next)
+
+
+class ChainWindowTest(SimpleTestCase):
+    '''Document scope ICD matching with a ChainWindow must give the entities of EntityPostProcessor.processICD() without it.'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        indexPath = os.path.join(cls.directory, 'icd_index.csv')
+        writeIndex(indexPath, FIXTURE_INDEX)
+        cls.matcher = IcdKeywordMatcher(indexPath)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def analyze(self, texts, sentences, sections, maxSentDist, sectionsIgnored, useWindow):
+        '''Returns the post-processed entities of keyword matches of texts, each 10 characters apart, as dictionaries.'''
+        keywordMatches = [SpanRecord(i * 10, i * 10 + 5, text=text, type=Labels.ICD_KEYWORD_LABEL) for i, text in enumerate(texts)]
+        window = ChainWindow(sections, sentences, maxSentDist, sectionsIgnored) if useWindow else None
+        icdEntities = self.matcher.getIcdAnnotations(keywordMatches, False, window=window)
+        return toDicts(EntityPostProcessor(sections, sentences, icdEntities, Labels.ICD_KEYWORD_LABEL).processICD(
+            True, maxSentDist, sectionsIgnored))
+
+    def assertSameWithWindow(self, texts, sentences, sections, maxSentDist, sectionsIgnored):
+        entities = self.analyze(texts, sentences, sections, maxSentDist, sectionsIgnored, False)
+        self.assertEqual(self.analyze(texts, sentences, sections, maxSentDist, sectionsIgnored, True), entities)
+        return entities
+
+    def test_ignoredSectionInMiddleOfChain(self):
+        # arrest, cardiac and sudden in three sentences, cardiac in an ignored section: sudden becomes a head of its own
+        texts = ['arrest', 'cardiac', 'sudden']
+        sentences = [{'start': 0, 'end': 10, 'tag': ''}, {'start': 10, 'end': 20, 'tag': ''}, {'start': 20, 'end': 30, 'tag': ''}]
+        sections = [{'start': 0, 'end': 10, 'tag': 'hpi'}, {'start': 10, 'end': 20, 'tag': 'fam_hist'}, {'start': 20, 'end': 30, 'tag': 'plan'}]
+
+        for maxSentDist in (0, 1, 2):
+            self.assertSameWithWindow(texts, sentences, sections, maxSentDist, ['fam_hist'])
+
+        self.assertEqual([entity['start'] for entity in self.assertSameWithWindow(texts, sentences, sections, 0, ['fam_hist'])], [20])
+
+    def test_partsWithoutSentence(self):
+        # parts outside of every sentence count as sentence 0
+        texts = ['sudden', 'cardiac', 'arrest', 'cholera']
+        sentences = [{'start': 10, 'end': 20, 'tag': ''}, {'start': 30, 'end': 40, 'tag': ''}]
+
+        # sudden and arrest count as in the sentence of cardiac
+        self.assertEqual([entity['tag'] for entity in self.assertSameWithWindow(texts, sentences, [], 0, [])], ['I46.8'] * 3 + ['A00'])
+
+        for maxSentDist in (0, 1, 2):
+            self.assertSameWithWindow(texts, sentences, [], maxSentDist, [])
+            self.assertSameWithWindow(texts, sentences, [{'start': 0, 'end': 40, 'tag': 'fam_hist'}], maxSentDist, ['fam_hist'])
+
+    def test_maxSentDistZero(self):
+        texts = ['hypertension', 'secondary', 'sudden', 'heart', 'arrest']
+        oneSentence = [{'start': 0, 'end': 50, 'tag': ''}]
+        sentencePerPart = [{'start': i * 10, 'end': i * 10 + 10, 'tag': ''} for i in range(5)]
+
+        # I15.9 and I46.8, I10 is nested in I15.9
+        self.assertEqual(len(self.assertSameWithWindow(texts, oneSentence, [], 0, [])), 5)
+        # only the single part codes are within one sentence
+        self.assertEqual([entity['tag'] for entity in self.assertSameWithWindow(texts, sentencePerPart, [], 0, [])], ['I10'])
+
+    def test_randomLayouts(self):
+        rng = random.Random(0)
+        terms = ['cholera', 'arrest', 'cardiac', 'heart', 'sudden', 'infection', 'viral', 'hypertension', 'secondary']
+
+        for _ in range(300):
+            texts = [rng.choice(terms) for _ in range(rng.randint(1, 8))]
+            end = len(texts) * 10
+
+            # sentences with gaps, so that some parts have no sentence
+            sentences = []
+            position = 0
+            while position < end:
+                length = rng.randint(5, 30)
+                if rng.random() < 0.8:
+                    sentences.append({'start': position, 'end': position + length, 'tag': ''})
+                position += length
+
+            sections = []
+            position = 0
+            while position < end:
+                length = rng.randint(10, 40)
+                sections.append({'start': position, 'end': position + length, 'tag': rng.choice(['hpi', 'fam_hist', 'plan'])})
+                position += length
+
+            self.assertSameWithWindow(texts, sentences, sections, rng.randint(0, 3), rng.choice([[], ['fam_hist'], ['fam_hist', 'plan']]))
@@ -0,0 +1,85 @@
+'''
+Columnar format of tokens, sentences and sections in analysis results, requested with the columnar keyword argument of
+LanguageProcessor.analyzeText(). Instead of one dictionary per annotation, a result is a dictionary of parallel lists:
+- starts, ends: character positions of the annotations.
+- tags: tags of the annotations, for sentences and sections.
+- headerTexts: header texts of sections, with outputDetail.
+With the deltaEncoding keyword argument, 'encoding' is 'delta', each start is relative to the previous start (the first to 0)
+and each end is relative to its start, which keeps the numbers small in json.
+'''
+import numpy
+from spacy.attrs import LENGTH, SPACY, SENT_START
+
+# additional columns, and the keys of their values in annotation dictionaries
+ANNOTATION_KEYS = {'tags': 'tag', 'headerTexts': 'header_text'}
+
+
+def getTokenOffsets(doc):
+    '''
+    Returns numpy arrays of the start and end character positions of the tokens of doc, computed from the token lengths
+    and trailing whitespace in doc.to_array(), without creating Token objects.
+    '''
+    if len(doc) == 0:
+        return (numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64))
+
+    lengthsAndSpaces = doc.to_array([LENGTH, SPACY]).astype(numpy.int64)
+    lengths = lengthsAndSpaces[:, 0]
+    spaces = lengthsAndSpaces[:, 1]
+
+    ends = numpy.cumsum(lengths + spaces) - spaces
+    return (ends - lengths, ends)
+
+
+def getSentenceTokenStarts(doc):
+    '''Returns a numpy array of the index of the first token of each sentence of doc, from the sentence starts set by Sentencizer.'''
+    if len(doc) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    sentStarts = doc.to_array(SENT_START).astype(numpy.int64)
+    sentStarts[0] = 1
+    return numpy.flatnonzero(sentStarts == 1)
+
+
+def makeColumns(starts, ends, deltaEncoding=False, **columns):
+    '''Returns the columnar result of numpy arrays of starts and ends, and additional columns given as lists.'''
+    if deltaEncoding:
+        result = {
+            'encoding': 'delta',
+            'starts': numpy.diff(starts, prepend=0).tolist(),
+            'ends': (ends - starts).tolist(),
+        }
+    else:
+        result = {'starts': starts.tolist(), 'ends': ends.tolist()}
+
+    result.update(columns)
+    return result
+
+
+def toColumns(annotations, deltaEncoding=False, **kwargs):
+    '''Returns the columnar result of a list of annotation dictionaries, e.g. the output of Sectionizer.getSections().'''
+    starts = numpy.array([annotation['start'] for annotation in annotations], dtype=numpy.int64)
+    ends = numpy.array([annotation['end'] for annotation in annotations], dtype=numpy.int64)
+    columns = {'tags': [annotation['tag'] for annotation in annotations]}
+
+    if kwargs.get('outputDetail') and annotations and 'header_text' in annotations[0]:
+        columns['headerTexts'] = [annotation['header_text'] for annotation in annotations]
+
+    return makeColumns(starts, ends, deltaEncoding, **columns)
+
+
+def fromColumns(columns):
+    '''Reverse of makeColumns(), returns a list of annotation dictionaries, with the singular keys of the additional columns.'''
+    starts = numpy.array(columns['starts'], dtype=numpy.int64)
+    ends = numpy.array(columns['ends'], dtype=numpy.int64)
+
+    if columns.get('encoding') == 'delta':
+        starts = numpy.cumsum(starts)
+        ends = starts + ends
+
+    annotations = [{'start': start, 'end': end} for start, end in zip(starts.tolist(), ends.tolist())]
+
+    for column, key in ANNOTATION_KEYS.items():
+        for annotation, value in zip(annotations, columns.get(column, [])):
+            annotation[key] = value
+
+    return annotations
@@ -3,3 +3,5 @@ sentencizer = "debugSentencizer"
 tokenizer = "debugTokenizer"
 entityMatchers = "debugEntityMatchers"
 phraseNormalizer = "debugPhraseNormalizer"
+sectionMemo = "debugSectionMemo"
+timings = "debugTimings"
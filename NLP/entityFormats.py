@@ -0,0 +1,140 @@
+'''
+Formats of the links between the entities of a multi-part ICD match, in analysis results and saved annotations:
+- nested: each entity's 'next' is the next entity of the chain itself, as returned by LanguageProcessor.
+  Rendered as json, every chain is copied again at each of its entities.
+- linked: each entity has an 'id', and its 'next' is the id of the next entity of the chain.
+'''
+
+NESTED = 'nested'
+LINKED = 'linked'
+ENTITY_FORMATS = (NESTED, LINKED)
+
+
+def _getEntityKey(entity):
+    return (entity.get('start'), entity.get('end'), entity.get('type'), entity.get('tag'))
+
+
+def _getChainKey(entity, chainKeys):
+    '''
+    Returns the keys of entity and of all following entities of its chain, which tells apart parts of different chains with the same
+    span and code. chainKeys caches the result by object, the nested entities of a chain are shared by the entities before them.
+    '''
+    chain = []
+    cursor = entity
+    while type(cursor) == dict and id(cursor) not in chainKeys:
+        chain.append(cursor)
+        cursor = cursor.get('next')
+
+    chainKey = chainKeys.get(id(cursor), ())
+    for chainEntity in reversed(chain):
+        chainKey = (_getEntityKey(chainEntity),) + chainKey
+        chainKeys[id(chainEntity)] = chainKey
+
+    return chainKeys[id(entity)]
+
+
+def toLinkedEntities(entities):
+    '''
+    Given nested entities, returns copies in the linked format, with ids that are their indices in the returned list.
+    The next entity of a chain is found in the list by identity, or else by the start, end, type and tag of it and of the rest of
+    its chain, since nested entities parsed from json are copies of those in the list. Next entities that are not in the list are
+    appended to it.
+    '''
+    sourceEntities = list(entities)
+    idsByObject = dict()
+    idsByKey = dict()
+    chainKeys = dict()
+
+    for i, entity in enumerate(sourceEntities):
+        idsByObject[id(entity)] = i
+        idsByKey.setdefault(_getChainKey(entity, chainKeys), i)
+
+    linkedEntities = []
+    i = 0
+    while i < len(sourceEntities):
+        linkedEntity = dict(sourceEntities[i])
+        linkedEntity['id'] = i
+        nextEntity = linkedEntity.get('next')
+
+        if type(nextEntity) == dict:
+            nextId = idsByObject.get(id(nextEntity))
+            if nextId is None:
+                nextId = idsByKey.get(_getChainKey(nextEntity, chainKeys))
+            if nextId is None:
+                nextId = len(sourceEntities)
+                sourceEntities.append(nextEntity)
+                idsByObject[id(nextEntity)] = nextId
+                idsByKey[_getChainKey(nextEntity, chainKeys)] = nextId
+            linkedEntity['next'] = nextId
+
+        linkedEntities.append(linkedEntity)
+        i += 1
+
+    return linkedEntities
+
+
+def validateLinkedEntities(entities):
+    '''
+    Raises ValueError unless entities are valid in the linked format: every entity has a unique integer id, every 'next' is the id
+    of an entity of the list, and no chain leads back to one of its own entities.
+    '''
+    if type(entities) != list:
+        raise ValueError("Entities must be a list.")
+
+    nextIds = dict()
+    for i, entity in enumerate(entities):
+        if type(entity) != dict:
+            raise ValueError("Entity %d is not an object." % i)
+        entityId = entity.get('id')
+        if type(entityId) != int:
+            raise ValueError("Entity %d has no integer id." % i)
+        if entityId in nextIds:
+            raise ValueError("Duplicate entity id %d." % entityId)
+        nextIds[entityId] = entity.get('next')
+
+    for entityId, nextId in nextIds.items():
+        if nextId is not None and (type(nextId) != int or nextId not in nextIds):
+            raise ValueError("Next of entity %d is not the id of an entity: %r." % (entityId, nextId))
+
+    # follow each chain until it ends or reaches an entity already known to be on a chain that ends
+    checkedIds = set()
+    for entityId in nextIds:
+        chainIds = set()
+        cursor = entityId
+        while cursor is not None and cursor not in checkedIds:
+            if cursor in chainIds:
+                raise ValueError("Circular chain of entities at id %d." % cursor)
+            chainIds.add(cursor)
+            cursor = nextIds[cursor]
+        checkedIds.update(chainIds)
+
+
+def toNestedEntities(entities):
+    '''Reverse of toLinkedEntities(), returns copies of linked entities without ids, where 'next' is the next entity itself.'''
+    nestedEntities = []
+    entitiesById = dict()
+
+    for entity in entities:
+        nestedEntity = dict(entity)
+        if 'id' in nestedEntity:
+            entitiesById[nestedEntity.pop('id')] = nestedEntity
+        nestedEntities.append(nestedEntity)
+
+    for nestedEntity in nestedEntities:
+        if 'next' in nestedEntity and type(nestedEntity['next']) != dict:
+            nextEntity = entitiesById.get(nestedEntity['next'])
+            if nextEntity is None:
+                del nestedEntity['next']
+            else:
+                nestedEntity['next'] = nextEntity
+
+    return nestedEntities
+
+
+def convertEntities(entities, fromFormat, toFormat):
+    '''Returns entities converted from one format to the other, or unchanged if both are the same.'''
+    if fromFormat == toFormat:
+        return entities
+    if toFormat == LINKED:
+        return toLinkedEntities(entities)
+    return toNestedEntities(entities)
@@ -1,12 +1,14 @@
 from spacy.matcher import Matcher, PhraseMatcher
+from spacy.tokens import Doc
 from NLP.matcherPatterns import Labels, negation_forward_patterns, negation_backward_patterns, negation_bidirection_patterns, closure_patterns
+from NLP.spanRecord import SpanRecord
 import csv
 from Utility.progress import printProgressBar
 
 
 class EntityMatchers:
 
-    def __init__(self, nlp, icdKeywordPhrases, **kwargs):
+    def __init__(self, nlp, icdKeywordPhrases, bundle=None, **kwargs):
         print("Initializing EntityMatchers...")
         self.negationMatcher = Matcher(nlp.vocab)
         self.closureMatcher = Matcher(nlp.vocab)
@@ -15,18 +17,27 @@ class EntityMatchers:
         # self._addNegationPatternFromFile()
         self._buildMatchers()
         #  self._loadIcdKeywordFromFile(nlp, filePath)
-        self._loadIcdKeywordPhrases(nlp, icdKeywordPhrases)
+        if bundle:
+            self._loadIcdKeywordPatterns(nlp, bundle['icdKeywordPatterns'])
+        else:
+            self._loadIcdKeywordPhrases(nlp, icdKeywordPhrases)
 
     def _loadIcdKeywordPhrases(self, nlp, icdKeywordPhrases):
         '''Given a list of phrases, create PhraseMatcher patterns'''
         patterns = []
         total = len(icdKeywordPhrases)
-        for i, phrase in enumerate(icdKeywordPhrases):
-            patterns.append(nlp(phrase))
+        # PhraseMatcher only compares token texts, the phrases need tokenizing but not the rest of the pipeline
+        for i, pattern in enumerate(nlp.tokenizer.pipe(icdKeywordPhrases)):
+            patterns.append(pattern)
             printProgressBar(i+1, total, prefix='Loading keyword phrases:', suffix='Complete', length=5)
 
         self.icdKwMatcher.add(Labels.ICD_KEYWORD_LABEL, None, *patterns)
 
+    def _loadIcdKeywordPatterns(self, nlp, icdKeywordPatterns):
+        '''Given a list of pre-tokenized phrases from a knowledge bundle (list of words per phrase), create PhraseMatcher patterns'''
+        patterns = [Doc(nlp.vocab, words=words) for words in icdKeywordPatterns]
+        self.icdKwMatcher.add(Labels.ICD_KEYWORD_LABEL, None, *patterns)
+
     def _loadIcdKeywordFromFile(self, nlp, IcdKeywordFile):
         '''Function for loading Icd keyword phrases from file, and create PhraseMatcher patterns'''
         with open(IcdKeywordFile, mode='r') as file:
@@ -170,7 +181,9 @@ class EntityMatchers:
         return annotMatches
 
     def getIcdKeywordMatches(self, doc, normalizedPhrases, offset=0, **kwargs):
-        '''Get list of ICD keyword matches from document. Parameter offset is used to produce correct overall characrer positions when this method is used to process exerpts of the document in parts.'''
+        '''
+        Get list of ICD keyword matches from document, as SpanRecords. Parameter offset is used to produce correct overall characrer positions when this method is used to process exerpts of the document in parts.
+        '''
         spacyMatches = self.icdKwMatcher(doc)
 
         outputMatches = []
@@ -182,8 +195,7 @@ class EntityMatchers:
             annotate_end_char = end_token.idx + len(end_token)
             text = doc.text[annotate_start_char:annotate_end_char]
 
-            outputMatches.append({"start": annotate_start_char + offset, "end": annotate_end_char +
-                                  offset, "text": text, "type": Labels.ICD_KEYWORD_LABEL})
+            outputMatches.append(SpanRecord(annotate_start_char + offset, annotate_end_char + offset, text=text, type=Labels.ICD_KEYWORD_LABEL))
 
         if normalizedPhrases:  # normalizedPhrases is not None, combine outputMatches with normalizedPhrases
 
@@ -193,31 +205,33 @@ class EntityMatchers:
 
     def combineReplaceNormalizedPhrases(self, normPhrases, phrases):
         '''
-        Given list of normalized phrases and keyword matched phrases, combine into one list.
+        Given list of normalized phrases and keyword matched phrases (SpanRecords), combine into one list.
         This method makes sure the combined output list has unique spans from both normPhrases and phrases. 
-        Any span from normPhrases will have both the 'normalizedTo' and 'text' keys.
+        Any span from normPhrases will have both the 'normalizedTo' and 'text' attributes.
         '''
 
+        # first normalized phrase for each (start, end) span, and the set of spans of the keyword phrases
+        normPhraseBySpan = dict()
+        for normPhrase in normPhrases:
+            normPhraseBySpan.setdefault((normPhrase.start, normPhrase.end), normPhrase)
+        phraseSpans = set((phrase.start, phrase.end) for phrase in phrases)
+
         combinedOutput = []
 
         for phrase in phrases:
 
-             # look for text span from the list of normPhrases, with identical start and end character positions
-            sameSpan = next((x for x in normPhrases if x['start'] ==
-                             phrase['start'] and x['end'] == phrase['end']), None)
+            # look for normalized phrase with identical start and end character positions
+            sameSpan = normPhraseBySpan.get((phrase.start, phrase.end))
 
-            if sameSpan:  # add key to the phrase, copy value from normPhrase with same span
-                phrase['normalizedTo'] = sameSpan['normalizedTo']
+            if sameSpan:  # copy value from normPhrase with same span to the phrase
+                phrase.normalizedTo = sameSpan.normalizedTo
 
             combinedOutput.append(phrase)
 
         for normPhrase in normPhrases:
-             # look for text span from the list of phrases, with identical start and end character positions
-            sameSpan = next((x for x in phrases if x['start'] ==
-                             normPhrase['start'] and x['end'] == normPhrase['end']), None)
 
-            if sameSpan is None:
-                normPhrase['type'] = Labels.ICD_KEYWORD_LABEL
+            if not (normPhrase.start, normPhrase.end) in phraseSpans:
+                normPhrase.type = Labels.ICD_KEYWORD_LABEL
                 combinedOutput.append(normPhrase)
 
         return combinedOutput
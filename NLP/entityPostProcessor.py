@@ -1,24 +1,20 @@
-from intervaltree import Interval, IntervalTree
+from NLP.spanIndex import SpanIndex
+from collections import defaultdict
 
 
 class EntityPostProcessor:
     '''
     Pipeline for post-processing of matched entities. Must instantiate when a client thread connects to ensure data independence between clients.
     Main purpose of this class is to clean up redundant entity match results, such as nested ICD code results, assign sentence distance rules, negate results, etc.
+    Entities are SpanRecords, sections and sentences are annotation dictionaries.
     '''
 
     def __init__(self, sections, sentences, entities, entityType):
         self.sentences = sentences
         self.sections = sections
-        self.sentenceIntervalTree = IntervalTree()
-        self.sectionIntervalTree = IntervalTree()
-        self.entities = [i for i in entities if i['type'] == entityType]
-
-        for sent in sentences:
-            self.sentenceIntervalTree[sent['start']:sent['end']] = sent
-
-        for section in sections:
-            self.sectionIntervalTree[section['start']:section['end']] = section
+        self.sentenceIndex = SpanIndex(sentences)
+        self.sectionIndex = SpanIndex(sections)
+        self.entities = [i for i in entities if i.type == entityType]
 
     def processICD(self, removeNested, maxSentDist, sectionsIgnored, **kwargs):
         '''Pre-defined post process specific for ICD entity types, returns list of entities for annotations.'''
@@ -38,42 +34,25 @@ class EntityPostProcessor:
         output = []
 
         for entity in inputEntities:
-            intervals = self.sectionIntervalTree[entity['start']:entity['end']]
+            section = self.sectionIndex.getSpan(entity.start, entity.end)
 
-            if not intervals:  # entity not part of any section intervals
+            if section is None:  # entity not part of any section
                 output.append(entity)
-                continue
 
-            for interval in intervals:  # get first item from set
-                section = interval.data
-
-                if not section['tag'] in sectionsIgnored:
-                    output.append(entity)
-                break
+            elif not section['tag'] in sectionsIgnored:
+                output.append(entity)
 
         return output
 
     def buildHeadItemsList(self, inputEntities,):
         '''
-        Build a list of linked-list style of annotations, where each item is a dictionary with an attribute 'next' which points to the next linked item.
+        Build a list of linked-list style of annotations, where each item has an attribute 'next' which points to the next linked item.
         This method is required due to LanguageProcessor currently produces flat lists of annotations.
         '''
-        output = []
-
-        for i, entity in enumerate(inputEntities):
-            isHead = True
-
-            # loop through the list to see if another entity has 'next' attribute pointing at the cursor
-            for j, cursor in enumerate(inputEntities):
-                if i == j:
-                    continue
-                if 'next' in cursor and cursor['next'] == entity:
-                    isHead = False
-
-            if isHead:
-                output.append(entity)
+        # ids of the entities that another entity's 'next' attribute is pointing at
+        linkedIds = set(id(entity.next) for entity in inputEntities if entity.next is not None)
 
-        return output
+        return [entity for entity in inputEntities if id(entity) not in linkedIds]
 
     def filterBySentenceDistance(self, headEntities, maxSentDist):
         '''Add sentence index number to each of the entity tokens and remove ones beyond the maxSentDist threshold.'''
@@ -86,8 +65,8 @@ class EntityPostProcessor:
             cursor = entity
             sentenceIndices.append(self._addSentenceIndex(cursor))
 
-            while 'next' in cursor:
-                cursor = cursor['next']
+            while cursor.next is not None:
+                cursor = cursor.next
                 sentenceIndices.append(self._addSentenceIndex(cursor))
 
             if max(sentenceIndices) - min(sentenceIndices) <= maxSentDist:
@@ -98,72 +77,65 @@ class EntityPostProcessor:
     def filterNestedItems(self, headEntities):
         '''
         Filter the head entities list to produce list with nested items removed.
+        An item is nested if an item before it in the list sorted by link depth has a span set that is a proper superset of its span set.
         '''
 
         sortedHeadEntities = sorted(headEntities, key=lambda item: self._getLinkDepth(item), reverse=True)
-        removalIndices = set()
-        for i, item in enumerate(sortedHeadEntities):
-            compareIndex = i + 1
+        spanSets = [self._getSpanSet(item) for item in sortedHeadEntities]
 
-            while compareIndex < len(sortedHeadEntities):
+        # index of span to the positions of the items containing the span, in ascending order
+        spanIndex = defaultdict(list)
+        for i, spans in enumerate(spanSets):
+            for span in spans:
+                spanIndex[span].append(i)
 
-                nestStatus = self._checkNested(item, sortedHeadEntities[compareIndex])
+        output = []
+        for i, spans in enumerate(spanSets):
+            # only items sharing every span can be a superset, so the shortest list of items containing one of the spans is enough to compare against
+            candidates = min((spanIndex[span] for span in spans), key=len)
+            isNested = False
 
-                if nestStatus > 0:
-                    removalIndices.add(compareIndex)
+            for candidate in candidates:
+                if candidate >= i:
+                    break
+                if spanSets[candidate] > spans:
+                    isNested = True
+                    break
 
-                compareIndex += 1
+            if not isNested:
+                output.append(sortedHeadEntities[i])
 
-        return [item for i, item in enumerate(sortedHeadEntities) if i not in removalIndices]
+        return output
 
     def _addSentenceIndex(self, entity):
         '''Given an entity, appends sentence index as an attribute. Returns the sentence index.'''
-        intervals = self.sentenceIntervalTree[entity['start']:entity['end']]
-        if intervals:
-            interval = list(self.sentenceIntervalTree[entity['start']:entity['end']])[0]  # get first item from set
-            sentenceIndex = self.sentences.index(interval.data)
-            entity['sent-idx'] = sentenceIndex
+        sentenceIndex = self.sentenceIndex.getOrdinal(entity.start, entity.end)
+        if sentenceIndex is not None:
+            entity.sentIdx = sentenceIndex
             return sentenceIndex
         return 0
 
     def _getLinkDepth(self, head):
         cursor = head
         i = 1
-        while 'next' in cursor:
+        while cursor.next is not None:
             i += 1
-            cursor = cursor['next']
+            cursor = cursor.next
         return i
 
     def _getSpanTuple(self, annot):
-        return (annot['start'], annot['end'])
-
-    def _checkNested(self, headA, headB):
-        '''
-            Given the heads of two linked set of annotations. Compare the spans of the two sets,
-            return 1 if the first set is larger and overlaps all of the second set;
-            return -1 if the second set is larger and overlaps all of the first set;
-            return 0 otherwise (including when the two sets have equal spans).
-        '''
-
-        spansA = [self._getSpanTuple(headA)]
-        spansB = [self._getSpanTuple(headB)]
+        return (annot.start, annot.end)
 
-        cursor = headA
-        while 'next' in cursor:
-            spansA.append(self._getSpanTuple(cursor['next']))
-            cursor = cursor['next']
+    def _getSpanSet(self, head):
+        '''Given the head of a linked set of annotations, returns the set of (start, end) spans of all annotations in the set.'''
+        spans = {self._getSpanTuple(head)}
 
-        cursor = headB
-        while 'next' in cursor:
-            spansB.append(self._getSpanTuple(cursor['next']))
-            cursor = cursor['next']
+        cursor = head
+        while cursor.next is not None:
+            cursor = cursor.next
+            spans.add(self._getSpanTuple(cursor))
 
-        if set(spansA) > set(spansB):
-            return 1
-        elif set(spansA) < set(spansB):
-            return -1
-        else:
-            return 0
+        return spans
 
     def _getFlatList(self, listOfLinkedLists):
         '''Iterate through the list of linked-lists, and create a list that contains every single item from every linked-list.'''
@@ -172,8 +144,61 @@ class EntityPostProcessor:
         for head in listOfLinkedLists:
             flatList.append(head)
             cursor = head
-            while 'next' in cursor:
-                cursor = cursor['next']
+            while cursor.next is not None:
+                cursor = cursor.next
                 flatList.append(cursor)
 
         return flatList
+
+
+class ChainWindow:
+    '''
+    Tells ahead of matching whether a multi-part entity would be removed by EntityPostProcessor.processICD(), so that IcdKeywordMatcher
+    does not build it. Follows the same rules: parts in ignored sections are removed, each remaining part after a removed one (or first)
+    is a head, and a head is kept if the parts from it to the end of the chain are at most maxSentDist sentences apart.
+    '''
+
+    def __init__(self, sections, sentences, maxSentDist, sectionsIgnored):
+        self.sectionIndex = SpanIndex(sections)
+        self.sentenceIndex = SpanIndex(sentences)
+        self.maxSentDist = maxSentDist
+        self.sectionsIgnored = set(sectionsIgnored)
+
+    def getPositions(self, parts):
+        '''Returns a (start, sentence index, in ignored section) tuple for each part, with the sentence index of EntityPostProcessor.'''
+        positions = []
+
+        for part in parts:
+            sentenceIndex = self.sentenceIndex.getOrdinal(part.start, part.end)
+            if self.sectionsIgnored:
+                section = self.sectionIndex.getSpan(part.start, part.end)
+                ignored = section is not None and section['tag'] in self.sectionsIgnored
+            else:
+                ignored = False
+            positions.append((part.start, 0 if sentenceIndex is None else sentenceIndex, ignored))
+
+        return positions
+
+    def isRemoved(self, chainPositions):
+        '''
+        Given the positions (see getPositions()) of the parts of a multi-part entity, in the order given to IcdKeywordMatcher's sort by start,
+        returns True if post-processing would remove all of them.
+        '''
+        if not self.sectionsIgnored:
+            # the first part is the only head
+            sentenceIndices = [sentenceIndex for _, sentenceIndex, _ in chainPositions]
+            return max(sentenceIndices) - min(sentenceIndices) > self.maxSentDist
+
+        chainPositions = sorted(chainPositions, key=lambda position: position[0])
+        minIndex = maxIndex = chainPositions[-1][1]
+
+        for i in range(len(chainPositions) - 1, -1, -1):
+            _, sentenceIndex, ignored = chainPositions[i]
+            minIndex = min(minIndex, sentenceIndex)
+            maxIndex = max(maxIndex, sentenceIndex)
+            isHead = not ignored and (i == 0 or chainPositions[i - 1][2])
+
+            if isHead and maxIndex - minIndex <= self.maxSentDist:
+                return False
+
+        return True
@@ -1,15 +1,21 @@
 from NLP.matcherPatterns import Labels
+from NLP.spanRecord import SpanRecord
 from collections import defaultdict
 import csv
-import copy
 
 
 class IcdKeywordMatcher:
 
-    def __init__(self, icdIndexFilePath):
+    def __init__(self, icdIndexFilePath, bundle=None):
         print("Initializing IcdKeywordMatcher...")
-        self.keywordPhrases = None
-        self.searchAsset = self.createSearchAssetFromCSV(icdIndexFilePath)
+        if bundle:
+            self.keywordPhrases = bundle['icdKeywordPhrases']
+            self.searchAsset = bundle['icdSearchAsset']
+        else:
+            self.keywordPhrases = None
+            self.searchAsset = self.createSearchAssetFromCSV(icdIndexFilePath)
+
+        self.levelIndex = self._compileLevelIndex(self.searchAsset)
 
     def createSearchAssetFromCSV(self, path):
         '''
@@ -55,29 +61,50 @@ class IcdKeywordMatcher:
 
         return knowledgeDictionaries
 
+    def _compileLevelIndex(self, searchAsset):
+        '''
+        Compile the level 2+ dictionaries of searchAsset into one lookup of phrase sets per seq_id, eg: {seq_id: [{level 2 phrases}, {level 3 phrases}, ...]}.
+        Levels of a seq_id are listed up to its first missing level, as the search for a seq_id ends there.
+        '''
+        levelIndex = dict()
+
+        for seq_ids in searchAsset[1].values():
+            for seq_id in seq_ids:
+                if seq_id in levelIndex:
+                    continue
+
+                levelPhrases = []
+                level = 2
+                while level < len(searchAsset) and seq_id in searchAsset[level]:
+                    levelPhrases.append(frozenset(searchAsset[level][seq_id]))
+                    level += 1
+
+                levelIndex[seq_id] = levelPhrases
+
+        return levelIndex
+
     def _handleNormalizedPhrases(self, keywordMatches):
+        '''Adds a copy of each normalized keyword match, searched by its normalized form.'''
 
         output = []
 
         for kw in keywordMatches:
 
-            if 'text' in kw:
+            if kw.text is not None:
                 output.append(kw)
 
-            if 'normalizedTo' in kw:
-                newKw = copy.deepcopy(kw)
-                newKw['originText'] = newKw['text']
-                newKw['text'] = newKw['normalizedTo']
-                output.append(newKw)
+            if kw.normalizedTo is not None:
+                output.append(kw.copy(originText=kw.text, text=kw.normalizedTo))
 
         return output
 
-    def getIcdAnnotations(self, keywordMatches, phraseNorm, **kwargs):
+    def getIcdAnnotations(self, keywordMatches, phraseNorm, window=None, **kwargs):
         '''
         Given a list of icd keyword matches found in a document that denotes positions of keywords within the string,
-        Returns a list of annotations.
+        Returns a list of annotations, as SpanRecords.
         Params:
-            - keywordMatches: a list of dictionaries describing position of tokens, dictionaries must have the key 'text' as required by self.getICDforTokens().
+            - keywordMatches: a list of SpanRecords describing position of tokens, with the attribute 'text' as required by self.getICDforTokens().
+            - window: optional ChainWindow, see self.getICDforTokens().
         kwargs: additional kwargs are added to the output dictionary as key-value pairs
         '''
 
@@ -86,12 +113,12 @@ class IcdKeywordMatcher:
 
         outputDetail = kwargs.get('outputDetail')
 
-        icdCodeTuples = self.getICDforTokens(keywordMatches)
+        icdCodeTuples = self.getICDforTokens(keywordMatches, window)
         ''' 
         list of tuples in the form such as the following
         [('I46.8',
-          [{'start': 279, 'end': 285, 'text': 'arrest', 'type': 'ICD Codes'},
-           {'start': 2850, 'end': 2857, 'text': 'cardiac', 'type': 'ICD Codes'}])
+          [SpanRecord({'start': 279, 'end': 285, 'type': 'ICD Codes', 'text': 'arrest'}),
+           SpanRecord({'start': 2850, 'end': 2857, 'type': 'ICD Codes', 'text': 'cardiac'})])
            ...
         ]
         '''
@@ -103,39 +130,37 @@ class IcdKeywordMatcher:
 
         for icdLabel, meta in icdCodeTuples:
 
-            meta.sort(key=lambda x: x['start'], reverse=False)
+            meta.sort(key=lambda x: x.start, reverse=False)
 
             if outputDetail:
-                textTokens = map(lambda x: x['text'], meta)
+                textTokens = map(lambda x: x.text, meta)
                 textString = ', '.join(textTokens)
 
             for i, annotation in enumerate(meta):
 
-                annot = {"start": annotation['start'],
-                         "end": annotation['end'],
-                         "tag": icdLabel,
-                         "type": Labels.ICD_KEYWORD_LABEL,
-                         }
+                annot = SpanRecord(annotation.start, annotation.end, tag=icdLabel, type=Labels.ICD_KEYWORD_LABEL)
 
                 if outputDetail:
-                    annot['text'] = annotation['text']
+                    annot.text = annotation.text
 
                     if i == 0:  # putting the 'triggers' key only on the head annotation
-                        annot['triggers'] = textString
+                        annot.triggers = textString
 
                 if i > 0:
 
-                    prevAnnot['next'] = annot
+                    prevAnnot.next = annot
 
                 prevAnnot = annot
                 annotations.append(annot)
 
         return annotations
 
-    def getICDforTokens(self, searchTokens):
+    def getICDforTokens(self, searchTokens, window=None):
         '''
         Params:
-        - a list of search tokens, such as words from a single sentence. This could be a string, or a dictionary containing the key 'text' that maps to a string.
+        - a list of search tokens, such as words from a single sentence. This could be a string, a SpanRecord, or a dictionary containing the key 'text' that maps to a string.
+        - window: optional ChainWindow of the document of SpanRecord search tokens, codes whose tokens would all be removed by
+          EntityPostProcessor for being too many sentences apart are left out. Trigger tokens are found in the whole list as without it.
         Returns:
         - a list of tuples, where the first element of the tuple is an icd code and the second element is a list of tokens that triggered the icd code.
         '''
@@ -143,37 +168,51 @@ class IcdKeywordMatcher:
         if len(searchTokens) < 1:
             return
 
-        valid_seq_tuples = []
+        searchTerms = []
 
         for searchToken in searchTokens:
+            searchTerm = self._getSearchTerm(searchToken)
 
-            # If searchToken is a string, it is the search term,
-            # otherwise if a dictionary is passed, it should have a key 'text'/'normalizedTo' that maps to the search term (str)
-            if type(searchToken) == str:
-                searchTerm = searchToken
-
-            elif type(searchToken) == dict and 'text' in searchToken:
-                searchTerm = searchToken['text']
-
-            else:
+            if searchTerm is None:
                 print("Unknown search token data format.")
                 return
 
+            searchTerms.append(searchTerm)
+
+        # position of the first search token of each term, level 2+ trigger tokens are the first matching tokens in the list
+        firstPositions = dict()
+        for i, searchTerm in enumerate(searchTerms):
+            if searchTerm not in firstPositions:
+                firstPositions[searchTerm] = i
+
+        # level 2+ trigger tokens do not depend on the level 1 token, so they are searched once per seq_id
+        levelTriggers = dict()
+        valid_seq_tuples = []
+
+        if window is not None:
+            tokenPositions = window.getPositions(searchTokens)
+
+        for i, (searchToken, searchTerm) in enumerate(zip(searchTokens, searchTerms)):
+
             # search level 1 keywords
-            if searchTerm in self.searchAsset[1]:
+            seq_ids = self.searchAsset[1].get(searchTerm)
 
-                seq_ids = self.searchAsset[1][searchTerm]
+            if not seq_ids:
+                continue
 
-                # for each level 1 match of seq_id
-                for seq_id in seq_ids:
+            # for each level 1 match of seq_id
+            for seq_id in seq_ids:
 
-                    level = 2
-                    matched_terms = self._recursiveLevelSearch(searchTokens, seq_id, level)
+                if seq_id not in levelTriggers:
+                    levelTriggers[seq_id] = self._findLevelTriggers(firstPositions, seq_id)
 
-                    if 'FINAL_LEVEL_REACHED' in matched_terms:
-                        matched_terms.insert(0, searchToken)
-                        matched_terms.remove('FINAL_LEVEL_REACHED')
-                        valid_seq_tuples.append((seq_id, matched_terms))
+                if levelTriggers[seq_id] is None:
+                    continue
+
+                if window is not None and window.isRemoved([tokenPositions[j] for j in (i, *levelTriggers[seq_id])]):
+                    continue
+
+                valid_seq_tuples.append((seq_id, [searchToken, *(searchTokens[j] for j in levelTriggers[seq_id])]))
 
         icd_codes = []
 
@@ -185,49 +224,55 @@ class IcdKeywordMatcher:
 
         return icd_codes
 
-    def _recursiveLevelSearch(self, searchTokens, seq_id, level):
+    def _getSearchTerm(self, searchToken):
+        '''
+        If searchToken is a string, it is the search term,
+        otherwise if a SpanRecord or dictionary is passed, its 'text' is the search term (str).
+        Returns None for unknown formats.
         '''
-        Helper functions that recursively checks deeper levels* of a sequence_id for matching keywords.
+        if type(searchToken) == SpanRecord and searchToken.text is not None:
+            return searchToken.text
+
+        elif type(searchToken) == str:
+            return searchToken
+
+        elif type(searchToken) == dict and 'text' in searchToken:
+            return searchToken['text']
+
+        return None
+
+    def _findLevelTriggers(self, firstPositions, seq_id):
+        '''
+        Helper function that checks level 2 and beyond of a seq_id for matching keywords.
         Params:
-        - searchTokens: a list of search tokens as input.
+        - firstPositions: dictionary of search term to position of its first search token, in order of position.
         - seq_id: seq_id to be checked against.
-        - level: the level to start checking on.
         Returns:
-        - 
-        * This method is for level 2 and beyond, as searchAsset level 0 & 1 dictionaries have different data structures.
+        - list of positions of trigger tokens, one for each level of the seq_id, or None if any level has no matching token.
         '''
+        triggerPositions = []
 
-        # there is no deeper level for the sequence id, return True
-        if not(seq_id in self.searchAsset[level]):
-            #         print("No furthur level for seq_id, returning True.")
-            return ["FINAL_LEVEL_REACHED"]
-        else:
-            current_level_phrases = self.searchAsset[level][seq_id]
+        for levelPhrases in self.levelIndex.get(seq_id, []):
+            triggerPosition = self._findTriggerPosition(firstPositions, levelPhrases)
+
+            if triggerPosition is None:
+                return None
 
-            trigger_token = self._findTriggerTokenFromLevelPhrases(searchTokens, current_level_phrases)
+            triggerPositions.append(triggerPosition)
 
-            if trigger_token:
-                #             print(f"Going to next level, level {level + 1}")
-                return [trigger_token, *self._recursiveLevelSearch(searchTokens, seq_id, level + 1)]
-            else:
-                #             print(f"Did not find matching keyword for level {level}, returning False.")
-                return ["FINAL_LEVEL_NOT_REACHED"]
+        return triggerPositions
 
-    def _findTriggerTokenFromLevelPhrases(self, searchTokens, levelPhrases):
+    def _findTriggerPosition(self, firstPositions, levelPhrases):
         '''
-        Helper function that looks for a trigger token from a list of searchTokens, by comparing with a list of levelPhrases.
-        Returns the trigger token if found, otherwise None.
-        The searchTokens can be a list of strings, or dictionary with a key 'text' that contains a string.
+        Helper function that returns the position of the first search token with a term in the set of levelPhrases, None if not found.
+        Iterates over whichever of the two is smaller.
         '''
+        if len(levelPhrases) < len(firstPositions):
+            positions = [firstPositions[phrase] for phrase in levelPhrases if phrase in firstPositions]
+            return min(positions) if positions else None
 
-        for token in searchTokens:
-
-            if type(token) == str:
-                searchTerm = token
-            elif type(token) == dict and 'text' in token:
-                searchTerm = token['text']
-
+        for searchTerm, position in firstPositions.items():  # in order of position
             if searchTerm in levelPhrases:
-                return token
+                return position
 
         return None
@@ -0,0 +1,84 @@
+from NLP.inferenceProtocol import parseAddress, sendMessage, receiveMessage, decodeResults
+from NLP.instrumentation import metrics
+import socket
+
+
+class InferenceError(Exception):
+    pass
+
+
+class InferenceClient:
+    '''
+    Client of InferenceServer with the same analyzeText() and analyzeTexts() interface as LanguageProcessor,
+    so it can stand in for a LanguageProcessor that runs in a separate process.
+    '''
+
+    def __init__(self, address, timeout=120):
+        self.family, self.socketAddress = parseAddress(address)
+        self.timeout = timeout
+        # pipeline version of the server, None until asked again
+        self._pipelineVersion = None
+
+    def _send(self, message):
+        try:
+            with socket.socket(self.family, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socketAddress)
+                sendMessage(sock, message)
+                response = receiveMessage(sock, maxSize=None)  # results of large batches may be bigger than any request
+        except OSError:
+            # the server may be restarting, possibly with other knowledge
+            self._pipelineVersion = None
+            raise
+
+        if response is None:
+            self._pipelineVersion = None
+            raise InferenceError("Connection closed by NLP inference server.")
+        if 'error' in response:
+            raise InferenceError(response['error'])
+
+        return response
+
+    def _request(self, texts, params):
+        response = self._send({'op': 'analyze', 'texts': texts, 'params': params})
+        # a server restarted with other knowledge answers with its new version
+        self._pipelineVersion = response.get('pipelineVersion', self._pipelineVersion)
+        resultsList = [decodeResults(results) for results in response['results']]
+
+        # analysis is timed by the server, record it in this process's metrics too
+        for text, results in zip(texts, resultsList):
+            metrics.observeDocument(len(text), len(results['entities']), results['stats']['timings'])
+
+        return resultsList
+
+    @property
+    def pipelineVersion(self):
+        '''
+        See LanguageProcessor.pipelineVersion. Asked from the server once, then updated from the version in each analysis response,
+        and asked again after a connection error, since the server may have been restarted with other knowledge.
+        '''
+        if self._pipelineVersion is None:
+            self._pipelineVersion = self._send({'op': 'version'})['pipelineVersion']
+        return self._pipelineVersion
+
+    def analyzeText(self, text, **kwargs):
+        '''See LanguageProcessor.analyzeText(), parameters must be passed as keyword arguments.'''
+        return self._request([text], kwargs)[0]
+
+    def analyzeTexts(self, texts, batch_size=50, n_process=1, as_tuples=False, **kwargs):
+        '''See LanguageProcessor.analyzeTexts(), texts are sent in requests of batch_size texts, n_process is decided by the server.'''
+        batch = []
+        for item in texts:
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield from self._requestBatch(batch, as_tuples, kwargs)
+                batch = []
+
+        if batch:
+            yield from self._requestBatch(batch, as_tuples, kwargs)
+
+    def _requestBatch(self, batch, as_tuples, params):
+        if as_tuples:
+            texts, contexts = zip(*batch)
+            return zip(self._request(list(texts), params), contexts)
+        return self._request(batch, params)
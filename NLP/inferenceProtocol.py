@@ -0,0 +1,74 @@
+from NLP.entityFormats import toLinkedEntities, toNestedEntities
+import json
+import socket
+import struct
+
+# Messages between InferenceClient and InferenceServer are UTF-8 encoded json, prefixed with their length as a 4-byte big-endian integer.
+HEADER = struct.Struct('>I')
+# default upper bound of the size of a received message, the length prefix is not trusted beyond it
+MAX_MESSAGE_SIZE = 64 << 20
+
+
+class MessageTooLarge(ValueError):
+    '''Raised by receiveMessage() for a message larger than its maxSize, the message is left unread on the socket.'''
+
+
+def parseAddress(address):
+    '''
+    Given an address string, returns a tuple of (socket family, socket address).
+    'unix:/path/to/socket' is a Unix domain socket, 'host:port' is a TCP address.
+    '''
+    if address.startswith('unix:'):
+        return (socket.AF_UNIX, address[len('unix:'):])
+
+    host, port = address.rsplit(':', 1)
+    return (socket.AF_INET, (host, int(port)))
+
+
+def sendMessage(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _receiveExactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def receiveMessage(sock, maxSize=MAX_MESSAGE_SIZE):
+    '''
+    Returns the next message from the socket, None if the connection was closed.
+    Raises MessageTooLarge before reading a message of more than maxSize bytes, or of any size if maxSize is None.
+    '''
+    header = _receiveExactly(sock, HEADER.size)
+    if header is None:
+        return None
+
+    size = HEADER.unpack(header)[0]
+    if maxSize is not None and size > maxSize:
+        raise MessageTooLarge("Message of %d bytes is larger than the maximum of %d bytes." % (size, maxSize))
+
+    data = _receiveExactly(sock, size)
+    if data is None:
+        return None
+
+    return json.loads(data.decode('utf-8'))
+
+
+def encodeResults(results):
+    '''
+    Prepare analyzeText() results for sending as json. Linked entities reference the same dictionary objects,
+    which json would copy at every link, so entities are sent in the linked format of NLP/entityFormats.py.
+    '''
+    return {**results, 'entities': toLinkedEntities(results['entities'])}
+
+
+def decodeResults(results):
+    '''Reverse of encodeResults(), entities are returned in the nested format of analyzeText().'''
+    return {**results, 'entities': toNestedEntities(results['entities'])}
@@ -0,0 +1,178 @@
+from NLP.inferenceProtocol import MAX_MESSAGE_SIZE, MessageTooLarge, parseAddress, sendMessage, receiveMessage, encodeResults
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+
+class _PendingText:
+    '''A text waiting in the batch queue, with the analysis parameters of its request.'''
+
+    def __init__(self, text, params):
+        self.text = text
+        self.params = params
+        self.paramsKey = json.dumps(params, sort_keys=True)
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    '''
+    Collects texts from concurrent requests into batches for LanguageProcessor.analyzeTexts().
+    A batch is processed once it has maxBatchSize texts, or maxWait seconds after its first text arrived.
+    All analysis runs on the batcher's single thread, so the LanguageProcessor is never used concurrently.
+    '''
+
+    def __init__(self, langProcessor, maxBatchSize, maxWait):
+        self.langProcessor = langProcessor
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def analyze(self, texts, params):
+        '''Called from request threads, blocks until all texts are analyzed and returns their results in order.'''
+        pendingTexts = [_PendingText(text, params) for text in texts]
+
+        for pendingText in pendingTexts:
+            self.queue.put(pendingText)
+
+        for pendingText in pendingTexts:
+            pendingText.done.wait()
+            if pendingText.error:
+                raise RuntimeError(pendingText.error)
+
+        return [pendingText.result for pendingText in pendingTexts]
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.maxWait
+
+            while len(batch) < self.maxBatchSize:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self._processBatch(batch)
+
+    def _processBatch(self, batch):
+        # texts with the same parameters are analyzed together in one nlp.pipe() batch
+        groups = dict()
+        for pendingText in batch:
+            groups.setdefault(pendingText.paramsKey, []).append(pendingText)
+
+        for group in groups.values():
+            try:
+                results = self.langProcessor.analyzeTexts(
+                    [pendingText.text for pendingText in group], batch_size=len(group), **group[0].params)
+
+                for pendingText, result in zip(group, results):
+                    pendingText.result = encodeResults(result)
+
+            except Exception as e:
+                for pendingText in group:
+                    pendingText.error = "%s: %s" % (type(e).__name__, e)
+
+            for pendingText in group:
+                pendingText.done.set()
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    '''Serves the messages of one client connection until it is closed.'''
+
+    def handle(self):
+        while True:
+            try:
+                message = receiveMessage(self.request, self.server.maxMessageSize)
+            except MessageTooLarge as e:
+                # the message is not read, so the rest of the stream cannot be parsed
+                sendMessage(self.request, {'error': "Invalid message: %s" % e})
+                return
+            except ValueError as e:
+                # the whole message was read, so the connection can go on
+                sendMessage(self.request, {'error': "Invalid message: %s" % e})
+                continue
+
+            if message is None:
+                return
+
+            try:
+                response = self._respond(message)
+            except RuntimeError as e:
+                # analysis errors, formatted by MicroBatcher._processBatch()
+                response = {'error': str(e)}
+            except Exception as e:
+                response = {'error': "%s: %s" % (type(e).__name__, e)}
+
+            sendMessage(self.request, response)
+
+    def _respond(self, message):
+        if type(message) != dict:
+            raise ValueError("Message must be a json object.")
+
+        if message.get('op') == 'analyze':
+            texts = message.get('texts')
+            params = message.get('params', {})
+            if type(texts) != list or not all(type(text) == str for text in texts):
+                raise ValueError("texts must be a list of strings.")
+            if type(params) != dict:
+                raise ValueError("params must be a json object.")
+
+            results = self.server.batcher.analyze(texts, params)
+            return {'results': results, 'pipelineVersion': self.server.batcher.langProcessor.pipelineVersion}
+        elif message.get('op') == 'version':
+            return {'pipelineVersion': self.server.batcher.langProcessor.pipelineVersion}
+        else:
+            raise ValueError("Unknown operation: %s" % message.get('op'))
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # the default listen backlog of 5 refuses bursts of concurrent connections on Unix sockets
+    request_queue_size = 128
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class InferenceServer:
+    '''
+    Standalone NLP service that owns a LanguageProcessor and serves InferenceClient requests on a local Unix socket or TCP port.
+    Texts of requests arriving within maxWait seconds of each other are analyzed together in batches of up to maxBatchSize.
+    Connections sending a message of more than maxMessageSize bytes get an error reply and are closed.
+    '''
+
+    def __init__(self, langProcessor, address, maxBatchSize=16, maxWait=0.005, maxMessageSize=MAX_MESSAGE_SIZE):
+        family, socketAddress = parseAddress(address)
+
+        if family == socket.AF_UNIX:
+            if os.path.exists(socketAddress):
+                os.remove(socketAddress)
+            self.server = _ThreadingUnixServer(socketAddress, _RequestHandler)
+        else:
+            self.server = _ThreadingTCPServer(socketAddress, _RequestHandler)
+
+        self.server.batcher = MicroBatcher(langProcessor, maxBatchSize, maxWait)
+        self.server.maxMessageSize = maxMessageSize
+
+    def serveForever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+
+    def shutdown(self):
+        self.server.shutdown()
@@ -0,0 +1,110 @@
+from bisect import bisect_left
+from time import perf_counter
+import threading
+
+# histogram bucket upper bounds
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CHARS_BUCKETS = (500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+ENTITIES_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class StageTimings:
+    '''
+    Accumulates durations of the pipeline stages of one document, in seconds by stage name.
+    Usage:
+        with timings.stage('sectionizer'):
+            ...
+    '''
+
+    def __init__(self):
+        self.durations = dict()
+
+    def stage(self, name):
+        return _StageTimer(self.durations, name)
+
+
+class _StageTimer:
+    __slots__ = ('durations', 'name', 'start')
+
+    def __init__(self, durations, name):
+        self.durations = durations
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        self.durations[self.name] = self.durations.get(self.name, 0) + perf_counter() - self.start
+
+
+class Histogram:
+    '''Thread-safe cumulative histogram, optionally split by the value of one label, rendered in Prometheus text format.'''
+
+    def __init__(self, name, description, buckets, labelName=None):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labelName = labelName
+        self.series = dict()  # label value: [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, label=None):
+        with self.lock:
+            series = self.series.get(label)
+            if series is None:
+                series = self.series[label] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s histogram" % self.name]
+
+        with self.lock:
+            series = {label: list(values) for label, values in self.series.items()}
+
+        for label, values in sorted(series.items(), key=lambda item: str(item[0])):
+            labelPrefix = '%s="%s",' % (self.labelName, label) if self.labelName else ''
+            labels = '{%s}' % labelPrefix.rstrip(',') if labelPrefix else ''
+            count = 0
+
+            for bound, bucketCount in zip((*self.buckets, '+Inf'), values):
+                count += bucketCount
+                lines.append('%s_bucket{%sle="%s"} %d' % (self.name, labelPrefix, bound, count))
+
+            lines.append('%s_sum%s %s' % (self.name, labels, repr(float(values[-1]))))
+            lines.append('%s_count%s %d' % (self.name, labels, count))
+
+        return lines
+
+
+class NlpMetrics:
+    '''Process-wide distributions of document analysis latency, stage durations, document sizes and entity counts.'''
+
+    def __init__(self):
+        self.stageSeconds = Histogram('autocoder_nlp_stage_seconds', 'Duration of NLP pipeline stages per document.',
+                                      SECONDS_BUCKETS, labelName='stage')
+        self.documentSeconds = Histogram('autocoder_nlp_document_seconds', 'Total NLP analysis time per document.', SECONDS_BUCKETS)
+        self.documentChars = Histogram('autocoder_nlp_document_chars', 'Length of analyzed documents in characters.', CHARS_BUCKETS)
+        self.documentEntities = Histogram('autocoder_nlp_document_entities', 'Number of entities found per document.', ENTITIES_BUCKETS)
+
+    def observeDocument(self, chars, entities, timings):
+        '''
+        - chars: length of the document text.
+        - entities: number of entities in the results.
+        - timings: dictionary of stage durations in seconds, the 'total' stage is the latency of the document.
+        '''
+        self.documentChars.observe(chars)
+        self.documentEntities.observe(entities)
+
+        for stage, seconds in timings.items():
+            if stage == 'total':
+                self.documentSeconds.observe(seconds)
+            else:
+                self.stageSeconds.observe(seconds, stage)
+
+    def render(self):
+        '''Returns the metrics in Prometheus text exposition format, as a list of lines.'''
+        return [*self.documentSeconds.render(), *self.stageSeconds.render(), *self.documentChars.render(), *self.documentEntities.render()]
+
+
+metrics = NlpMetrics()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import pickle
+import spacy
+import tempfile
+from NLP.icdKeywordMatcher import IcdKeywordMatcher
+from NLP.phraseNormalizer import PhraseNormalizer
+from NLP.sectionizer import Sectionizer
+
+# Increment whenever the layout of the bundle contents changes, bundles of other versions are treated as stale.
+BUNDLE_VERSION = 3
+
+SPACY_MODEL = 'en_core_web_lg'
+
+SOURCE_FILES = {
+    'icdIndex': "NLP/icd_10_cm_index_clean.csv",
+    'normalizationTerms': "NLP/Normalization_terms.csv",
+    'umlsTerms': "NLP/UMLS_terms_normalized.csv",
+    'sections': "NLP/sections.csv",
+}
+
+
+def getSourceHashes(sourceFiles=SOURCE_FILES):
+    '''Returns a dictionary of sha256 content hashes of the knowledge source files, None for missing files.'''
+    hashes = dict()
+
+    for name, path in sourceFiles.items():
+        if not os.path.isfile(path):
+            hashes[name] = None
+            continue
+
+        sha = hashlib.sha256()
+        with open(path, mode='rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        hashes[name] = sha.hexdigest()
+
+    return hashes
+
+
+def _getModelSignature(nlp):
+    '''Pattern tokenization depends on the Spacy version and model, bundles built with a different one are stale.'''
+    return {
+        'spacy': spacy.__version__,
+        'model': nlp.meta.get('name'),
+        'modelVersion': nlp.meta.get('version'),
+    }
+
+
+def getKnowledgeVersion(nlp, sourceFiles=SOURCE_FILES):
+    '''Returns a hash of the bundle version, Spacy model and source file contents, it changes whenever a compiled bundle would become stale.'''
+    version = {
+        'version': BUNDLE_VERSION,
+        'modelSignature': _getModelSignature(nlp),
+        'sourceHashes': getSourceHashes(sourceFiles),
+    }
+    return hashlib.sha256(json.dumps(version, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _tokenizePhrases(nlp, phrases):
+    '''Tokenize phrases with the model's tokenizer, returns a list of words for each phrase.'''
+    return [[token.text for token in doc] for doc in nlp.tokenizer.pipe(phrases)]
+
+
+def compileBundle(nlp, bundlePath, sourceFiles=SOURCE_FILES):
+    '''
+    Build all knowledge assets from the source files and write them into one versioned bundle file.
+    nlp must be a freshly loaded model, the PhraseMatcher patterns are stored as words produced by its default tokenizer.
+    Returns the bundle contents.
+    '''
+    icdKwMatcher = IcdKeywordMatcher(sourceFiles['icdIndex'])
+    phraseNormalizer = PhraseNormalizer(nlp, sourceFiles['normalizationTerms'], sourceFiles['umlsTerms'])
+    sectionizer = Sectionizer(sourceFiles['sections'])
+
+    bundle = {
+        'version': BUNDLE_VERSION,
+        'modelSignature': _getModelSignature(nlp),
+        'sourceHashes': getSourceHashes(sourceFiles),
+        'icdSearchAsset': icdKwMatcher.searchAsset,
+        'icdKeywordPhrases': icdKwMatcher.keywordPhrases,
+        'icdKeywordPatterns': _tokenizePhrases(nlp, icdKwMatcher.keywordPhrases),
+        'normalizationDict': phraseNormalizer.normalizationDict,
+        'normalizationPatterns': _tokenizePhrases(nlp, phraseNormalizer.normalizationDict.keys()),
+        'sectionsRegex': sectionizer.sectionsRegex,
+        'sections': sectionizer.sections,
+    }
+
+    # a unique temporary file, concurrent builds of the same bundle each replace it atomically
+    fd, tempPath = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(bundlePath) + '.', dir=os.path.dirname(os.path.abspath(bundlePath)))
+    try:
+        with os.fdopen(fd, mode='wb') as file:
+            pickle.dump(bundle, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tempPath, bundlePath)
+    except BaseException:
+        os.remove(tempPath)
+        raise
+
+    return bundle
+
+
+def loadBundle(nlp, bundlePath, sourceFiles=SOURCE_FILES):
+    '''
+    Load a knowledge bundle written by compileBundle().
+    Returns None if the bundle does not exist, or is stale: built with another bundle version, Spacy model, or source file contents.
+    '''
+    if not os.path.isfile(bundlePath):
+        print("Knowledge bundle not found at", bundlePath)
+        return None
+
+    with open(bundlePath, mode='rb') as file:
+        bundle = pickle.load(file)
+
+    if bundle.get('version') != BUNDLE_VERSION:
+        print("Knowledge bundle is stale: bundle version", bundle.get('version'), "expected", BUNDLE_VERSION)
+        return None
+
+    if bundle.get('modelSignature') != _getModelSignature(nlp):
+        print("Knowledge bundle is stale: built with a different Spacy model.")
+        return None
+
+    if bundle.get('sourceHashes') != getSourceHashes(sourceFiles):
+        print("Knowledge bundle is stale: source files have changed.")
+        return None
+
+    return bundle
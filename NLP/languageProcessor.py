@@ -1,42 +1,139 @@
 import spacy
+from spacy.tokens import Doc
+import numpy
+import os
+import json
+import tempfile
+import hashlib
 from NLP.entityMatchers import EntityMatchers
 from NLP.sectionizer import Sectionizer
 from NLP.sentencizer import Sentencizer
 from NLP.tokenizer import CustomTokenizer
 from NLP.icdKeywordMatcher import IcdKeywordMatcher
-from NLP.entityPostProcessor import EntityPostProcessor
+from NLP.entityPostProcessor import EntityPostProcessor, ChainWindow
 from NLP.matcherPatterns import Labels
 from NLP.phraseNormalizer import PhraseNormalizer
+from NLP.knowledgeBundle import loadBundle, getKnowledgeVersion, SOURCE_FILES, SPACY_MODEL
+from NLP.pipelineProfiles import getPipelineProfile
+from Utility.lruCache import LRUCache
+from NLP.instrumentation import StageTimings, metrics
+from NLP.columnarFormat import getTokenOffsets, toColumns
+from NLP.spanRecord import toDicts
+from time import perf_counter
 import spacy
 from django.conf import settings
 import NLP.debugSettings as debugFlags
 
+# version of the analysis code, part of the pipeline version: increment it with every change of the code that changes results,
+# so that results cached or snapshots saved by the previous code are not used
+RESULTS_VERSION = 1
+
 
 class LanguageProcessor:
-    def __init__(self):
+    def __init__(self, profile=None):
+        '''
+        - profile: name of the pipeline profile to load, see pipelineProfiles.py, defaults to settings.NLP_PIPELINE_PROFILE.
+        '''
         print("Initializing LanguageProcessor...")
-        self.nlp = spacy.load('en_core_web_lg')
+        self.profile = profile or settings.NLP_PIPELINE_PROFILE
+        pipelineProfile = getPipelineProfile(self.profile)
+
+        self.nlp = spacy.load(SPACY_MODEL, disable=pipelineProfile['disable'])
+        if not pipelineProfile['vectors']:
+            self.nlp.vocab.reset_vectors(width=0)
+        elif settings.NLP_VECTORS_MMAP:
+            self._mapVectors(settings.NLP_VECTORS_MMAP)
+
+        # precompiled knowledge assets, see compileNlpBundle command, falls back to building from source files if missing or stale
+        bundle = loadBundle(self.nlp, settings.NLP_KNOWLEDGE_BUNDLE)
+
         if settings.ENABLE_PHRASENORMALIZER:
             self.phraseNormalizer = PhraseNormalizer(
-                self.nlp, "NLP/Normalization_terms.csv", "NLP/UMLS_terms_normalized.csv")
+                self.nlp, SOURCE_FILES['normalizationTerms'], SOURCE_FILES['umlsTerms'], bundle=bundle)
 
         if settings.ENABLE_ENTITYMATCHER:
-            self.icdKwMatcher = IcdKeywordMatcher("NLP/icd_10_cm_index_clean.csv")
+            self.icdKwMatcher = IcdKeywordMatcher(SOURCE_FILES['icdIndex'], bundle=bundle)
 
         if settings.ENABLE_SECTIONIZER:
-            self.sectionizer = Sectionizer("NLP/sections.csv")
+            self.sectionizer = Sectionizer(SOURCE_FILES['sections'], bundle=bundle)
 
         if settings.ENABLE_ENTITYMATCHER:
-            self.entityMatcher = EntityMatchers(self.nlp, self.icdKwMatcher.keywordPhrases)
+            self.entityMatcher = EntityMatchers(self.nlp, self.icdKwMatcher.keywordPhrases, bundle=bundle)
 
         if settings.ENABLE_SENTENCIZER:
             self.sentencizer = Sentencizer(self.nlp)
 
         if settings.ENABLE_TOKENIZER:
             self.tokenizer = CustomTokenizer(self.nlp)
+
+        self.pipelineVersion = self._getPipelineVersion()
+
+        # keyword and ICD matches of recently seen sections, sections repeat verbatim across notes (copied forward lists, boilerplate)
+        # bounded by the total number of cached matches, empty results count as one
+        self.sectionMemo = LRUCache(settings.NLP_SECTION_MEMO_SIZE, sizeOf=lambda value: len(value[0]) + len(value[1]) + 1)
         print("LanguageProcessor ready.")
 
-    def analyzeText(self, text, scope='document', removeNested=True, maxSentDist=2, sectionsIgnored=[], phraseNorm=True, **kwargs):
+    def _getPipelineVersion(self):
+        '''
+        Returns a hash identifying everything other than the input and analysis parameters that results depend on:
+        the analysis code (RESULTS_VERSION), knowledge assets, Spacy model, pipeline profile and enabled components.
+        Used to key cached results.
+        '''
+        version = {
+            'results': RESULTS_VERSION,
+            'knowledge': getKnowledgeVersion(self.nlp),
+            'profile': self.profile,
+            'enabled': [settings.ENABLE_SECTIONIZER, settings.ENABLE_TOKENIZER, settings.ENABLE_SENTENCIZER,
+                        settings.ENABLE_ENTITYMATCHER, settings.ENABLE_PHRASENORMALIZER],
+        }
+        return hashlib.sha256(json.dumps(version, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _mapVectors(self, path):
+        '''
+        Replace the in-memory word vectors table with a read-only memory-mapped copy saved at path (.npy),
+        so that processes on the same machine share the pages of the table through the page cache.
+        The file is (re)written when missing, or when the model, vectors name, shape or dtype recorded in <path>.json
+        differ from those of the loaded model, e.g. after a model upgrade.
+        '''
+        vectors = self.nlp.vocab.vectors.data
+        metaPath = path + '.json'
+        meta = {
+            'model': '%s_%s' % (self.nlp.meta.get('lang'), self.nlp.meta.get('name')),
+            'modelVersion': self.nlp.meta.get('version'),
+            'vectors': self.nlp.vocab.vectors.name,
+            'shape': list(vectors.shape),
+            'dtype': str(vectors.dtype),
+        }
+
+        if os.path.isfile(path) and os.path.isfile(metaPath):
+            with open(metaPath) as file:
+                try:
+                    savedMeta = json.load(file)
+                except ValueError:
+                    savedMeta = None
+            if savedMeta == meta:
+                mappedVectors = numpy.load(path, mmap_mode='r')
+                if mappedVectors.shape == vectors.shape and mappedVectors.dtype == vectors.dtype:
+                    self.nlp.vocab.vectors.data = mappedVectors
+                    return
+
+        # written to unique temporary files in the same directory and moved in place, processes starting together may all write
+        self._replaceFile(path, '.npy', lambda file: numpy.save(file, vectors))
+        self._replaceFile(metaPath, '.json', lambda file: file.write(json.dumps(meta).encode('utf-8')))
+        self.nlp.vocab.vectors.data = numpy.load(path, mmap_mode='r')
+
+    def _replaceFile(self, path, suffix, write):
+        '''Atomically replace the file at path with the output of write(file), a function given a binary file.'''
+        fd, tempPath = tempfile.mkstemp(suffix=suffix, prefix=os.path.basename(path) + '.', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, mode='wb') as file:
+                write(file)
+            os.replace(tempPath, path)
+        except BaseException:
+            os.remove(tempPath)
+            raise
+
+    def analyzeText(self, text, scope='document', removeNested=True, maxSentDist=2, sectionsIgnored=[], phraseNorm=True, profile=None, snapshot=False, **kwargs):
         '''
         - scope can have three values:
             - 'document': Default, keyword matching searches in the scope of the whole document
@@ -46,39 +143,123 @@ class LanguageProcessor:
         - maxSentDist: default to 3, remove multi-part linked entities if the parts are more than 3 sentences apart.
         - sectionsIgnored: default to [], list of standardized sections tags to be ignored for icd entity recognition.
         - phraseNorm: phrase normalization flag default to True.
+        - profile: default to None, name of a pipeline profile to parse this text with, see pipelineProfiles.py.
+          A profile can only skip components loaded by the profile of the LanguageProcessor, not add any.
+        - snapshot: default to False, if True the parsed document is also returned in results['snapshot'], see snapshotDoc().
         - kwargs:
           - - debug (list), see debugSettings.py
           - - outputDetail (bool)
+          - - columnar (bool), if True sections, sentences and tokens are returned in the columnar format, see columnarFormat.py
+          - - deltaEncoding (bool), delta-encode the positions of the columnar format
         '''
-        doc = self.nlp(text)
+        timings = StageTimings()
+        with timings.stage('parse'):
+            doc = self.nlp(text, disable=self._getDisabledPipes(profile))
+
+        results = self._analyzeDoc(doc, scope, removeNested, maxSentDist, sectionsIgnored, phraseNorm, timings=timings, **kwargs)
+
+        if snapshot:
+            results['snapshot'] = self.snapshotDoc(doc)
+
+        return results
+
+    def snapshotDoc(self, doc):
+        '''Serialize a parsed document to bytes for analyzeSnapshot(), without the tensor and user data which the analysis does not use.'''
+        return doc.to_bytes(exclude=['tensor', 'user_data'])
+
+    def analyzeSnapshot(self, snapshot, scope='document', removeNested=True, maxSentDist=2, sectionsIgnored=[], phraseNorm=True, **kwargs):
+        '''
+        Same as analyzeText() for a document serialized by snapshotDoc(), without running the Spacy pipeline again.
+        The snapshot must come from a LanguageProcessor with the same pipelineVersion.
+        '''
+        doc = Doc(self.nlp.vocab).from_bytes(snapshot)
+
+        return self._analyzeDoc(doc, scope, removeNested, maxSentDist, sectionsIgnored, phraseNorm, **kwargs)
+
+    def analyzeTexts(self, texts, batch_size=50, n_process=1, scope='document', removeNested=True, maxSentDist=2, sectionsIgnored=[], phraseNorm=True, profile=None, as_tuples=False, **kwargs):
+        '''
+        Generator version of analyzeText() for processing a stream of documents.
+        Texts are parsed in batches by Spacy's nlp.pipe(), results are yielded in the same order as the input texts.
+        - batch_size: number of texts buffered per nlp.pipe() batch.
+        - n_process: number of processes used by nlp.pipe() for parsing, -1 uses all available cores.
+        - as_tuples: if True, texts is a stream of (text, context) tuples and (results, context) tuples are yielded.
+        - remaining parameters and kwargs are the same as analyzeText().
+        '''
+        pipe = self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process, as_tuples=as_tuples, disable=self._getDisabledPipes(profile))
+
+        while True:
+            # the parse time of a document is the wait for it from nlp.pipe(), so the first document of a batch carries the batch
+            timings = StageTimings()
+            with timings.stage('parse'):
+                item = next(pipe, None)
+            if item is None:
+                return
+
+            if as_tuples:
+                doc, context = item
+                yield (self._analyzeDoc(doc, scope, removeNested, maxSentDist, sectionsIgnored, phraseNorm, timings=timings, **kwargs), context)
+            else:
+                yield self._analyzeDoc(item, scope, removeNested, maxSentDist, sectionsIgnored, phraseNorm, timings=timings, **kwargs)
+
+    def _getDisabledPipes(self, profile):
+        '''Returns list of loaded pipeline components to skip for the given profile name, None uses all loaded components.'''
+        if profile is None:
+            return []
+        return [name for name in self.nlp.pipe_names if name in getPipelineProfile(profile)['disable']]
+
+    def _analyzeDoc(self, doc, scope, removeNested, maxSentDist, sectionsIgnored, phraseNorm, timings=None, **kwargs):
+        '''
+        Run sectionizer, matchers and post-processing on a parsed document, returns the results dictionary.
+        Durations of the stages, including the parse if timed in timings, are returned in results['stats']['timings'] and added to metrics.
+        '''
+        startTime = perf_counter()
+        timings = timings or StageTimings()
+        columnar = kwargs.get('columnar')
 
         results = {'entities': [],
                    'sections': [],
                    'sentences': [],
-                   'tokens': []
+                   'tokens': [],
+                   'stats': {}
                    }
 
         if settings.ENABLE_SECTIONIZER:
-            sections = self.sectionizer.getSections(doc, **kwargs)
-            results['sections'] = sections
+            with timings.stage('sectionizer'):
+                sections = self.sectionizer.getSections(doc, **kwargs)
+            results['sections'] = toColumns(sections, **kwargs) if columnar else sections
 
         if settings.ENABLE_ENTITYMATCHER:
-            logicEntities = self.entityMatcher.getLogics(doc, **kwargs)
+            with timings.stage('logicMatchers'):
+                logicEntities = self.entityMatcher.getLogics(doc, **kwargs)
 
         if settings.ENABLE_SENTENCIZER:
-            sentences = self.sentencizer.getSentences(doc, **kwargs)
-            results['sentences'] = sentences
+            with timings.stage('sentencizer'):
+                if not columnar or settings.ENABLE_ENTITYMATCHER:
+                    # keyword matching and post-processing use the sentence dictionaries
+                    sentences = self.sentencizer.getSentences(doc, **kwargs)
+                if columnar:
+                    results['sentences'] = self.sentencizer.getSentenceColumns(doc, **kwargs)
+                else:
+                    results['sentences'] = sentences
 
         if settings.ENABLE_TOKENIZER:
-            tokens = self.tokenizer.getTokens(doc, **kwargs)
-            results['tokens'] = tokens
+            with timings.stage('tokenizer'):
+                if columnar:
+                    results['tokens'] = self.tokenizer.getTokenColumns(doc, **kwargs)
+                else:
+                    results['tokens'] = self.tokenizer.getTokens(doc, **kwargs)
 
         if settings.ENABLE_ENTITYMATCHER:
             icdEntities = self._icdKeywordMatchStrategy(
-                doc, sections, sentences, scope, removeNested, maxSentDist, sectionsIgnored, settings.ENABLE_PHRASENORMALIZER, **kwargs)
+                doc, sections, sentences, scope, removeNested, maxSentDist, sectionsIgnored, settings.ENABLE_PHRASENORMALIZER,
+                stats=results['stats'], timings=timings, **kwargs)
 
             results['entities'] = [*logicEntities, *icdEntities]
 
+        timings.durations['total'] = timings.durations.get('parse', 0) + perf_counter() - startTime
+        results['stats']['timings'] = timings.durations
+        metrics.observeDocument(len(doc.text), len(results['entities']), timings.durations)
+
         self._printDebug(results, **kwargs)
 
         return results
@@ -100,12 +281,18 @@ class LanguageProcessor:
             if debugFlags.entityMatchers in debug:
                 print("//////////// results.entities //////////////")
                 print(results['entities'])
+            if debugFlags.timings in debug:
+                print("//////////// results.stats.timings //////////////")
+                print(results['stats']['timings'])
+            if debugFlags.sectionMemo in debug:
+                print("//////////// results.stats.sectionMemo //////////////")
+                print(results['stats'].get('sectionMemo'))
             if len(debug) == 0:
                 print("//////////// results //////////////")
                 print(results)
             print("/////////////////////////////////////")
 
-    def _icdKeywordMatchStrategy(self, doc, sections, sentences, scope, removeNested, maxSentDist, sectionsIgnored, phraseNorm, **kwargs):
+    def _icdKeywordMatchStrategy(self, doc, sections, sentences, scope, removeNested, maxSentDist, sectionsIgnored, phraseNorm, stats=None, timings=None, **kwargs):
         '''
         @Params:
         - doc: of type spacy.nlp.load(str)
@@ -116,66 +303,141 @@ class LanguageProcessor:
         - maxSentDist: maximum sentence distance for ICD keyword searching when scope is set to 'section' or 'document'.
         - sectionsIgnored: a list of section header tags to ignore ICD keyword searching.
         - phraseNorm: whether to normalize keyword phrases before searching for ICD keyword, boolean.
+        - stats: optional dictionary, filled with 'sectionMemo' hit counts when scope is set to 'section'.
+        - timings: optional StageTimings, durations of the matching and post-processing stages are added to it.
+        Entities are SpanRecords until post-processed, and returned as annotation dictionaries.
         '''
+        timings = timings or StageTimings()
 
         if scope == 'document':
-            if phraseNorm:
-                normalizedPhrases = self.phraseNormalizer.getNormPhrases(doc, **kwargs)
-            else:
-                normalizedPhrases = None
-            icdKeywords = self.entityMatcher.getIcdKeywordMatches(doc, normalizedPhrases, **kwargs)
-            icdEntities = self.icdKwMatcher.getIcdAnnotations(icdKeywords, phraseNorm, **kwargs)
+            with timings.stage('phraseNormalizer'):
+                if phraseNorm:
+                    normalizedPhrases = self.phraseNormalizer.getNormPhrases(doc, **kwargs)
+                else:
+                    normalizedPhrases = None
+            with timings.stage('keywordMatcher'):
+                icdKeywords = self.entityMatcher.getIcdKeywordMatches(doc, normalizedPhrases, **kwargs)
+            with timings.stage('icdAnnotations'):
+                # keywords of the whole document can be any number of sentences apart, codes removed by post-processing are not built
+                window = ChainWindow(sections, sentences, maxSentDist, sectionsIgnored)
+                icdEntities = self.icdKwMatcher.getIcdAnnotations(icdKeywords, phraseNorm, window=window, **kwargs)
 
         elif scope == 'section':
-            icdEntities, _ = self._getIcdKeywordByParts(doc, sections, phraseNorm, **kwargs)
+            icdEntities, _ = self._getIcdKeywordByParts(doc, sections, phraseNorm, memoStats=stats, timings=timings, **kwargs)
 
         elif scope == 'sentence':
-            icdEntities, _ = self._getIcdKeywordByParts(doc, sentences, phraseNorm, **kwargs)
+            icdEntities, _ = self._getIcdKeywordByParts(doc, sentences, phraseNorm, timings=timings, **kwargs)
 
-        cleanIcdEntities = EntityPostProcessor(sections, sentences, icdEntities, Labels.ICD_KEYWORD_LABEL).processICD(
-            removeNested, maxSentDist, sectionsIgnored, **kwargs)
+        with timings.stage('postProcessor'):
+            cleanIcdEntities = EntityPostProcessor(sections, sentences, icdEntities, Labels.ICD_KEYWORD_LABEL).processICD(
+                removeNested, maxSentDist, sectionsIgnored, **kwargs)
 
-        return cleanIcdEntities
+        with timings.stage('entityDicts'):
+            return toDicts(cleanIcdEntities)
 
-    def _getIcdKeywordByParts(self, doc, parts, phraseNorm, **kwargs):
-        '''Search document part by part for ICD keywords, constraining the search scope to each part.'''
+    def _getIcdKeywordByParts(self, doc, parts, phraseNorm, memoStats=None, timings=None, **kwargs):
+        '''
+        Search document part by part for ICD keywords, constraining the search scope to each part.
+        - memoStats: if a dictionary is given, matches of parts are looked up in and added to self.sectionMemo,
+          and memoStats['sectionMemo'] is set to the lookup and hit counts of this document.
+        - timings: optional StageTimings, durations of the stages summed over the parts are added to it.
+        '''
+        timings = timings or StageTimings()
         icdEntities = []
         icdKeywords = []
-        for part in parts:
-            partStart = part['start']
-            partEnd = part['end']
-            partTag = part['tag']
-            textInPart = doc.text[partStart:partEnd]
-            partDoc = self.nlp(textInPart)
+        lookups = 0
+        hits = 0
+
+        tokenStarts, tokenEnds = getTokenOffsets(doc)
+
+        for startToken, endToken in self._getPartTokenRanges(parts, tokenStarts, tokenEnds):
+            partOffset = int(tokenStarts[startToken])
+            partSpan = doc[startToken:endToken]
 
+            if memoStats is not None:
+                with timings.stage('sectionMemo'):
+                    memoKey = self._getPartMemoKey(partSpan.text, tokenStarts[startToken:endToken] - partOffset, phraseNorm, **kwargs)
+                    memoized = self.sectionMemo.get(memoKey)
+                lookups += 1
+            else:
+                memoized = None
+
+            if memoized is None:
+                # matches are computed relative to the part, and shifted to the document below
+                with timings.stage('partDocs'):
+                    partDoc = partSpan.as_doc()
+                memoized = self._matchPart(partDoc, phraseNorm, timings, **kwargs)
+                if memoStats is not None:
+                    self.sectionMemo.put(memoKey, memoized)
+            else:
+                hits += 1
+
+            with timings.stage('sectionMemo'):
+                icdKeywordsInPart, icdEntitiesInPart = memoized
+                icdKeywords += self._shiftMatches(icdKeywordsInPart, partOffset)
+                icdEntities += self._shiftMatches(icdEntitiesInPart, partOffset)
+
+        self._formatIcdEntities(icdEntities)
+
+        if memoStats is not None:
+            memoStats['sectionMemo'] = {'lookups': lookups, 'hits': hits, 'hitRatio': hits / lookups if lookups else None}
+
+        return (icdEntities, icdKeywords)
+
+    def _matchPart(self, partDoc, phraseNorm, timings, **kwargs):
+        '''Returns tuple of (keyword matches, ICD entities) of a part, with character positions relative to the part.'''
+        with timings.stage('phraseNormalizer'):
             if phraseNorm:
-                normalizedPhrases = self.phraseNormalizer.getNormPhrases(partDoc, offset=partStart, **kwargs)
+                normalizedPhrases = self.phraseNormalizer.getNormPhrases(partDoc, **kwargs)
             else:
                 normalizedPhrases = None
 
-            icdKeywordsInPart = self.entityMatcher.getIcdKeywordMatches(
-                self.nlp(textInPart), normalizedPhrases, offset=partStart, **kwargs)
-
+        with timings.stage('keywordMatcher'):
+            icdKeywordsInPart = self.entityMatcher.getIcdKeywordMatches(partDoc, normalizedPhrases, **kwargs)
+        with timings.stage('icdAnnotations'):
             icdEntitiesInPart = self.icdKwMatcher.getIcdAnnotations(icdKeywordsInPart, phraseNorm, **kwargs)
 
-            if len(icdKeywordsInPart) > 0:
-                icdKeywords += icdKeywordsInPart
-            if len(icdEntitiesInPart) > 0:
-                icdEntities += icdEntitiesInPart
+        return (icdKeywordsInPart, icdEntitiesInPart)
 
-        self._formatIcdEntities(icdEntities)
+    def _getPartMemoKey(self, text, relativeTokenStarts, phraseNorm, **kwargs):
+        '''
+        Matches of a part only depend on its token texts (ORTH), and the options below: the keyword and normalization PhraseMatchers
+        compare ORTH, their default attribute, and ICD matching compares the texts of the keyword matches. Tags, lemmas and dependencies
+        are not read, the LOWER and lemma patterns of the negation and closure Matchers are not run on parts. The text and the token
+        boundaries give the token texts, the same text could in principle be tokenized differently where a part was cut from a larger document.
+        A matcher of parts comparing other token attributes must add them to the key.
+        '''
+        sha = hashlib.sha256(text.encode('utf-8'))
+        sha.update(relativeTokenStarts.tobytes())
+        sha.update(json.dumps([self.pipelineVersion, bool(phraseNorm), bool(kwargs.get('outputDetail'))]).encode('utf-8'))
+        return sha.hexdigest()
 
-        return (icdEntities, icdKeywords)
+    def _shiftMatches(self, matches, offset):
+        '''Returns copies of matches with character positions moved by offset, 'next' links point to the copies of the linked matches.'''
+        copies = {id(match): match.copy(start=match.start + offset, end=match.end + offset) for match in matches}
+
+        for match in copies.values():
+            if match.next is not None:
+                match.next = copies[id(match.next)]
+
+        return list(copies.values())
+
+    def _getPartTokenRanges(self, parts, tokenStarts, tokenEnds):
+        '''
+        Generator of (startToken, endToken) tuples, the token range of each part (section or sentence) of an already parsed document.
+        A part covers the tokens that lie entirely within its character range.
+        '''
+        for part in parts:
+            startToken = int(numpy.searchsorted(tokenStarts, part['start'], side='left'))
+            endToken = int(numpy.searchsorted(tokenEnds, part['end'], side='right'))
+
+            if startToken >= endToken:
+                continue
+
+            yield (startToken, endToken)
 
     def _formatIcdEntities(self, icdEntities):
-        '''Remove dots from ICD codes, add additional tags.'''
+        '''Remove dots from ICD codes, add additional tags. The linked parts of multi-part entities are in the list too.'''
         for icdEntity in icdEntities:
-            icdEntity["tag"] = icdEntity["tag"].replace(".", "")
-            icdEntity["confirmed"] = False
-            currentTag = icdEntity
-            while True:
-                try:
-                    currentTag = currentTag["next"]
-                    currentTag["tag"] = currentTag["tag"].replace(".", "")
-                except:
-                    break
+            icdEntity.tag = icdEntity.tag.replace(".", "")
+            icdEntity.confirmed = False
@@ -1,19 +1,25 @@
 from NLP.matcherPatterns import Labels
+from NLP.spanRecord import SpanRecord
 from Utility.progress import printProgressBar
 import csv
 from spacy.matcher import PhraseMatcher
+from spacy.tokens import Doc
 import NLP.debugSettings as debugFlags
 
 
 class PhraseNormalizer:
-    def __init__(self, nlp, lexicalFile, umlsFile):
+    def __init__(self, nlp, lexicalFile, umlsFile, bundle=None):
         print("Initializing PhraseNormalizer...")
-        umlsLookup = self._createUmlsDictionary(umlsFile)
-        lexicalLookup = self._createLexicalDictionary(lexicalFile)
-        self.normalizationDict = self._combineNormalizationDictionary(umlsLookup, lexicalLookup)
-
         self.normalizePhraseMatcher = PhraseMatcher(nlp.vocab)
-        self._loadNormalizePhrases(nlp)
+
+        if bundle:
+            self.normalizationDict = bundle['normalizationDict']
+            self._loadNormalizePatterns(nlp, bundle['normalizationPatterns'])
+        else:
+            umlsLookup = self._createUmlsDictionary(umlsFile)
+            lexicalLookup = self._createLexicalDictionary(lexicalFile)
+            self.normalizationDict = self._combineNormalizationDictionary(umlsLookup, lexicalLookup)
+            self._loadNormalizePhrases(nlp)
 
     def _createUmlsDictionary(self, path):
         '''Create a dictionary of UMLS normalization from csv file.'''
@@ -69,14 +75,22 @@ class PhraseNormalizer:
         '''
         patterns = []
         total = len(self.normalizationDict)
-        for i, phrase in enumerate(self.normalizationDict.keys()):
-            patterns.append(nlp(phrase))
+        # PhraseMatcher only compares token texts, the phrases need tokenizing but not the rest of the pipeline
+        for i, pattern in enumerate(nlp.tokenizer.pipe(self.normalizationDict.keys())):
+            patterns.append(pattern)
             printProgressBar(i+1, total, prefix='Loading normalization phrases:', suffix='Complete', length=5)
         self.normalizePhraseMatcher.add(Labels.NORMALIZE_LABEL, None, *patterns)
 
+    def _loadNormalizePatterns(self, nlp, normalizePatterns):
+        '''
+        Populate Spacy PhraseMatcher with pre-tokenized normalization phrases from a knowledge bundle (list of words per phrase).
+        '''
+        patterns = [Doc(nlp.vocab, words=words) for words in normalizePatterns]
+        self.normalizePhraseMatcher.add(Labels.NORMALIZE_LABEL, None, *patterns)
+
     def getNormPhrases(self, doc, offset=0, **kwargs):
         '''
-        Given a doc (of type Spacy.nlp(Str)), find and return a list normalization phrases.
+        Given a doc (of type Spacy.nlp(Str)), find and return a list normalization phrases, as SpanRecords.
         '''
         # outputDetail = kwargs.get('outputDetail')
         debug = kwargs.get('debug')
@@ -94,13 +108,8 @@ class PhraseNormalizer:
             text = doc.text[annotate_start_char:annotate_end_char]
             normalizedTo = self.normalizationDict[text]
 
-            matchObj = {
-                "start": annotate_start_char + offset,
-                "end": annotate_end_char + offset,
-                "text": text,
-                "normalizedTo": normalizedTo,
-                "type": Labels.NORMALIZE_LABEL
-            }
+            matchObj = SpanRecord(annotate_start_char + offset, annotate_end_char + offset, text=text, normalizedTo=normalizedTo,
+                                  type=Labels.NORMALIZE_LABEL)
 
             outputMatches.append(matchObj)
 
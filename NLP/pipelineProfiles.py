@@ -0,0 +1,22 @@
+# Named Spacy pipeline profiles for LanguageProcessor, selected by settings.NLP_PIPELINE_PROFILE or per call.
+# - disable: Spacy pipeline components of the model that are not loaded (or skipped when selected per call).
+# - vectors: whether the model's word vectors are kept in memory. The tagger, parser and ner of the model use the
+#   vectors as features, so they can only be dropped when none of those components are loaded.
+#
+# 'full' runs the whole model.
+# 'lean' keeps the tagger, lemmas depend on part of speech tags and are used by the negation Matcher patterns,
+#   sentence boundaries come from the custom Sentencizer only.
+# 'tokens-only' keeps tokens and custom sentence boundaries only, lemma based negation patterns fall back to lookup lemmas.
+
+PIPELINE_PROFILES = {
+    'full': {'disable': [], 'vectors': True},
+    'lean': {'disable': ['parser', 'ner'], 'vectors': True},
+    'tokens-only': {'disable': ['tagger', 'parser', 'ner'], 'vectors': False},
+}
+
+
+def getPipelineProfile(name):
+    '''Returns the pipeline profile of the given name, raises ValueError naming the valid profiles if there is none.'''
+    if name not in PIPELINE_PROFILES:
+        raise ValueError("Unknown pipeline profile %r, valid profiles are: %s." % (name, ', '.join(PIPELINE_PROFILES)))
+    return PIPELINE_PROFILES[name]
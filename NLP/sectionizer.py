@@ -7,29 +7,39 @@ import NLP.debugSettings as debugFlags
 
 class Sectionizer:
 
-    def __init__(self, patternFile):
+    # strings marking the end of the last section, in order of precedence
+    endingStrings = ['electronically signed by', 'authenticated signature applied', 'dictated by:']
+
+    def __init__(self, patternFile, bundle=None):
         print("Initializing Sectionizer...")
-        self._loadPatternsFromFile(patternFile)
+        if bundle:
+            self.sectionsRegex = bundle['sectionsRegex']
+            self.sections = bundle['sections']
+        else:
+            self._loadPatternsFromFile(patternFile)
+
+        self.sectionsPattern = re.compile(self.sectionsRegex)
+        self.aliasToSection = self._makeAliasLookup(self.sections)
 
     def _loadPatternsFromFile(self, patternFile):
         if patternFile.lower().endswith('.csv'):
             self._makeJSONfromCSV(patternFile)
-            self.sectionsRegex, self.sections = self._loadSectionPatternsFromCSV(patternFile)
+            self.sections = self._loadSectionPatternsFromCSV(patternFile)
         elif patternFile.lower().endswith('json'):
-            self.sectionsRegex, self.sections = self._loadSectionPatternsFromJSON(patternFile)
+            self.sections = self._loadSectionPatternsFromJSON(patternFile)
+
+        self.sectionsRegex = self._makeRegularExpression(self.sections)
 
     def _loadSectionPatternsFromJSON(self, patternFile):
-        expressions = set()
         sections = defaultdict(list)
 
         with open(patternFile, mode='r') as file:
             root = json.load(file)
 
             for sectionName, sectionAlias in self._jsonSectionNameAliasGenerator(root):
-                expressions.add(self._makeRegularExpression(sectionAlias))
                 sections[sectionName].append(sectionAlias)
 
-        return expressions, sections
+        return sections
 
     def _jsonSectionNameAliasGenerator(self, jsonObj):
         '''Recursively look through a section pattern json, returns section name and alias pairs as a tupple.'''
@@ -43,14 +53,38 @@ class Sectionizer:
                 for child in v:
                     yield from self._jsonSectionNameAliasGenerator(child)
 
-    def _makeRegularExpression(self, sectionAlias):
-        return {
-            '\\n\**' + sectionAlias + '\**.?\\n',
-            '\\n' + sectionAlias + ':+\s*'
-        }
+    def _makeRegularExpression(self, sections):
+        '''
+        Combine all section header aliases and section endings into a single regular expression, so a document is scanned only once.
+        Section headers are matched in two forms: as a line of its own optionally wrapped in asterisks (group 'header'),
+        or at the start of a line followed by colons (group 'colonHeader').
+        Both forms are zero-width lookaheads at each line break, so that headers of both forms are found at the same line break,
+        groups 'headerAlias' and 'colonHeaderAlias' hold the matched alias. Group 'ending' matches the section ending strings.
+        '''
+        aliases = set()
+        for sectionAliases in sections.values():
+            aliases.update(sectionAliases)
+
+        # longest alias first, so the longest header is preferred where several aliases match at the same line break
+        aliasExpression = '|'.join(sorted(aliases, key=lambda alias: (-len(alias), alias)))
+        endingExpression = '|'.join(self.endingStrings)
+
+        return (
+            '(?P<ending>' + endingExpression + ')'
+            '|(?=\\n)'
+            '(?:(?=(?P<header>\\n\\**(?P<headerAlias>' + aliasExpression + ')\\**.?\\n)))?'
+            '(?:(?=(?P<colonHeader>\\n(?P<colonHeaderAlias>' + aliasExpression + '):+\\s*)))?'
+        )
+
+    def _makeAliasLookup(self, sections):
+        '''Returns a dictionary for looking up the standard section name by alias, the last section listing an alias takes precedence.'''
+        aliasToSection = dict()
+        for section, aliases in sections.items():
+            for alias in aliases:
+                aliasToSection[alias] = section
+        return aliasToSection
 
     def _loadSectionPatternsFromCSV(self, patternFile):
-        expressions = set()   # regex for section headers in document
         sections = defaultdict(list)
 
         with open(patternFile, mode='r') as f:   # file containing dictionary for mapping section headers
@@ -58,9 +92,8 @@ class Sectionizer:
                 section = line.strip().split(',')[0]
                 alias = line.strip().split(',')[1].lower()
                 sections[section].append(alias)
-                expressions.update(self._makeRegularExpression(alias))
 
-        return expressions, sections
+        return sections
 
     def _makeJSONfromCSV(self, csvFile):
         '''Given a csv file containing section patterns, create a json pattern file.'''
@@ -86,37 +119,44 @@ class Sectionizer:
 
         return root
 
-    def _findSectionEndings(self, doc):
-        endingStrings = ['electronically signed by', 'authenticated signature applied', 'dictated by:']
-        sectionEndings = []  # characters where sections end
-        for ending in endingStrings:
-            for match in re.finditer(ending, doc.text.lower()):
-                sectionEndings.append(match.span()[0])
-        return sectionEndings
-
-    def _getSectionsFromDoc(self, doc):
-        '''Given a Spacy document, outputs a list of tuples containing character index (start, end) and text of the section headers.'''
+    def _findSectionMarkers(self, doc):
+        '''
+        Scans the lowercased document text once for section headers and section endings.
+        Returns a tuple of:
+        - list of characters where sections end, grouped by ending string in order of self.endingStrings.
+        - sorted and cleaned list of tuples containing character index (start, end) and text of the section headers.
+        '''
+        text = doc.text.lower()
 
+        endingsByString = defaultdict(list)
         doc_sections = []  # list of sections in format of (start_char, end_char, section_header_in_doc)
+        # end of the last header reported for each form and alias
+        lastEnds = dict()
+
+        for match in self.sectionsPattern.finditer(text):
+            if match.group('ending'):
+                endingsByString[match.group('ending')].append(match.start())
+                continue
 
-        for expression in self.sectionsRegex:
-            for match in re.finditer(expression, doc.text.lower()):
-                start, end = match.span()
-                section = doc.text.lower()[start+1:end-1]
-                doc_sections.append((start, end, section))
+            for group in ('header', 'colonHeader'):
+                if match.group(group) is not None:
+                    start, end = match.span(group)
+                    key = (group, match.group(group + 'Alias'))
+
+                    # a header starting inside the previous header of the same form and alias is not reported, as with a separate
+                    # finditer() per form and alias, eg: the second of two consecutive lines with the same header
+                    if start < lastEnds.get(key, 0):
+                        continue
+
+                    lastEnds[key] = end
+                    doc_sections.append((start, end, text[start+1:end-1]))
+
+        sectionEndings = [ending for endingString in self.endingStrings for ending in endingsByString[endingString]]
 
         # Sorting sections in order
         doc_sections.sort()
 
-        # Adding section at the beginning if there is not a section there
-        # if len(doc_sections) > 0 and doc_sections[0][0] != 0:
-        #     temp = doc_sections
-        #     doc_sections = [(0, 0, '')]
-        #     doc_sections.extend(temp)
-        # else:
-        #     doc_sections = [(0, 0, '')]
-
-        return self._cleanSectionHeadings(doc_sections)
+        return sectionEndings, self._cleanSectionHeadings(doc_sections)
 
     def _cleanSectionHeadings(self, doc_sections):
         '''Given a list of sorted doc section headings, check of overlap, returns cleaned list.'''
@@ -157,8 +197,8 @@ class Sectionizer:
 
         debug = kwargs.get('debug')
 
-        endings = self._findSectionEndings(doc)
-        doc_sections = self._getSectionsFromDoc(doc)  # list of section headings as tuples: (start, end, heading)
+        # doc_sections is a list of section headings as tuples: (start, end, heading)
+        endings, doc_sections = self._findSectionMarkers(doc)
         document = []
 
         if debug and debugFlags.sectionizer in debug:
@@ -167,12 +207,9 @@ class Sectionizer:
             print("///////////////////////////")
 
         for i, section in enumerate(doc_sections):
-            general_section = ''
             section_heading = section[2].strip().replace('*', '')[:-1]
+            general_section = self.aliasToSection.get(section_heading, '')
 
-            for key, value in self.sections.items():
-                if section_heading in value:
-                    general_section = key
             sec_dict = dict()
             sec_dict['standard_header'] = general_section
             sec_dict['header_in_doc'] = section[2]
@@ -1,37 +1,56 @@
+import numpy
+from spacy.attrs import ORTH, SENT_START
+from NLP.columnarFormat import getTokenOffsets, getSentenceTokenStarts, makeColumns
+
+
 class Sentencizer:
 
+    delimiters = ['\n\n', '\n\n\n', '.', '?', '!']
+
     def __init__(self, nlp):
         print("Initializing Sentencizer...")
         self.nlp = nlp
-        self.nlp.add_pipe(self._sentence_boundary, before='parser')
-
-    def _set_start(self, token, action):
-        if token.is_sent_start == None:
-            token.is_sent_start = action
-        return token
+        self.delimiterIds = numpy.array([nlp.vocab.strings.add(delimiter) for delimiter in self.delimiters], dtype=numpy.uint64)
+        self.dotId = nlp.vocab.strings.add('.')
+        if 'parser' in self.nlp.pipe_names:
+            self.nlp.add_pipe(self._sentence_boundary, before='parser')
+        else:
+            self.nlp.add_pipe(self._sentence_boundary)
 
     def _sentence_boundary(self, doc):
-        '''Add custom sentence boundary definitions'''
+        '''
+        Add custom sentence boundary definitions.
+        Rules are evaluated on token attribute arrays, and sentence starts are written back to the doc in bulk.
+        Values of the sentence start array: 1 is a sentence start, -1 is not a sentence start, 0 is not set.
+        '''
+        length = len(doc)
+        if length < 2:
+            return doc
 
-        delimiters = ['\n\n', '\n\n\n', '.', '?', '!']
+        orths = doc.to_array(ORTH)
+        sentStarts = doc.to_array(SENT_START).astype(numpy.int64)
 
-        # Explicit rules
-        for token in doc:
-            if token.i + 1 < len(doc):
-                if token.text.isnumeric() and doc[token.i-1].text.endswith('\n') and doc[token.i+1].text == '.':
-                    doc[token.i].is_sent_start = True
-                    doc[token.i+1].is_sent_start = False
-                    doc[token.i+2].is_sent_start = False
-                    doc[token.i-1].is_sent_start = False
+        # string checks are done once per distinct token text instead of once per token
+        uniqueOrths, tokenToUnique = numpy.unique(orths, return_inverse=True)
+        uniqueTexts = [doc.vocab.strings[int(orth)] for orth in uniqueOrths]
+        isNumeric = numpy.array([text.isnumeric() for text in uniqueTexts], dtype=bool)[tokenToUnique]
+        endsWithNewline = numpy.array([text.endswith('\n') for text in uniqueTexts], dtype=bool)[tokenToUnique]
+        isDelimiter = numpy.isin(orths, self.delimiterIds)
+        isDot = orths == self.dotId
+
+        # Explicit rules: a number following a line break and followed by '.' starts a sentence, eg: numbered lists.
+        # The token before the first token is the last token, as with doc[-1].
+        explicit = numpy.flatnonzero(isNumeric[:-1] & numpy.roll(endsWithNewline, 1)[:-1] & isDot[1:])
+        sentStarts[explicit] = 1
+        sentStarts[explicit + 1] = -1
+        sentStarts[explicit[explicit + 2 < length] + 2] = -1
+        sentStarts[explicit - 1] = -1
 
         # Delimiter based for tokens not affected by explicit rules
-        for token in doc:
-            if token.i + 1 < len(doc):
-                # Delimiters
-                if token.text in delimiters:
-                    self._set_start(doc[token.i+1], True)
-                else:
-                    self._set_start(doc[token.i+1], False)
+        notSet = sentStarts[1:] == 0
+        sentStarts[1:][notSet] = numpy.where(isDelimiter[:-1], 1, -1)[notSet]
+
+        doc.from_array([SENT_START], sentStarts.astype(numpy.uint64).reshape((length, 1)))
         return doc
 
     def getSentences(self, doc, **kwargs):
@@ -51,3 +70,11 @@ class Sentencizer:
 
             sentences.append(sentenceAnnot)
         return sentences
+
+    def getSentenceColumns(self, doc, **kwargs):
+        '''Columnar version of getSentences(), see columnarFormat.py. The sentence numbers of outputDetail are the list indices.'''
+        tokenStarts, tokenEnds = getTokenOffsets(doc)
+        firstTokens = getSentenceTokenStarts(doc)
+        lastTokens = numpy.append(firstTokens[1:], len(doc)) - 1 if len(firstTokens) else firstTokens
+
+        return makeColumns(tokenStarts[firstTokens], tokenEnds[lastTokens], kwargs.get('deltaEncoding'), tags=[""] * len(firstTokens))
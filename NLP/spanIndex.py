@@ -0,0 +1,45 @@
+from bisect import bisect_right
+
+
+class SpanIndex:
+    '''
+    Index of sorted, non-overlapping character spans, such as the sections or sentences of a document.
+    Maps a character range to the ordinal of the span it falls in, in O(log n) with binary search over the span end positions.
+    '''
+
+    def __init__(self, spans):
+        '''spans: list of dictionaries with 'start' and 'end' keys, sorted by position and non-overlapping. Empty spans are never matched.'''
+        self.spans = []
+        self.ordinals = []
+        self.starts = []
+        self.ends = []
+
+        for ordinal, span in enumerate(spans):
+            if span['end'] <= span['start']:
+                continue
+            self.spans.append(span)
+            self.ordinals.append(ordinal)
+            self.starts.append(span['start'])
+            self.ends.append(span['end'])
+
+    def _find(self, start, end):
+        '''Returns the position in the index of the first span overlapping the range [start, end), None if there is none.'''
+        if start >= end:
+            return None
+
+        i = bisect_right(self.ends, start)  # first span ending after start
+
+        if i < len(self.starts) and self.starts[i] < end:
+            return i
+
+        return None
+
+    def getOrdinal(self, start, end):
+        '''Returns the ordinal (position in the list given to the constructor) of the first span overlapping the range [start, end), None if there is none.'''
+        i = self._find(start, end)
+        return None if i is None else self.ordinals[i]
+
+    def getSpan(self, start, end):
+        '''Returns the first span overlapping the range [start, end), None if there is none.'''
+        i = self._find(start, end)
+        return None if i is None else self.spans[i]
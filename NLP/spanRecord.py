@@ -0,0 +1,73 @@
+class SpanRecord:
+    '''
+    Compact record of a matched span, used for keyword matches, normalized phrases and ICD entities from matching through
+    EntityPostProcessor, in place of a dictionary per match. Converted to the annotation dictionaries of the results with toDicts().
+    Attributes that are None are left out of the dictionaries:
+    - start, end: character positions in the document.
+    - text: matched text, of ICD entities only with outputDetail.
+    - type, tag: annotation type and label, the tag of an ICD entity is its code.
+    - normalizedTo, originText: the normalized form of a normalized phrase, and its original text in the copy searched by its normalized form.
+    - triggers: the texts of all parts of a multi-part ICD entity, on its head with outputDetail.
+    - next: the next part of a multi-part ICD entity.
+    - confirmed: whether an ICD entity was confirmed, always False for matched ones.
+    - sentIdx: the index of the sentence of an ICD entity, set by EntityPostProcessor.
+    '''
+    __slots__ = ('start', 'end', 'text', 'type', 'tag', 'normalizedTo', 'originText', 'triggers', 'next', 'confirmed', 'sentIdx')
+
+    # order of the keys in annotation dictionaries, and the keys of attributes with other names
+    DICT_KEYS = ('start', 'end', 'tag', 'type', 'text', 'normalizedTo', 'originText', 'triggers', 'confirmed', 'sentIdx')
+    RENAMED_KEYS = {'sentIdx': 'sent-idx'}
+
+    def __init__(self, start, end, text=None, type=None, tag=None, normalizedTo=None, originText=None, triggers=None, next=None,
+                 confirmed=None, sentIdx=None):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.type = type
+        self.tag = tag
+        self.normalizedTo = normalizedTo
+        self.originText = originText
+        self.triggers = triggers
+        self.next = next
+        self.confirmed = confirmed
+        self.sentIdx = sentIdx
+
+    def copy(self, **changes):
+        '''Returns a shallow copy of the record, with the given attributes changed.'''
+        record = SpanRecord.__new__(SpanRecord)
+        for attribute in SpanRecord.__slots__:
+            setattr(record, attribute, changes[attribute] if attribute in changes else getattr(self, attribute))
+        return record
+
+    def toDict(self):
+        '''Returns the annotation dictionary of the record, without 'next'.'''
+        annotation = dict()
+        for attribute in SpanRecord.DICT_KEYS:
+            value = getattr(self, attribute)
+            if value is not None:
+                annotation[SpanRecord.RENAMED_KEYS.get(attribute, attribute)] = value
+        return annotation
+
+    def __repr__(self):
+        return 'SpanRecord(%s)' % self.toDict()
+
+
+def toDicts(records):
+    '''
+    Returns the annotation dictionaries of a list of records, where the 'next' of each dictionary is the dictionary of the next record,
+    as in the nested entity format of entityFormats.py. Next records missing from the list are converted too, but not listed.
+    '''
+    annotations = {id(record): record.toDict() for record in records}
+    pending = list(records)
+
+    while pending:
+        record = pending.pop()
+        if record.next is None:
+            continue
+
+        if id(record.next) not in annotations:
+            annotations[id(record.next)] = record.next.toDict()
+            pending.append(record.next)
+        annotations[id(record)]['next'] = annotations[id(record.next)]
+
+    return [annotations[id(record)] for record in records]
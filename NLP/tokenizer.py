@@ -2,6 +2,7 @@ import spacy
 from spacy.tokenizer import Tokenizer
 from spacy.util import compile_infix_regex, compile_prefix_regex, compile_suffix_regex
 import re
+from NLP.columnarFormat import getTokenOffsets, makeColumns
 
 
 class CustomTokenizer:
@@ -67,3 +68,8 @@ class CustomTokenizer:
             tokens.append(tokenAnnot)
 
         return tokens
+
+    def getTokenColumns(self, doc, **kwargs):
+        '''Columnar version of getTokens(), see columnarFormat.py. The token numbers of outputDetail are the list indices.'''
+        starts, ends = getTokenOffsets(doc)
+        return makeColumns(starts, ends, kwargs.get('deltaEncoding'))
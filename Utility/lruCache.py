@@ -0,0 +1,50 @@
+from collections import OrderedDict
+import threading
+
+
+class LRUCache:
+    '''
+    Thread-safe least recently used cache bounded by the total size of its values rather than their number.
+    - maxSize: maximum total size of the cached values.
+    - sizeOf: function returning the size of a value, defaults to len(), eg: bytes of an encoded value.
+    Values larger than maxSize are not cached.
+    '''
+
+    def __init__(self, maxSize, sizeOf=len):
+        self.maxSize = maxSize
+        self.sizeOf = sizeOf
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                return default
+            self.items.move_to_end(key)
+            return self.items[key][0]
+
+    def put(self, key, value):
+        size = self.sizeOf(value)
+
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+
+            if size > self.maxSize:
+                return
+
+            self.items[key] = (value, size)
+            self.size += size
+
+            while self.size > self.maxSize:
+                _, (_, evictedSize) = self.items.popitem(last=False)
+                self.size -= evictedSize
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,32 @@
+import resource
+
+
+def getMemoryUsage():
+    '''
+    Returns memory usage of the current process in bytes, as a dictionary with keys:
+    - rss: resident set size.
+    - pss: proportional set size, shared pages are divided between the processes sharing them (None if not available).
+    - shared: resident pages shared with other processes, eg: copy-on-write pages of a forked parent (None if not available).
+    - private: resident pages only used by this process (None if not available).
+    Reads /proc/self/smaps_rollup on Linux, falls back to peak RSS from getrusage() elsewhere.
+    '''
+    usage = {'rss': None, 'pss': None, 'shared': None, 'private': None}
+    fields = {
+        'Rss:': 'rss',
+        'Pss:': 'pss',
+        'Shared_Clean:': 'shared', 'Shared_Dirty:': 'shared',
+        'Private_Clean:': 'private', 'Private_Dirty:': 'private',
+    }
+
+    try:
+        with open('/proc/self/smaps_rollup') as file:
+            for line in file:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    key = fields[parts[0]]
+                    usage[key] = (usage[key] or 0) + int(parts[1]) * 1024  # values in kB
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux
+        usage['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return usage
@@ -0,0 +1,61 @@
+from collections import Counter
+import cProfile
+import os
+import sys
+import threading
+
+
+class RequestProfiler:
+    '''
+    Context manager that profiles the code run in its block on the current thread, and saves two files in directory:
+    - <profileId>.pstats: cProfile statistics, read with pstats or tools such as snakeviz.
+    - <profileId>.collapsed: call stacks sampled every interval seconds, one 'root;...;leaf count' line per stack,
+      the input format of flamegraph.pl and speedscope.
+    '''
+
+    def __init__(self, directory, profileId, interval=0.001):
+        self.directory = directory
+        self.profileId = profileId
+        self.interval = interval
+        self.stacks = Counter()
+        self.profile = cProfile.Profile()
+        self.stopSampling = threading.Event()
+
+    def __enter__(self):
+        self.threadId = threading.get_ident()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+        self.sampler.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        self.stopSampling.set()
+        self.sampler.join()
+        self._save()
+
+    def _sample(self):
+        while not self.stopSampling.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        basePath = os.path.join(self.directory, self.profileId)
+
+        self.profile.dump_stats(basePath + '.pstats')
+
+        with open(basePath + '.collapsed', mode='w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write("%s %d\n" % (stack, count))
+
+        print("Profile saved to", basePath + ".pstats and", basePath + ".collapsed")
@@ -0,0 +1,79 @@
+from Utility.lruCache import LRUCache
+import hashlib
+import json
+import os
+import threading
+
+
+class ResultCache:
+    '''
+    Cache of document analysis results, keyed by content: see makeKey().
+    Results are stored as encoded json, in an in-process LRU tier bounded by size in bytes,
+    and optionally in a persistent tier of one file per result in a local directory, shared by all processes using it.
+    '''
+
+    def __init__(self, maxBytes, directory=None):
+        self.memory = LRUCache(maxBytes)
+        self.directory = directory
+        self.counterLock = threading.Lock()
+        self.counters = {'hits': 0, 'diskHits': 0, 'misses': 0}
+
+    @staticmethod
+    def makeKey(text, pipelineVersion, **params):
+        '''Returns the cache key of a text analyzed with the given pipeline version and analysis parameters.'''
+        textHash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        keyData = json.dumps({'text': textHash, 'pipeline': pipelineVersion, 'params': params}, sort_keys=True)
+        return hashlib.sha256(keyData.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        '''Returns a fresh copy of the cached result, None if not cached.'''
+        data = self.memory.get(key)
+
+        if data is not None:
+            self._count('hits')
+            return json.loads(data)
+
+        if self.directory:
+            try:
+                with open(self._getPath(key), mode='rb') as file:
+                    data = file.read()
+                self.memory.put(key, data)
+                self._count('diskHits')
+                return json.loads(data)
+            except OSError:
+                pass
+
+        self._count('misses')
+        return None
+
+    def put(self, key, result):
+        data = json.dumps(result).encode('utf-8')
+        self.memory.put(key, data)
+
+        if self.directory:
+            path = self._getPath(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write then rename, so that other processes never read a partial file
+            tempPath = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+            with open(tempPath, mode='wb') as file:
+                file.write(data)
+            os.replace(tempPath, path)
+
+    def getStats(self):
+        with self.counterLock:
+            stats = dict(self.counters)
+
+        lookups = stats['hits'] + stats['diskHits'] + stats['misses']
+        stats['hitRatio'] = (stats['hits'] + stats['diskHits']) / lookups if lookups else None
+        stats['entries'] = len(self.memory)
+        stats['bytes'] = self.memory.size
+        stats['maxBytes'] = self.memory.maxSize
+        stats['directory'] = self.directory
+        return stats
+
+    def _count(self, counter):
+        with self.counterLock:
+            self.counters[counter] += 1
+
+    def _getPath(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from users.models import CustomUser
 from annotations.models import Annotation
 from ICD.models import TreeCode, Code
+from NLP.entityFormats import NESTED, convertEntities
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -33,6 +34,7 @@ class AnnotationSerializerWithFilename(serializers.ModelSerializer):
 
 
 class AnnotationSerializerForExporting(serializers.ModelSerializer):
+    """Entities are returned in the entity format given in the serializer context, nested by default."""
     Entities = serializers.SerializerMethodField()
     Sentences = serializers.SerializerMethodField()
     tagTemplates = serializers.SerializerMethodField()
@@ -42,7 +44,9 @@ class AnnotationSerializerForExporting(serializers.ModelSerializer):
         return obj.name
 
     def get_Entities(self, obj):
-        return obj.Entities
+        if obj.Entities is None:
+            return None
+        return convertEntities(obj.Entities, obj.entityFormat or NESTED, self.context.get('entityFormat', NESTED))
 
     def get_Sentences(self, obj):
         return obj.Sentences
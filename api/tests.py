@@ -1,3 +1,427 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+from django.conf import settings
+from api.views import UploadDocs
+from NLP.entityFormats import NESTED, LINKED, toLinkedEntities, toNestedEntities, convertEntities, validateLinkedEntities
+from NLP.entityPostProcessor import EntityPostProcessor
+from NLP.inferenceProtocol import HEADER, MessageTooLarge, receiveMessage, sendMessage
+from NLP.inferenceServer import InferenceServer
+from NLP.entityMatchers import EntityMatchers
+from NLP.icdKeywordMatcher import IcdKeywordMatcher
+from NLP.languageProcessor import LanguageProcessor
+from NLP.columnarFormat import getTokenOffsets
+from NLP.phraseNormalizer import PhraseNormalizer
+from NLP.instrumentation import StageTimings
+from NLP.matcherPatterns import Labels
+from NLP.sectionizer import Sectionizer
+from NLP.sentencizer import Sentencizer
+from NLP.spanRecord import SpanRecord, toDicts
+from benchmarks.sentencizer import legacySentenceBoundary
+from ICD.tests import FIXTURE_INDEX, writeIndex
+from spacy.tokens import Doc
+from types import SimpleNamespace
+import json
+import numpy
+import os
+import random
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import spacy
 
-# Create your tests here.
+
+def makeChain(tag, *spans):
+    '''Returns the parts of a multi-part ICD entity with the given (start, end) spans, linked by 'next' in order.'''
+    parts = [SpanRecord(start, end, tag=tag, type=Labels.ICD_KEYWORD_LABEL) for start, end in spans]
+    for part, nextPart in zip(parts, parts[1:]):
+        part.next = nextPart
+    return parts
+
+
+class EntityPostProcessorTest(SimpleTestCase):
+
+    def makeProcessor(self, entities, sections=[], sentences=[]):
+        return EntityPostProcessor(sections, sentences, entities, Labels.ICD_KEYWORD_LABEL)
+
+    def test_standaloneEntityEqualToChainTailIsHead(self):
+        chain = makeChain('I46.8', (0, 5), (10, 15))
+        standalone = makeChain('I46.8', (10, 15))
+        entities = chain + standalone
+
+        processor = self.makeProcessor(entities)
+        self.assertEqual(processor.buildHeadItemsList(entities), [chain[0], standalone[0]])
+        self.assertEqual(processor.processICD(False, 2, []), chain + standalone)
+
+    def test_equalSpanSetsAreNotNested(self):
+        first = makeChain('I46.8', (0, 5), (10, 15))
+        second = makeChain('I46.9', (10, 15), (0, 5))
+
+        processor = self.makeProcessor(first + second)
+        self.assertEqual(processor.filterNestedItems([first[0], second[0]]), [first[0], second[0]])
+
+    def test_properSupersetIsDropped(self):
+        longer = makeChain('I46.8', (0, 5), (10, 15), (20, 25))
+        shorter = makeChain('I46.9', (0, 5), (20, 25))
+
+        # the longer chain is compared first whatever the order of the list
+        processor = self.makeProcessor(shorter + longer)
+        self.assertEqual(processor.filterNestedItems([shorter[0], longer[0]]), [longer[0]])
+        self.assertEqual(processor.processICD(True, 2, []), longer)
+
+    def test_chainsSharingSpans(self):
+        longest = makeChain('A', (0, 5), (10, 15), (20, 25))
+        nested = makeChain('B', (0, 5), (10, 15))
+        overlapping = makeChain('C', (10, 15), (30, 35))
+        nestedTail = makeChain('D', (20, 25))
+        equal = makeChain('E', (10, 15), (30, 35))
+        heads = [nested[0], overlapping[0], longest[0], nestedTail[0], equal[0]]
+
+        # in order of link depth, then of the list
+        processor = self.makeProcessor(nested + overlapping + longest + nestedTail + equal)
+        self.assertEqual(processor.filterNestedItems(heads), [longest[0], overlapping[0], equal[0]])
+
+    def test_filterNestedItemsMatchesPairwiseComparison(self):
+        rng = random.Random(0)
+        spans = [(i * 10, i * 10 + 5) for i in range(6)]
+
+        for _ in range(200):
+            heads = [makeChain('X', *rng.sample(spans, rng.randint(1, 4)))[0] for _ in range(rng.randint(1, 8))]
+            processor = self.makeProcessor([])
+            self.assertEqual(processor.filterNestedItems(heads), self.filterNestedPairwise(processor, heads))
+
+    def filterNestedPairwise(self, processor, heads):
+        '''Nested items removed by comparing every pair, as before the span index.'''
+        sortedHeads = sorted(heads, key=processor._getLinkDepth, reverse=True)
+        removed = set()
+        for i, head in enumerate(sortedHeads):
+            for j in range(i + 1, len(sortedHeads)):
+                if processor._getSpanSet(head) > processor._getSpanSet(sortedHeads[j]):
+                    removed.add(j)
+        return [head for i, head in enumerate(sortedHeads) if i not in removed]
+
+
+class SectionizerTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sectionizer = Sectionizer(os.path.join(settings.BASE_DIR, 'NLP', 'sections.json'))
+        cls.aliases = sorted(set(alias for aliases in cls.sectionizer.sections.values() for alias in aliases))
+
+    def legacySectionMarkers(self, text):
+        '''Section endings and headers found with a separate re.finditer() per ending string and per alias and header form, as before the combined expression.'''
+        text = text.lower()
+        endings = [match.start() for ending in self.sectionizer.endingStrings for match in re.finditer(ending, text)]
+
+        headers = []
+        for alias in self.aliases:
+            for expression in ('\\n\\**' + alias + '\\**.?\\n', '\\n' + alias + ':+\\s*'):
+                for match in re.finditer(expression, text):
+                    start, end = match.span()
+                    headers.append((start, end, text[start+1:end-1]))
+        headers.sort()
+
+        return endings, self.sectionizer._cleanSectionHeadings(headers)
+
+    def assertSameAsLegacy(self, text):
+        self.assertEqual(self.sectionizer._findSectionMarkers(SimpleNamespace(text=text)), self.legacySectionMarkers(text))
+
+    def test_repeatedHeaderOnConsecutiveLines(self):
+        text = "Patient seen today.\n*plan at discharge\n*PLAN AT DISCHARGE**\nContinue current medications.\n"
+        self.assertSameAsLegacy(text)
+
+        sections = self.sectionizer.getSections(SimpleNamespace(text=text))
+        self.assertEqual([section['start'] for section in sections], [19])
+
+    def test_headerForms(self):
+        self.assertSameAsLegacy("\nHistory of present illness:\nCough for 3 days.\n**Plan**\nRest.\nPlan: fluids\n")
+        self.assertSameAsLegacy("\nmedications:\nmedications:: none\nElectronically signed by Dr. A\n")
+
+    def test_randomNotes(self):
+        rng = random.Random(0)
+        fillers = ['Patient is stable.', 'No acute distress.', 'dictated by: J. Smith', 'electronically signed by someone', '']
+
+        for _ in range(200):
+            lines = []
+            for _ in range(rng.randint(1, 12)):
+                alias = rng.choice(self.aliases)
+                form = rng.random()
+                if form < 0.3:
+                    line = '%s%s%s' % ('*' * rng.randint(0, 2), alias, '*' * rng.randint(0, 2))
+                elif form < 0.6:
+                    line = '%s:%s' % (alias, rng.choice(['', ' ', ': ', ' text']))
+                else:
+                    line = rng.choice(fillers)
+                lines.append(line.upper() if rng.random() < 0.3 else line)
+                if rng.random() < 0.2:
+                    # the same header again on the next line
+                    lines.append(lines[-1])
+
+            self.assertSameAsLegacy('\n' + '\n'.join(lines) + '\n')
+
+
+class SentencizerTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.nlp = spacy.blank('en')
+        cls.sentencizer = Sentencizer(cls.nlp)
+
+    def makeDoc(self, words):
+        return Doc(self.nlp.vocab, words=words, spaces=[False] * len(words))
+
+    def getSentenceStarts(self, words):
+        '''Returns the sentence start values of the tokens of words after the sentence boundary rules, with those of the previous rules.'''
+        doc = self.sentencizer._sentence_boundary(self.makeDoc(words))
+        legacyDoc = legacySentenceBoundary(self.makeDoc(words))
+        self.assertEqual([token.is_sent_start for token in doc], [token.is_sent_start for token in legacyDoc])
+        return [token.is_sent_start for token in doc]
+
+    def getSentences(self, words):
+        doc = self.sentencizer._sentence_boundary(self.makeDoc(words))
+        return [[token.text for token in sentence] for sentence in doc.sents]
+
+    def test_delimiters(self):
+        words = ['Cough', '.', 'Fever', '?', 'Rest', '!', 'Plan', '\n\n', 'Fluids', '\n', 'daily']
+        self.getSentenceStarts(words)
+        self.assertEqual(self.getSentences(words), [['Cough', '.'], ['Fever', '?'], ['Rest', '!'], ['Plan', '\n\n'], ['Fluids', '\n', 'daily']])
+
+    def test_numberedList(self):
+        words = ['Meds', '\n', '1', '.', 'Aspirin', '\n', '2', '.', 'Metformin']
+        self.assertEqual(self.getSentenceStarts(words), [True, False, True, False, False, False, True, False, False])
+
+    def test_numberedListOnSecondToLastToken(self):
+        words = ['Meds', '\n', '1', '.']
+        self.assertEqual(self.getSentenceStarts(words), [True, False, True, False])
+        self.assertEqual(self.getSentences(words), [['Meds', '\n'], ['1', '.']])
+
+    def test_numberWithoutLineBreak(self):
+        words = ['Take', '2', '.', 'Daily']
+        self.assertEqual(self.getSentenceStarts(words), [True, False, False, True])
+
+    def test_numberedListOnFirstToken(self):
+        # the token before the first token is the last one, as doc[-1] in the previous rules
+        self.getSentenceStarts(['1', '.', 'Cough', '\n'])
+        self.getSentenceStarts(['1', '.', 'Cough'])
+
+    def test_shortDocs(self):
+        self.assertEqual(self.getSentenceStarts(['Cough']), [True])
+        self.assertEqual(self.getSentenceStarts(['1', '.']), [True, False])
+        self.assertEqual(self.getSentenceStarts([]), [])
+
+    def test_randomSequences(self):
+        rng = random.Random(0)
+        vocabulary = ['1', '2', '10', '.', '?', '!', '\n', '\n\n', '\n\n\n', 'text\n', 'cough', 'fever', '3.5']
+
+        for _ in range(500):
+            self.getSentenceStarts([rng.choice(vocabulary) for _ in range(rng.randint(1, 12))])
+
+
+class EntityFormatsTest(SimpleTestCase):
+
+    def makeEntities(self):
+        '''Nested entities of two chains and a single entity, as returned by LanguageProcessor.'''
+        return toDicts(makeChain('I46.8', (0, 5), (10, 15), (20, 25)) + makeChain('E11', (30, 35), (40, 45)) + makeChain('I10', (50, 55)))
+
+    def test_toLinkedEntities(self):
+        linked = toLinkedEntities(self.makeEntities())
+
+        self.assertEqual([entity['id'] for entity in linked], list(range(6)))
+        self.assertEqual([entity.get('next') for entity in linked], [1, 2, None, 4, None, None])
+        self.assertEqual(linked[0], {'id': 0, 'start': 0, 'end': 5, 'tag': 'I46.8', 'type': Labels.ICD_KEYWORD_LABEL, 'next': 1})
+        validateLinkedEntities(linked)
+
+    def test_roundTrip(self):
+        entities = self.makeEntities()
+        nested = toNestedEntities(toLinkedEntities(entities))
+
+        self.assertEqual(nested, entities)
+        self.assertIs(nested[0]['next'], nested[1])
+        self.assertEqual(convertEntities(convertEntities(entities, NESTED, LINKED), LINKED, NESTED), entities)
+        self.assertIs(convertEntities(entities, NESTED, NESTED), entities)
+
+    def test_roundTripOfJsonCopies(self):
+        # nested entities parsed from json are copies, the next entities are found by their content and the rest of their chain
+        entities = self.makeEntities()
+        copies = json.loads(json.dumps(entities))
+
+        self.assertEqual(toLinkedEntities(copies), toLinkedEntities(entities))
+        self.assertEqual(toNestedEntities(toLinkedEntities(copies)), entities)
+
+    def test_equalPartsOfDifferentChains(self):
+        tail = makeChain('I46.8', (20, 25))
+        chain = makeChain('I46.8', (0, 5), (10, 15), (20, 25))
+        single = makeChain('I46.8', (10, 15))
+        copies = json.loads(json.dumps(toDicts(single + chain + tail)))
+
+        linked = toLinkedEntities(copies)
+        self.assertEqual([entity.get('next') for entity in linked], [None, 2, 3, None, None])
+        self.assertEqual(toNestedEntities(linked), copies)
+
+    def test_nextMissingFromList(self):
+        entities = self.makeEntities()[:1]
+        linked = toLinkedEntities(entities)
+
+        self.assertEqual([entity['start'] for entity in linked], [0, 10, 20])
+        validateLinkedEntities(linked)
+
+    def test_validateRejectsDanglingNext(self):
+        with self.assertRaisesRegex(ValueError, 'not the id of an entity'):
+            validateLinkedEntities([{'id': 0, 'next': 1}])
+        with self.assertRaisesRegex(ValueError, 'not the id of an entity'):
+            validateLinkedEntities([{'id': 0, 'next': '1'}, {'id': 1}])
+
+    def test_validateRejectsCycles(self):
+        with self.assertRaisesRegex(ValueError, 'Circular'):
+            validateLinkedEntities([{'id': 0, 'next': 0}])
+        with self.assertRaisesRegex(ValueError, 'Circular'):
+            validateLinkedEntities([{'id': 0, 'next': 1}, {'id': 1, 'next': 2}, {'id': 2, 'next': 1}])
+
+    def test_validateRejectsDuplicateAndMissingIds(self):
+        with self.assertRaisesRegex(ValueError, 'Duplicate'):
+            validateLinkedEntities([{'id': 0}, {'id': 0}])
+        for entity in ({}, {'id': '0'}, {'id': True}, {'id': 1.0}):
+            with self.assertRaisesRegex(ValueError, 'no integer id'):
+                validateLinkedEntities([entity])
+        with self.assertRaises(ValueError):
+            validateLinkedEntities({'id': 0})
+
+    def test_validateAcceptsSharedTails(self):
+        # chains may join, as where a head's chain continues into another chain
+        validateLinkedEntities([{'id': 5, 'next': 1}, {'id': 1, 'next': 2}, {'id': 2}, {'id': 0, 'next': 1}, {'id': 7}])
+
+
+class UploadDocsTest(SimpleTestCase):
+
+    def test_debugOutputWithNlpDisabled(self):
+        docs = [('first note', {'filename': 'a.txt'}), ('', {'error': 'Line 2: invalid document'}), ('second note', {'filename': 'b.txt'})]
+
+        with self.settings(ENABLE_NLP=False):
+            results = list(UploadDocs()._processDocs(iter(docs), 32, True, NESTED))
+
+        self.assertEqual(results[1], {'error': 'Line 2: invalid document'})
+        self.assertEqual([(result['filename'], result['Entities']) for result in results[::2]], [('a.txt', []), ('b.txt', [])])
+        self.assertEqual([result['Sentences'] for result in results[::2]], [None, None])
+
+
+class InferenceServerTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.socketPath = os.path.join(cls.directory, 'nlp.sock')
+        langProcessor = SimpleNamespace(pipelineVersion='test', analyzeTexts=lambda texts, **kwargs: [{'entities': []} for _ in texts])
+        cls.server = InferenceServer(langProcessor, 'unix:' + cls.socketPath, maxMessageSize=100)
+        threading.Thread(target=cls.server.serveForever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(10)
+        sock.connect(self.socketPath)
+        self.addCleanup(sock.close)
+        return sock
+
+    def test_maxSize(self):
+        # ["xxxxxxxxxx"] is 14 bytes
+        for maxSize, fits in ((13, False), (14, True), (None, True)):
+            first, second = socket.socketpair()
+            self.addCleanup(first.close)
+            self.addCleanup(second.close)
+
+            sendMessage(first, ['x' * 10])
+            if fits:
+                self.assertEqual(receiveMessage(second, maxSize=maxSize), ['x' * 10])
+            else:
+                with self.assertRaises(MessageTooLarge):
+                    receiveMessage(second, maxSize=maxSize)
+
+    def test_largeMessageClosesConnection(self):
+        sock = self.connect()
+        sendMessage(sock, {'op': 'version'})
+        self.assertEqual(receiveMessage(sock), {'pipelineVersion': 'test'})
+
+        # only the length prefix is sent, the server must not wait for the message
+        sock.sendall(HEADER.pack(1 << 30))
+        self.assertRegex(receiveMessage(sock)['error'], 'larger than the maximum of 100 bytes')
+        self.assertIsNone(receiveMessage(sock))
+
+    def test_invalidMessageKeepsConnection(self):
+        sock = self.connect()
+        data = b'{not json'
+        sock.sendall(HEADER.pack(len(data)) + data)
+        self.assertRegex(receiveMessage(sock)['error'], '^Invalid message')
+
+        sendMessage(sock, {'op': 'analyze', 'texts': ['note']})
+        self.assertEqual(receiveMessage(sock), {'results': [{'entities': []}], 'pipelineVersion': 'test'})
+
+
+class PartMemoTest(SimpleTestCase):
+    '''Matches of document parts are memoized by their text and token boundaries, matching must not read other token attributes.'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.mkdtemp()
+        try:
+            indexPath = os.path.join(directory, 'icd_index.csv')
+            writeIndex(indexPath, FIXTURE_INDEX)
+            icdKwMatcher = IcdKeywordMatcher(indexPath)
+        finally:
+            shutil.rmtree(directory)
+
+        cls.nlp = spacy.blank('en')
+        normalizationDict = {'heart attack': 'cardiac arrest', 'hypertensive': 'hypertension'}
+        bundle = {
+            'icdKeywordPatterns': [[phrase] for phrase in sorted(set(row[3] for row in FIXTURE_INDEX))] + [['cardiac', 'arrest']],
+            'normalizationDict': normalizationDict,
+            'normalizationPatterns': [phrase.split() for phrase in normalizationDict],
+        }
+
+        # a LanguageProcessor with only the matchers of parts, built without the Spacy model and knowledge files
+        cls.langProcessor = LanguageProcessor.__new__(LanguageProcessor)
+        cls.langProcessor.pipelineVersion = 'test'
+        cls.langProcessor.icdKwMatcher = icdKwMatcher
+        cls.langProcessor.entityMatcher = EntityMatchers(cls.nlp, None, bundle=bundle)
+        cls.langProcessor.phraseNormalizer = PhraseNormalizer(cls.nlp, None, None, bundle=bundle)
+
+    def makeDoc(self, words, rng):
+        '''Returns a doc of words with random tags, lemmas and dependencies.'''
+        doc = Doc(self.nlp.vocab, words=words)
+        for token in doc:
+            token.tag_ = rng.choice(['NN', 'JJ', 'VBD'])
+            token.lemma_ = rng.choice(['heart', 'arrest', 'attack', token.text])
+            token.dep_ = rng.choice(['amod', 'nsubj', 'ROOT'])
+        return doc
+
+    def test_matchesOnlyDependOnTokenTexts(self):
+        rng = random.Random(0)
+        words = ['sudden', 'heart', 'attack', 'and', 'hypertensive', 'secondary', 'hypertension', ',', 'cholera']
+
+        for phraseNorm in (False, True):
+            for outputDetail in (False, True):
+                matches = [self.langProcessor._matchPart(self.makeDoc(words, rng), phraseNorm, StageTimings(), outputDetail=outputDetail)
+                           for _ in range(5)]
+                matchDicts = [(toDicts(keywords), toDicts(entities)) for keywords, entities in matches]
+
+                self.assertTrue(matchDicts[0][1])
+                for other in matchDicts[1:]:
+                    self.assertEqual(other, matchDicts[0])
+
+    def test_memoKey(self):
+        doc = self.makeDoc(['heart', 'attack', 'x'], random.Random(0))
+        starts, _ = getTokenOffsets(doc)
+        key = self.langProcessor._getPartMemoKey(doc.text, starts, True)
+
+        self.assertEqual(self.langProcessor._getPartMemoKey(doc.text, starts.copy(), True), key)
+        self.assertNotEqual(self.langProcessor._getPartMemoKey(doc.text, starts, False), key)
+        self.assertNotEqual(self.langProcessor._getPartMemoKey(doc.text, numpy.array([0, 6, 9, 12], dtype=starts.dtype), True), key)
+        self.assertNotEqual(self.langProcessor._getPartMemoKey(doc.text, starts, True, outputDetail=True), key)
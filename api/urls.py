@@ -5,6 +5,11 @@ urlpatterns = [
     path('createUser/', views.CreateUser.as_view(), name="create-user"),
     path('validateToken/', views.ValidateToken.as_view(), name="validate-token"),
     path('uploadDoc/', views.UploadDoc.as_view(), name="upload-doc"),
+    path('reanalyzeDoc/', views.ReanalyzeDoc.as_view(), name="reanalyze-doc"),
+    path('uploadDocs/', views.UploadDocs.as_view(), name="upload-docs"),
+    path('metrics/', views.Metrics.as_view(), name="metrics"),
+    path('resultCacheStats/', views.ResultCacheStats.as_view(), name="result-cache-stats"),
+    path('jobs/<uuid:jobId>/', views.JobStatus.as_view(), name="job-status"),
     path('uploadAnnot/', views.UploadAnnotation.as_view(), name="upload-annot"),
     path('getAllMyAnnots/',
          views.GetAllAnnotationsByCurrentUserWithPagination.as_view(), name="get-all-my-annot"),
@@ -9,15 +9,26 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import render, get_object_or_404
 from django.db.models.functions import Length
 from itertools import combinations
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.forms.models import model_to_dict
 import json
+import hashlib
+import uuid
+from urllib.parse import urlparse
 from django.db.models import Q
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from users.models import CustomUser
 from django.contrib.auth.hashers import make_password
 from annotations.models import Annotation
+from jobs.models import AnalysisJob
+from documents.models import ParsedDocument
+from jobs.workerPool import submitJob, failIfStale
+from api.resultCache import ResultCache
+from Utility.profiling import RequestProfiler
 from NLP.languageProcessor import LanguageProcessor
+from NLP.inferenceClient import InferenceClient
+from NLP.instrumentation import metrics as nlpMetrics
+from NLP.entityFormats import NESTED, LINKED, ENTITY_FORMATS, toLinkedEntities, convertEntities, validateLinkedEntities
 from django.contrib.postgres.fields.jsonb import KeyTextTransform, KeyTransform
 from ICD.models import TreeCode, Code
 from django.conf import settings
@@ -95,12 +106,52 @@ class ValidateToken(APIView, permissions.BasePermission):
         return HttpResponse(status=200)
 
 
+def getTextHash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+resultCache = ResultCache(settings.NLP_RESULT_CACHE_BYTES, settings.NLP_RESULT_CACHE_DIR)
+
+
+def getEntityFormat(request):
+    """Returns the entity format requested by the entityFormat query parameter, nested by default. Raises ValueError for unknown formats."""
+
+    entityFormat = request.GET.get('entityFormat', NESTED)
+    if entityFormat not in ENTITY_FORMATS:
+        raise ValueError("entityFormat must be one of %s." % ", ".join("'%s'" % name for name in ENTITY_FORMATS))
+    return entityFormat
+
+
+def getColumnarOptions(request):
+    """
+    Returns the analysis keyword arguments of the columnar query parameter, which applies to the debug output of sections, sentences
+    and tokens: 'true' for the columnar format of NLP/columnarFormat.py, 'delta' for the columnar format with delta-encoded positions.
+    """
+
+    columnarParam = request.GET.get('columnar')
+
+    if columnarParam and columnarParam.lower() == 'true':
+        return {'columnar': True}
+    if columnarParam and columnarParam.lower() == 'delta':
+        return {'columnar': True, 'deltaEncoding': True}
+    return {}
+
+
 class UploadDoc(APIView):
     """Uploads document for processing"""
     permission_classes = [permissions.IsAuthenticated]
 
+    analysisParams = {'scope': 'section', 'removeNested': True, 'maxSentDist': 2, 'sectionsIgnored': ['fam_hist'], 'phraseNorm': True}
+
     if settings.ENABLE_NLP:
-        langProcessor = LanguageProcessor()
+        if settings.NLP_INFERENCE_SERVER:
+            # analysis runs in the separate NLP inference server, see runNlpServer command
+            langProcessor = InferenceClient(settings.NLP_INFERENCE_SERVER)
+        else:
+            langProcessor = LanguageProcessor()
+
+    # parsed documents are saved for ReanalyzeDoc, snapshots cannot be taken through the inference server
+    storeSnapshots = settings.NLP_STORE_SNAPSHOTS and not settings.NLP_INFERENCE_SERVER
 
     def post(self, request, format=None, **kwargs):
 
@@ -121,34 +172,114 @@ class UploadDoc(APIView):
         else:
             outputDetail = False
 
-        if settings.ENABLE_NLP:
-            docSections, docSentences, docTokens, docEntities = self._processDoc(docText, outputDetail=outputDetail)
+        try:
+            entityFormat = getEntityFormat(request)
+        except ValueError as e:
+            return HttpResponse(json.dumps({"message": str(e)}), status=400)
+
+        columnarOptions = getColumnarOptions(request)
+        profileParam = request.GET.get('profile')
+
+        if profileParam and profileParam.lower() == 'true':
+            if request.user.role != "admin":
+                return HttpResponse(json.dumps({"message": "Profiling is only available to admins."}), status=403)
+
+            profileId = uuid.uuid4().hex
+            with RequestProfiler(settings.NLP_PROFILE_DIR, profileId):
+                obj = self._analyzeDoc(docFilename, docText, outputDetail, debugOutput, entityFormat, useCache=False, **columnarOptions)
+
+            response = Response(obj)
+            response['X-Profile-Id'] = profileId
+            return response
+
+        asyncParam = request.GET.get('async')
+
+        if asyncParam and asyncParam.lower() == 'true':
+            callbackUrl = doc.get("callbackUrl")
+            if callbackUrl and urlparse(callbackUrl).hostname not in settings.NLP_JOB_CALLBACK_HOSTS:
+                return HttpResponse(json.dumps({"message": "Callback host not allowed."}), status=400)
+
+            job = AnalysisJob.objects.create(user=request.user, filename=docFilename, callbackUrl=callbackUrl)
+            submitJob(job.id, lambda: self._analyzeDoc(docFilename, docText, outputDetail, debugOutput, entityFormat, **columnarOptions))
+            return Response({"jobId": str(job.id), "status": job.status}, status=202)
+
+        return Response(self._analyzeDoc(docFilename, docText, outputDetail, debugOutput, entityFormat, **columnarOptions))
+
+    def _analyzeDoc(self, filename, text, outputDetail, debugOutput, entityFormat=NESTED, useCache=True, **kwargs):
+        """
+        Runs NLP on the document if enabled, returns the response object. Results are cached by document content.
+        kwargs are passed to the analysis of debug and uncached requests, e.g. columnar options, cached results have no debug output.
+        """
+
+        if not settings.ENABLE_NLP:
+            return self._makeJSON(filename, [], entityFormat=entityFormat)
+
+        if debugOutput or not useCache:
+            # debug output reports the timings of this analysis, not of a cached one
+            docSections, docSentences, docTokens, docEntities, docStats = self._processDoc(text, outputDetail=outputDetail, **kwargs)
             if debugOutput:
-                return Response(self._makeJSON(docFilename, docEntities, sentences=docSentences, tokens=docTokens, sections=docSections))
+                return self._makeJSON(filename, docEntities, sentences=docSentences, tokens=docTokens, sections=docSections, stats=docStats,
+                                      entityFormat=entityFormat)
             else:
-                return Response(self._makeJSON(docFilename, docEntities))
-        else:
-            return Response(self._makeJSON(docFilename, []))
+                return self._makeJSON(filename, docEntities, entityFormat=entityFormat)
+
+        # results are cached in the linked entity format, which does not copy entity chains at every link
+        pipelineVersion = UploadDoc.langProcessor.pipelineVersion
+        cacheKey = ResultCache.makeKey(text, pipelineVersion, outputDetail=outputDetail, entityFormat=LINKED, **UploadDoc.analysisParams)
+        obj = resultCache.get(cacheKey)
+
+        if obj is None:
+            docSections, docSentences, docTokens, docEntities, docStats = self._processDoc(text, outputDetail=outputDetail)
+            obj = self._makeJSON(filename, docEntities, entityFormat=LINKED)
+            if UploadDoc.langProcessor.pipelineVersion != pipelineVersion:
+                # analyzed by an inference server restarted with another version
+                cacheKey = ResultCache.makeKey(text, UploadDoc.langProcessor.pipelineVersion, outputDetail=outputDetail, entityFormat=LINKED,
+                                               **UploadDoc.analysisParams)
+            resultCache.put(cacheKey, obj)
+
+        if entityFormat != LINKED:
+            obj["Entities"] = convertEntities(obj["Entities"], LINKED, entityFormat)
+            del obj["entityFormat"]
+
+        # the same document may be uploaded under another name
+        obj["filename"] = filename
+        return obj
 
     def _processDoc(self, text, **kwargs):
-        """Runs NLP to process document, returns document sections, sentences, tokens, and entities."""
+        """Runs NLP to process document, returns document sections, sentences, tokens, entities, and stats (stage timings)."""
 
         results = UploadDoc.langProcessor.analyzeText(
-            text, scope='section', removeNested=True, maxSentDist=2, sectionsIgnored=['fam_hist'], phraseNorm=True, **kwargs)
+            text, **UploadDoc.analysisParams, snapshot=UploadDoc.storeSnapshots, **kwargs)
+
+        if 'snapshot' in results:
+            self._saveSnapshot(text, results.pop('snapshot'))
 
         entities = results['entities']
         sections = results['sections']
         sentences = results['sentences']
         tokens = results['tokens']
+        stats = results['stats']
 
-        return (sections, sentences, tokens, entities)
+        return (sections, sentences, tokens, entities, stats)
+
+    def _saveSnapshot(self, text, snapshot):
+        """Saves the parsed document for ReanalyzeDoc, unless already saved."""
+
+        try:
+            ParsedDocument.objects.get_or_create(
+                textHash=getTextHash(text), pipelineVersion=UploadDoc.langProcessor.pipelineVersion, defaults={'snapshot': snapshot})
+        except IntegrityError:
+            # saved at the same time by another request
+            pass
 
     def _makeJSON(self, filename, entities, **kwargs):
-        """Makes a serialized JSON string."""
+        """Makes a serialized JSON string. Entities are given in the nested format, and returned in the entityFormat keyword argument's."""
 
         sentences = kwargs.get("sentences")
         tokens = kwargs.get("tokens")
         sections = kwargs.get("sections")
+        stats = kwargs.get("stats")
+        entityFormat = kwargs.get("entityFormat", NESTED)
 
         obj = {
             "filename": filename,
@@ -161,12 +292,215 @@ class UploadDoc(APIView):
             obj['Sentences'] = sentences
         if tokens:
             obj['Tokens'] = tokens
-        if sections:
+        if sections and type(sections) == dict:
+            # columnar sections cannot be listed with the entities
+            obj['Sections'] = sections
+        elif sections:
             obj['Entities'] = entities + sections
+        if stats:
+            obj['Stats'] = stats
+        if entityFormat == LINKED:
+            obj['Entities'] = toLinkedEntities(obj['Entities'])
+            obj['entityFormat'] = LINKED
 
         return obj
 
 
+class ReanalyzeDoc(UploadDoc):
+    """
+    Analyzes a document again with other analysis parameters: scope, removeNested, maxSentDist, sectionsIgnored and phraseNorm
+    given in the request body, defaulting to those of UploadDoc. The document parsed when it was uploaded is reused, so only
+    the matching and post-processing stages run. Documents without a saved parse are analyzed in full, and their parse saved.
+    """
+
+    def post(self, request, format=None, **kwargs):
+        doc = request.data
+        docFilename = doc["filename"]
+        docText = doc["content"]
+        debugParam = request.GET.get('debug')
+        outputDetailParam = request.GET.get('outputDetail')
+
+        debugOutput = bool(debugParam and debugParam.lower() == 'true')
+        outputDetail = bool(outputDetailParam and outputDetailParam.lower() == 'true')
+        columnarOptions = getColumnarOptions(request)
+
+        try:
+            params = self._getAnalysisParams(doc)
+            entityFormat = getEntityFormat(request)
+        except ValueError as e:
+            return HttpResponse(json.dumps({"message": str(e)}), status=400)
+
+        if not settings.ENABLE_NLP:
+            return Response(self._makeJSON(docFilename, [], entityFormat=entityFormat))
+
+        results = None
+
+        if UploadDoc.storeSnapshots:
+            parsedDoc = ParsedDocument.objects.filter(
+                textHash=getTextHash(docText), pipelineVersion=UploadDoc.langProcessor.pipelineVersion).first()
+
+            if parsedDoc:
+                results = UploadDoc.langProcessor.analyzeSnapshot(
+                    bytes(parsedDoc.snapshot), **params, outputDetail=outputDetail, **columnarOptions)
+
+        if results is None:
+            results = UploadDoc.langProcessor.analyzeText(
+                docText, **params, snapshot=UploadDoc.storeSnapshots, outputDetail=outputDetail, **columnarOptions)
+
+            if 'snapshot' in results:
+                self._saveSnapshot(docText, results.pop('snapshot'))
+
+        if debugOutput:
+            return Response(self._makeJSON(docFilename, results['entities'], sentences=results['sentences'], tokens=results['tokens'],
+                                           sections=results['sections'], stats=results['stats'], entityFormat=entityFormat))
+        else:
+            return Response(self._makeJSON(docFilename, results['entities'], entityFormat=entityFormat))
+
+    def _getAnalysisParams(self, doc):
+        """Returns the analysis parameters of the request body, raises ValueError for invalid values."""
+
+        params = dict(UploadDoc.analysisParams)
+
+        for key in params:
+            if key in doc:
+                params[key] = doc[key]
+
+        if params['scope'] not in ('document', 'section', 'sentence'):
+            raise ValueError("scope must be one of 'document', 'section' or 'sentence'.")
+        if type(params['removeNested']) != bool or type(params['phraseNorm']) != bool:
+            raise ValueError("removeNested and phraseNorm must be true or false.")
+        if type(params['maxSentDist']) != int:
+            raise ValueError("maxSentDist must be an integer.")
+        if type(params['sectionsIgnored']) != list or not all(type(tag) == str for tag in params['sectionsIgnored']):
+            raise ValueError("sectionsIgnored must be a list of section tags.")
+
+        return params
+
+
+class ResultCacheStats(APIView):
+    """Returns hit and miss counters of this process's document result cache."""
+
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request, format=None, **kwargs):
+        return Response(resultCache.getStats())
+
+
+class Metrics(APIView):
+    """Returns this process's NLP latency, stage duration, document size and entity count histograms, and result cache counters, in Prometheus text format."""
+
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request, format=None, **kwargs):
+        lines = nlpMetrics.render()
+
+        cacheStats = resultCache.getStats()
+        lines.append("# HELP autocoder_result_cache_lookups_total Lookups of the uploadDoc result cache.")
+        lines.append("# TYPE autocoder_result_cache_lookups_total counter")
+        for result, counter in (('hit', 'hits'), ('disk_hit', 'diskHits'), ('miss', 'misses')):
+            lines.append('autocoder_result_cache_lookups_total{result="%s"} %d' % (result, cacheStats[counter]))
+        lines.append("# HELP autocoder_result_cache_bytes Size of the in-process uploadDoc result cache.")
+        lines.append("# TYPE autocoder_result_cache_bytes gauge")
+        lines.append("autocoder_result_cache_bytes %d" % cacheStats['bytes'])
+
+        return HttpResponse("\n".join(lines) + "\n", content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class UploadDocs(UploadDoc):
+    """
+    Uploads a newline-delimited json stream of {filename, format, content} documents for processing.
+    Responds with a newline-delimited json stream of one result per document, in the same order, written as each document is done.
+    Documents are read from the request and parsed in batches as the response is written, so memory does not grow with the number of documents.
+    """
+
+    def post(self, request, format=None, **kwargs):
+        debugParam = request.GET.get('debug')
+        outputDetailParam = request.GET.get('outputDetail')
+        batchSizeParam = request.GET.get('batchSize')
+
+        debugOutput = bool(debugParam and debugParam.lower() == 'true')
+        outputDetail = bool(outputDetailParam and outputDetailParam.lower() == 'true')
+
+        if batchSizeParam and not (batchSizeParam.isdigit() and int(batchSizeParam) >= 1):
+            return HttpResponse(json.dumps({"message": "batchSize must be a positive integer."}), status=400)
+        batchSize = int(batchSizeParam) if batchSizeParam else 32
+
+        try:
+            entityFormat = getEntityFormat(request)
+        except ValueError as e:
+            return HttpResponse(json.dumps({"message": str(e)}), status=400)
+
+        # request.data is never accessed, it would read the whole stream into memory
+        results = self._processDocs(self._readDocs(request._request), batchSize, debugOutput, entityFormat, outputDetail=outputDetail,
+                                    **getColumnarOptions(request))
+
+        return StreamingHttpResponse((json.dumps(result) + "\n" for result in results), content_type='application/x-ndjson')
+
+    def _readDocs(self, stream):
+        """Generator of (text, context) tuples read line by line from the request stream, context holds the filename or a parsing error."""
+
+        for lineNumber, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                doc = json.loads(line)
+                if not isinstance(doc["content"], str):
+                    raise TypeError("content must be a string")
+                yield (doc["content"], {"filename": doc.get("filename")})
+            except (ValueError, KeyError, TypeError) as e:
+                # an empty text keeps the error in order with the other results
+                yield ("", {"error": "Line %d: invalid document, %s" % (lineNumber, repr(e))})
+
+    def _processDocs(self, docs, batchSize, debugOutput, entityFormat, **kwargs):
+        """Generator of result objects, in the same format as UploadDoc, for a stream of (text, context) tuples."""
+
+        if settings.ENABLE_NLP:
+            analyzed = UploadDoc.langProcessor.analyzeTexts(
+                docs, batch_size=batchSize, as_tuples=True, **UploadDoc.analysisParams, **kwargs)
+        else:
+            analyzed = (({'entities': []}, context) for _, context in docs)
+
+        for results, context in analyzed:
+            if "error" in context:
+                yield context
+            elif debugOutput and settings.ENABLE_NLP:
+                # like UploadDoc, documents have no debug output while NLP is disabled
+                yield self._makeJSON(context["filename"], results['entities'], sentences=results['sentences'], tokens=results['tokens'],
+                                     sections=results['sections'], stats=results['stats'], entityFormat=entityFormat)
+            else:
+                yield self._makeJSON(context["filename"], results['entities'], entityFormat=entityFormat)
+
+
+class JobStatus(APIView):
+    """Returns the status of an asynchronous analysis job, and its results once done."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, jobId, format=None, **kwargs):
+        job = get_object_or_404(AnalysisJob, id=jobId)
+
+        if job.user_id != request.user.id and request.user.role != "admin":
+            raise Http404
+
+        failIfStale(job)
+
+        obj = {
+            "jobId": str(job.id),
+            "status": job.status,
+            "filename": job.filename,
+            "created": job.created,
+            "updated": job.updated,
+        }
+
+        if job.status == AnalysisJob.DONE:
+            obj["result"] = job.result
+        elif job.status == AnalysisJob.FAILED:
+            obj["error"] = job.error
+
+        return Response(obj)
+
+
 class UploadAnnotation(APIView):
     """Uploads annotations to backend to be saved."""
 
@@ -175,8 +509,17 @@ class UploadAnnotation(APIView):
     def post(self, request, format=None, **kwargs):
         annotations = request.data.copy()
 
+        if annotations.get('entityFormat', NESTED) not in ENTITY_FORMATS:
+            return HttpResponse(json.dumps({"message": "entityFormat must be one of %s." % ", ".join("'%s'" % name for name in ENTITY_FORMATS)}), status=400)
+
         self._cleanJSON(annotations)
 
+        if annotations.get('entityFormat') == LINKED and 'Entities' in annotations:
+            try:
+                validateLinkedEntities(annotations['Entities'])
+            except ValueError as e:
+                return HttpResponse(json.dumps({"message": str(e)}), status=400)
+
         newAnnotation, created = Annotation.objects.update_or_create(
             user=request.user,
             sessionId=annotations['sessionId'],
@@ -195,10 +538,10 @@ class UploadAnnotation(APIView):
 
     def _cleanJSON(self, annotations):
         """Cleans the JSON uploaded, remove any unwanted fields"""
-        allowed_keys = ['name', 'tagTemplates', 'Sections', 'Entities', 'Sentences', 'sessionId']
+        allowed_keys = ['name', 'tagTemplates', 'Sections', 'Entities', 'Sentences', 'sessionId', 'entityFormat']
         allowed_tagTemplate_attr = ['id', 'description', 'color', 'type']
         allowed_section_attr = ['start', 'end', 'type', 'tag']
-        allowed_entity_attr = ['start', 'end', 'type', 'tag', 'next']
+        allowed_entity_attr = ['id', 'start', 'end', 'type', 'tag', 'next']
         allowed_sentence_attr = ['start', 'end', 'tag']
 
         # Check the first level keys of the JSON object and delete keys not allowed
@@ -234,13 +577,26 @@ class UploadAnnotation(APIView):
 
 
 class GetAnnotationsByFilenameUser(APIView):
-    """Request annotations from backend that were previously saved by filename"""
+    """Request annotations from backend that were previously saved by filename, with entities in the format of the entityFormat parameter"""
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, filename, format=None, **kwargs):
 
+        try:
+            entityFormat = getEntityFormat(request)
+        except ValueError as e:
+            return HttpResponse(json.dumps({"message": str(e)}), status=400)
+
         annotations = Annotation.objects.filter(data__name=filename).filter(user=request.user)
         serializer = serializers.AnnotationSerializer(annotations, many=True)
+
+        # annotations are saved in the entity format they were uploaded in
+        for annotation in serializer.data:
+            data = annotation['data']
+            if 'Entities' in data:
+                data['Entities'] = convertEntities(data['Entities'], data.get('entityFormat', NESTED), entityFormat)
+                data['entityFormat'] = entityFormat
+
         return Response(serializer.data)
 
 
@@ -297,6 +653,11 @@ class ExportAnnotations(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, sessionId, format=None, **kwargs):
+        try:
+            entityFormat = getEntityFormat(request)
+        except ValueError as e:
+            return HttpResponse(json.dumps({"message": str(e)}), status=400)
+
         # filtering annotations from current session for specific user
         annotations = Annotation.objects.filter(user=request.user).filter(sessionId=sessionId)
         # Adding fields to objects based upon json (see GetAllAnnotationsByCurrentUserWithPagination for in depth explantion)
@@ -304,8 +665,9 @@ class ExportAnnotations(APIView):
         annotations = annotations.annotate(Sentences=KeyTransform('Sentences', 'data'))
         annotations = annotations.annotate(tagTemplates=KeyTransform('tagTemplates', 'data'))
         annotations = annotations.annotate(name=KeyTextTransform('name', 'data'))
+        annotations = annotations.annotate(entityFormat=KeyTextTransform('entityFormat', 'data'))
 
-        serializer = serializers.AnnotationSerializerForExporting(annotations, many=True)
+        serializer = serializers.AnnotationSerializerForExporting(annotations, many=True, context={'entityFormat': entityFormat})
         return Response(serializer.data)
 
 
@@ -315,14 +677,20 @@ class DownloadAnnotationsById(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, id, format=None, **kwargs):
+        try:
+            entityFormat = getEntityFormat(request)
+        except ValueError as e:
+            return HttpResponse(json.dumps({"message": str(e)}), status=400)
+
         annotations = Annotation.objects.filter(user=request.user).filter(id=id)
         # Adding fields to objects based upon json (see GetAllAnnotationsByCurrentUserWithPagination for in depth explantion)
         annotations = annotations.annotate(Entities=KeyTransform('Entities', 'data'))
         annotations = annotations.annotate(Sentences=KeyTransform('Sentences', 'data'))
         annotations = annotations.annotate(tagTemplates=KeyTransform('tagTemplates', 'data'))
         annotations = annotations.annotate(name=KeyTextTransform('name', 'data'))
+        annotations = annotations.annotate(entityFormat=KeyTextTransform('entityFormat', 'data'))
 
-        serializer = serializers.AnnotationSerializerForExporting(annotations, many=True)
+        serializer = serializers.AnnotationSerializerForExporting(annotations, many=True, context={'entityFormat': entityFormat})
         return Response(serializer.data)
 
 
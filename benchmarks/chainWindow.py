@@ -0,0 +1,74 @@
+'''
+Benchmark of document scope ICD matching and post-processing with a ChainWindow, which leaves out codes whose keywords are too many
+sentences apart, against building every code and removing them in EntityPostProcessor, on long synthetic notes.
+Checks that both produce the same entities.
+Uses NLP/icd_10_cm_index_clean.csv when available, otherwise a synthetic ICD index of the same layout.
+Run from the project root: python -m benchmarks.chainWindow
+'''
+from NLP.icdKeywordMatcher import IcdKeywordMatcher
+from NLP.entityPostProcessor import EntityPostProcessor, ChainWindow
+from NLP.matcherPatterns import Labels
+from NLP.spanRecord import SpanRecord, toDicts
+from benchmarks.icdKeywordMatcher import writeSyntheticIndex
+from benchmarks.spanRecords import makeNote
+import argparse
+import os
+import tempfile
+import timeit
+
+
+def run(matcher, note, maxSentDist, sectionsIgnored, useWindow):
+    '''Returns (entities, number of ICD annotations built) of a note.'''
+    matches, sentences, sections = note
+    keywordMatches = [SpanRecord(start, end, text=text, normalizedTo=normalizedTo, type=Labels.ICD_KEYWORD_LABEL)
+                      for start, end, text, normalizedTo in matches]
+
+    window = ChainWindow(sections, sentences, maxSentDist, sectionsIgnored) if useWindow else None
+    icdEntities = matcher.getIcdAnnotations(keywordMatches, True, window=window)
+    cleanIcdEntities = EntityPostProcessor(sections, sentences, icdEntities, Labels.ICD_KEYWORD_LABEL).processICD(
+        True, maxSentDist, sectionsIgnored)
+
+    return (toDicts(cleanIcdEntities), len(icdEntities))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 10000],
+                        help="Numbers of keyword matches per note.")
+    parser.add_argument('--max-sent-dist', type=int, default=2)
+    parser.add_argument('--sections-ignored', nargs='*', default=['fam_hist'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--index', default="NLP/icd_10_cm_index_clean.csv", help="ICD index csv file.")
+    args = parser.parse_args()
+
+    indexPath = args.index
+    if not os.path.isfile(indexPath):
+        indexPath = os.path.join(tempfile.mkdtemp(), 'synthetic_icd_index.csv')
+        writeSyntheticIndex(indexPath, 20000, args.seed)
+        print("ICD index not found, using synthetic index", indexPath)
+
+    matcher = IcdKeywordMatcher(indexPath)
+
+    print("%10s %10s %12s %12s %12s %12s %10s" % ('keywords', 'entities', 'built', 'built window',
+                                                   'full (ms)', 'window (ms)', 'speedup'))
+
+    for size in args.sizes:
+        note = makeNote(matcher.keywordPhrases, size, args.seed + size)
+
+        entities, built = run(matcher, note, args.max_sent_dist, args.sections_ignored, False)
+        windowEntities, windowBuilt = run(matcher, note, args.max_sent_dist, args.sections_ignored, True)
+        if entities != windowEntities:
+            raise AssertionError("Entities differ with the window for %d keywords" % size)
+
+        fullTime = min(timeit.repeat(lambda: run(matcher, note, args.max_sent_dist, args.sections_ignored, False),
+                                     number=1, repeat=args.repeat))
+        windowTime = min(timeit.repeat(lambda: run(matcher, note, args.max_sent_dist, args.sections_ignored, True),
+                                       number=1, repeat=args.repeat))
+
+        print("%10d %10d %12d %12d %12.2f %12.2f %9.1fx" % (size, len(entities), built, windowBuilt,
+                                                            fullTime * 1000, windowTime * 1000, fullTime / windowTime))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+'''
+Micro-benchmark of EntityMatchers.combineReplaceNormalizedPhrases() against the previous nested-scan merge, with synthetic spans.
+Run from the project root: python -m benchmarks.entityMatchers
+'''
+from NLP.entityMatchers import EntityMatchers
+from NLP.matcherPatterns import Labels
+from NLP.spanRecord import SpanRecord
+import argparse
+import copy
+import random
+import spacy
+import timeit
+
+
+def legacyCombineReplaceNormalizedPhrases(normPhrases, phrases):
+    '''The nested next() scan merge used before the span-keyed merge, kept for comparison.'''
+    combinedOutput = []
+
+    for phrase in phrases:
+        sameSpan = next((x for x in normPhrases if x.start ==
+                         phrase.start and x.end == phrase.end), None)
+        if sameSpan:
+            phrase.normalizedTo = sameSpan.normalizedTo
+        combinedOutput.append(phrase)
+
+    for normPhrase in normPhrases:
+        sameSpan = next((x for x in phrases if x.start ==
+                         normPhrase.start and x.end == normPhrase.end), None)
+        if sameSpan is None:
+            normPhrase.type = Labels.ICD_KEYWORD_LABEL
+            combinedOutput.append(normPhrase)
+
+    return combinedOutput
+
+
+def makeSpans(numSpans, seed):
+    '''Keyword phrases and normalized phrases in the formats produced by the matchers, about half of the spans shared.'''
+    rng = random.Random(seed)
+    phrases = []
+    normPhrases = []
+    position = 0
+
+    for i in range(numSpans):
+        start = position
+        end = start + rng.randint(3, 20)
+        position = end + rng.randint(1, 30)
+        kind = rng.random()
+
+        if kind < 0.75:
+            phrases.append(SpanRecord(start, end, text='phrase%d' % i, type=Labels.ICD_KEYWORD_LABEL))
+        if kind > 0.5:
+            normPhrases.append(SpanRecord(start, end, text='phrase%d' % i, normalizedTo='norm%d' % i, type=Labels.NORMALIZE_LABEL))
+
+    return normPhrases, phrases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000],
+                        help="Numbers of spans per document.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    entityMatcher = EntityMatchers(spacy.blank('en'), [])
+
+    print("%10s %12s %12s %10s" % ('spans', 'legacy (ms)', 'merge (ms)', 'speedup'))
+
+    for size in args.sizes:
+        normPhrases, phrases = makeSpans(size, args.seed + size)
+
+        def runLegacy():
+            return legacyCombineReplaceNormalizedPhrases(copy.deepcopy(normPhrases), copy.deepcopy(phrases))
+
+        def runMerge():
+            return entityMatcher.combineReplaceNormalizedPhrases(copy.deepcopy(normPhrases), copy.deepcopy(phrases))
+
+        if [span.toDict() for span in runLegacy()] != [span.toDict() for span in runMerge()]:
+            raise AssertionError("Output differs from the legacy merge for %d spans" % size)
+
+        # inputs are mutated by the merge, so each run works on fresh copies, the copying time is measured separately
+        copyTime = min(timeit.repeat(lambda: (copy.deepcopy(normPhrases), copy.deepcopy(phrases)),
+                                     number=1, repeat=args.repeat))
+        legacyTime = min(timeit.repeat(runLegacy, number=1, repeat=args.repeat)) - copyTime
+        mergeTime = min(timeit.repeat(runMerge, number=1, repeat=args.repeat)) - copyTime
+
+        print("%10d %12.2f %12.2f %9.1fx" % (size, legacyTime * 1000, mergeTime * 1000,
+                                             legacyTime / max(mergeTime, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
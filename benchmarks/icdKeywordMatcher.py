@@ -0,0 +1,131 @@
+'''
+Benchmark of IcdKeywordMatcher.getICDforTokens() against the previous recursive level search, on notes of increasing length.
+Uses NLP/icd_10_cm_index_clean.csv when available, otherwise a synthetic ICD index of the same layout.
+Run from the project root: python -m benchmarks.icdKeywordMatcher
+'''
+from NLP.icdKeywordMatcher import IcdKeywordMatcher
+from NLP.spanRecord import SpanRecord
+from collections import defaultdict
+import argparse
+import csv
+import os
+import random
+import tempfile
+import timeit
+
+
+class LegacyIcdKeywordMatcher(IcdKeywordMatcher):
+    '''The recursive level search used before the compiled level index, kept for comparison.'''
+
+    def __init__(self, icdIndexFilePath):
+        super().__init__(icdIndexFilePath)
+        # the recursive search indexes one level past the deepest one
+        self.searchAsset.append(defaultdict(list))
+
+    def getICDforTokens(self, searchTokens):
+
+        if len(searchTokens) < 1:
+            return
+
+        valid_seq_tuples = []
+
+        for searchToken in searchTokens:
+            searchTerm = self._getSearchTerm(searchToken)
+
+            if searchTerm in self.searchAsset[1]:
+                for seq_id in self.searchAsset[1][searchTerm]:
+                    matched_terms = self._recursiveLevelSearch(searchTokens, seq_id, 2)
+
+                    if 'FINAL_LEVEL_REACHED' in matched_terms:
+                        matched_terms.insert(0, searchToken)
+                        matched_terms.remove('FINAL_LEVEL_REACHED')
+                        valid_seq_tuples.append((seq_id, matched_terms))
+
+        return [(self.searchAsset[0][seq_id], token) for seq_id, token in valid_seq_tuples]
+
+    def _recursiveLevelSearch(self, searchTokens, seq_id, level):
+        if not(seq_id in self.searchAsset[level]):
+            return ["FINAL_LEVEL_REACHED"]
+
+        trigger_token = self._findTriggerTokenFromLevelPhrases(searchTokens, self.searchAsset[level][seq_id])
+
+        if trigger_token:
+            return [trigger_token, *self._recursiveLevelSearch(searchTokens, seq_id, level + 1)]
+        return ["FINAL_LEVEL_NOT_REACHED"]
+
+    def _findTriggerTokenFromLevelPhrases(self, searchTokens, levelPhrases):
+        for token in searchTokens:
+            if self._getSearchTerm(token) in levelPhrases:
+                return token
+        return None
+
+
+def writeSyntheticIndex(path, numSequences, seed):
+    '''Write a synthetic ICD index csv with the columns read by IcdKeywordMatcher.createSearchAssetFromCSV().'''
+    rng = random.Random(seed)
+    vocabulary = ['term%d' % i for i in range(numSequences // 2)]
+
+    with open(path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['index', 'icd_code', 'seq_id', 'level', 'phrase', 'parent', 'level_final'])
+
+        for seq in range(numSequences):
+            seq_id = str(seq)
+            code = 'X%02d.%d' % (seq % 100, seq % 10)
+            for level in range(1, rng.randint(1, 5) + 1):
+                for phrase in rng.sample(vocabulary, 1 if level == 1 else rng.randint(1, 8)):
+                    writer.writerow([0, code, seq_id, level, phrase, '', level])
+
+
+def makeNote(keywordPhrases, numTokens, seed):
+    '''Keyword matches of a note, in the format produced by EntityMatchers.getIcdKeywordMatches().'''
+    rng = random.Random(seed)
+    tokens = []
+    position = 0
+    for _ in range(numTokens):
+        text = rng.choice(keywordPhrases)
+        tokens.append(SpanRecord(position, position + len(text), text=text, type='ICD Codes'))
+        position += len(text) + rng.randint(1, 200)
+    return tokens
+
+
+def asComparable(icdCodeTuples):
+    return [(code, [id(token) for token in tokens]) for code, tokens in icdCodeTuples or []]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 1000, 3000],
+                        help="Numbers of keyword tokens per note.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--index', default="NLP/icd_10_cm_index_clean.csv", help="ICD index csv file.")
+    args = parser.parse_args()
+
+    indexPath = args.index
+    if not os.path.isfile(indexPath):
+        indexPath = os.path.join(tempfile.mkdtemp(), 'synthetic_icd_index.csv')
+        writeSyntheticIndex(indexPath, 20000, args.seed)
+        print("ICD index not found, using synthetic index", indexPath)
+
+    matcher = IcdKeywordMatcher(indexPath)
+    legacyMatcher = LegacyIcdKeywordMatcher(indexPath)
+
+    print("%10s %12s %12s %10s %8s" % ('tokens', 'legacy (ms)', 'index (ms)', 'speedup', 'codes'))
+
+    for size in args.sizes:
+        note = makeNote(matcher.keywordPhrases, size, args.seed + size)
+
+        result = matcher.getICDforTokens(note)
+        if asComparable(result) != asComparable(legacyMatcher.getICDforTokens(note)):
+            raise AssertionError("Output differs from the legacy search for %d tokens" % size)
+
+        legacyTime = min(timeit.repeat(lambda: legacyMatcher.getICDforTokens(note), number=1, repeat=args.repeat))
+        indexTime = min(timeit.repeat(lambda: matcher.getICDforTokens(note), number=1, repeat=args.repeat))
+
+        print("%10d %12.2f %12.2f %9.1fx %8d" % (size, legacyTime * 1000, indexTime * 1000,
+                                                 legacyTime / indexTime, len(result)))
+
+
+if __name__ == '__main__':
+    main()
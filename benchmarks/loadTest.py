@@ -0,0 +1,234 @@
+'''
+Load test of a running AutoCoder instance with a mix of the traffic of the annotation frontend.
+Authenticates with the OAuth password grant of /o/token/, then concurrent workers send weighted random requests for a fixed duration,
+and throughput, latency percentiles and error rates are reported per endpoint.
+Create the user and OAuth application first with: python manage.py createLoadTestUser
+Run from the project root: python -m benchmarks.loadTest --client-id <id> [--url http://localhost:8000] [--concurrency 8] [--duration 60]
+'''
+from benchmarks.syntheticNotes import SyntheticNoteGenerator, loadVocabulary
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+import requests
+
+# relative weights of the endpoints in the traffic mix
+DEFAULT_MIX = {
+    'uploadDoc': 5,
+    'uploadAnnot': 30,
+    'codeAutosuggestions': 35,
+    'family': 10,
+    'ancestors': 10,
+    'getAllAnnots': 10,
+}
+
+SEARCH_STRINGS = ['hyper', 'hypertension', 'diab', 'diabetes type 2', 'pneum', 'asthma', 'fract', 'heart failure', 'I10', 'E11', 'J45']
+ICD_CODES = ['I10', 'E11', 'E119', 'J18', 'J189', 'I48', 'I50', 'N18', 'J45', 'F32']
+
+
+class LoadTestWorker(threading.Thread):
+    '''
+    Sends requests until the deadline, recording (endpoint, seconds, ok) of each in samples.
+    uploadDoc sends one of the shared notes with probability args.cache_hit_ratio, which the result cache of the instance answers
+    after their first upload, and otherwise a new note, counted in repeatedNotes and newNotes.
+    '''
+
+    def __init__(self, args, token, notes, vocabulary, seed, samples, samplesLock):
+        super().__init__(daemon=True)
+        self.args = args
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.notes = notes
+        self.vocabulary = vocabulary
+        self.repeatedNotes = 0
+        self.newNotes = 0
+        self.note = None
+        # total of the annotations of the user, from the last getAllAnnots response
+        self.annotationCount = None
+        self.samples = samples
+        self.samplesLock = samplesLock
+        self.sessionId = uuid.uuid4().hex
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = 'Bearer ' + token
+        self.endpoints = list(args.mix.keys())
+        self.weights = list(args.mix.values())
+
+    def run(self):
+        deadline = time.monotonic() + self.args.duration
+
+        while time.monotonic() < deadline:
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+            if endpoint == 'uploadDoc':
+                # generated before the timer starts, new notes take a few milliseconds
+                self.note = self._nextNote()
+            start = time.perf_counter()
+            try:
+                response = getattr(self, '_' + endpoint)()
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            seconds = time.perf_counter() - start
+
+            with self.samplesLock:
+                self.samples.append((endpoint, seconds, ok))
+
+    def _url(self, path):
+        return self.args.url.rstrip('/') + '/api/' + path
+
+    def _nextNote(self):
+        if self.rng.random() < self.args.cache_hit_ratio:
+            self.repeatedNotes += 1
+            return self.rng.choice(self.notes)
+
+        generator = SyntheticNoteGenerator(self.vocabulary, seed='%s-%d' % (self.seed, self.newNotes))
+        self.newNotes += 1
+        return generator.makeNote(self.rng.choice(self.args.note_sizes))
+
+    def _uploadDoc(self):
+        filename = 'loadtest_%d.txt' % self.rng.randrange(len(self.notes) * 10)
+        return self.session.post(self._url('uploadDoc/'), json={'filename': filename, 'format': 'txt', 'content': self.note},
+                                 timeout=self.args.timeout)
+
+    def _uploadAnnot(self):
+        # autosaves of a few files of this worker's session
+        name = 'loadtest_%s_%d.txt' % (self.sessionId[:8], self.rng.randrange(5))
+        entities = []
+        for _ in range(self.rng.randint(5, 100)):
+            start = self.rng.randrange(10000)
+            entities.append({'start': start, 'end': start + self.rng.randint(3, 30), 'type': 'ICD Codes',
+                             'tag': self.rng.choice(ICD_CODES)})
+        annotations = {'name': name, 'sessionId': self.sessionId, 'Entities': entities, 'Sentences': [], 'Sections': [],
+                       'tagTemplates': []}
+        return self.session.post(self._url('uploadAnnot/'), json=annotations, timeout=self.args.timeout)
+
+    def _codeAutosuggestions(self):
+        return self.session.get(self._url('codeAutosuggestions/%s/' % self.rng.choice(SEARCH_STRINGS)), timeout=self.args.timeout)
+
+    def _family(self):
+        return self.session.get(self._url('family/%s/' % self.rng.choice(self.args.codes)), timeout=self.args.timeout)
+
+    def _ancestors(self):
+        return self.session.get(self._url('ancestors/%s/' % self.rng.choice(self.args.codes)), timeout=self.args.timeout)
+
+    def _getAllAnnots(self):
+        # pages beyond the last one are not found, so pages are picked among those of the total of the previous response
+        pageSize = 20
+        lastPage = max(1, math.ceil(self.annotationCount / pageSize)) if self.annotationCount is not None else 1
+        params = {'orderBy': 'updated', 'order': 'desc', 'page': self.rng.randint(1, min(lastPage, 3)), 'size': pageSize}
+        response = self.session.get(self._url('getAllAnnots/'), params=params, timeout=self.args.timeout)
+        if response.status_code == 200:
+            self.annotationCount = response.json()['total']
+        return response
+
+
+def getToken(args):
+    response = requests.post(args.url.rstrip('/') + '/o/token/', timeout=args.timeout, json={
+        'grant_type': 'password',
+        'username': args.username,
+        'password': args.password,
+        'client_id': args.client_id,
+    })
+    if response.status_code != 200:
+        raise SystemExit("Authentication failed (%d): %s" % (response.status_code, response.text))
+    return response.json()['access_token']
+
+
+def percentile(sortedValues, fraction):
+    '''Nearest-rank percentile of an ascending list.'''
+    index = max(0, math.ceil(fraction * len(sortedValues)) - 1)
+    return sortedValues[index]
+
+
+def summarize(samples, duration):
+    report = dict()
+    endpoints = sorted(set(endpoint for endpoint, _, _ in samples))
+
+    for endpoint in [*endpoints, 'all']:
+        endpointSamples = [sample for sample in samples if endpoint == 'all' or sample[0] == endpoint]
+        latencies = sorted(seconds for _, seconds, _ in endpointSamples)
+        errors = sum(1 for _, _, ok in endpointSamples if not ok)
+
+        report[endpoint] = {
+            'requests': len(endpointSamples),
+            'errors': errors,
+            'errorRate': errors / len(endpointSamples),
+            'requestsPerSecond': len(endpointSamples) / duration,
+            'p50Ms': percentile(latencies, 0.50) * 1000,
+            'p95Ms': percentile(latencies, 0.95) * 1000,
+            'p99Ms': percentile(latencies, 0.99) * 1000,
+            'maxMs': latencies[-1] * 1000,
+        }
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://localhost:8000', help="Base url of the running instance.")
+    parser.add_argument('--username', default='loadtest')
+    parser.add_argument('--password', default='loadtest-password')
+    parser.add_argument('--client-id', required=True, help="Client id of the OAuth application, see createLoadTestUser.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Number of concurrent workers.")
+    parser.add_argument('--duration', type=float, default=60, help="Duration of the test in seconds.")
+    parser.add_argument('--timeout', type=float, default=120, help="Timeout of each request in seconds.")
+    parser.add_argument('--mix', type=json.loads, default=DEFAULT_MIX,
+                        help="Json object of relative endpoint weights, default: %s" % json.dumps(DEFAULT_MIX))
+    parser.add_argument('--note-sizes', type=int, nargs='+', default=[2000, 5000, 20000],
+                        help="Sizes in characters of the synthetic notes sent to uploadDoc.")
+    parser.add_argument('--cache-hit-ratio', type=float, default=0.0,
+                        help="Fraction of uploadDoc requests that repeat one of a few shared notes, answered by the result cache "
+                             "after their first upload. The others send a new note each.")
+    parser.add_argument('--codes', nargs='+', default=ICD_CODES, help="ICD codes for the family and ancestors lookups.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Optional path of a json file to write the report to.")
+    args = parser.parse_args()
+
+    unknownEndpoints = set(args.mix) - set(DEFAULT_MIX)
+    if unknownEndpoints:
+        raise SystemExit("Unknown endpoints in --mix: %s" % ', '.join(sorted(unknownEndpoints)))
+
+    if not 0 <= args.cache_hit_ratio <= 1:
+        raise SystemExit("--cache-hit-ratio must be between 0 and 1")
+
+    vocabulary = loadVocabulary()
+    generator = SyntheticNoteGenerator(vocabulary, seed=args.seed)
+    notes = [generator.makeNote(size) for size in args.note_sizes]
+    token = getToken(args)
+
+    samples = []
+    samplesLock = threading.Lock()
+    workers = [LoadTestWorker(args, token, notes, vocabulary, args.seed + i, samples, samplesLock) for i in range(args.concurrency)]
+
+    print("Running", args.concurrency, "workers for", args.duration, "seconds against", args.url)
+    start = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    duration = time.monotonic() - start
+
+    if not samples:
+        raise SystemExit("No requests completed.")
+
+    report = summarize(samples, duration)
+    repeatedNotes = sum(worker.repeatedNotes for worker in workers)
+    newNotes = sum(worker.newNotes for worker in workers)
+
+    print("%20s %9s %8s %9s %10s %10s %10s" % ('endpoint', 'requests', 'errors', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+    for endpoint, result in report.items():
+        print("%20s %9d %7.1f%% %9.1f %10.1f %10.1f %10.1f" % (
+            endpoint, result['requests'], result['errorRate'] * 100, result['requestsPerSecond'],
+            result['p50Ms'], result['p95Ms'], result['p99Ms']))
+    print("uploadDoc notes: %d new, %d repeated (--cache-hit-ratio %.2f)" % (newNotes, repeatedNotes, args.cache_hit_ratio))
+
+    if args.output:
+        with open(args.output, mode='w') as file:
+            json.dump({'concurrency': args.concurrency, 'duration': duration, 'mix': args.mix, 'cacheHitRatio': args.cache_hit_ratio,
+                       'newNotes': newNotes, 'repeatedNotes': repeatedNotes, 'endpoints': report}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
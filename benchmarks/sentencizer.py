@@ -0,0 +1,93 @@
+'''
+Benchmark of the Sentencizer sentence boundary component against the previous per-token implementation, in tokens per second on long notes.
+Run from the project root: python -m benchmarks.sentencizer [--file note.txt]
+'''
+from NLP.knowledgeBundle import SPACY_MODEL
+from NLP.sentencizer import Sentencizer
+from NLP.tokenizer import CustomTokenizer
+from spacy.attrs import SENT_START
+import argparse
+import random
+import spacy
+import timeit
+
+
+def legacySentenceBoundary(doc):
+    '''The per-token sentence boundary rules used before the array based component, kept for comparison.'''
+    delimiters = ['\n\n', '\n\n\n', '.', '?', '!']
+
+    for token in doc:
+        if token.i + 1 < len(doc):
+            if token.text.isnumeric() and doc[token.i-1].text.endswith('\n') and doc[token.i+1].text == '.':
+                doc[token.i].is_sent_start = True
+                doc[token.i+1].is_sent_start = False
+                if token.i + 2 < len(doc):
+                    doc[token.i+2].is_sent_start = False
+                doc[token.i-1].is_sent_start = False
+
+    for token in doc:
+        if token.i + 1 < len(doc):
+            nextToken = doc[token.i+1]
+            if nextToken.is_sent_start is None:
+                nextToken.is_sent_start = token.text in delimiters
+    return doc
+
+
+def makeNote(numLines, seed):
+    '''A note of short paragraphs and numbered lists.'''
+    rng = random.Random(seed)
+    words = ['patient', 'presented', 'with', 'chest', 'pain', 'and', 'shortness', 'of', 'breath', 'no', 'fever',
+             'history', 'hypertension', 'diabetes', 'mellitus', 'type', '2', 'was', 'started', 'on', 'metformin', 'mg']
+    lines = []
+
+    for i in range(numLines):
+        sentence = ' '.join(rng.choice(words) for _ in range(rng.randint(3, 20)))
+        if rng.random() < 0.3:
+            lines.append('%d. %s' % (i % 9 + 1, sentence))
+        else:
+            lines.append(sentence + rng.choice(['.', '?', '', '.']))
+        if rng.random() < 0.2:
+            lines.append('')
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--file', help="Text file of a long note, a synthetic note is generated if omitted.")
+    parser.add_argument('--lines', type=int, default=5000, help="Number of lines of the synthetic note.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    nlp = spacy.load(SPACY_MODEL, disable=['tagger', 'ner'])
+    sentencizer = Sentencizer(nlp)
+    CustomTokenizer(nlp)
+
+    if args.file:
+        with open(args.file) as file:
+            text = file.read()
+    else:
+        text = makeNote(args.lines, 0)
+
+    numTokens = len(nlp.make_doc(text))
+
+    legacyDoc = legacySentenceBoundary(nlp.make_doc(text))
+    doc = sentencizer._sentence_boundary(nlp.make_doc(text))
+    if (legacyDoc.to_array(SENT_START) != doc.to_array(SENT_START)).any():
+        raise AssertionError("Sentence boundaries differ from the legacy component")
+
+    # tokenizing is measured separately and subtracted, as each run needs a doc without sentence boundaries
+    makeDocTime = min(timeit.repeat(lambda: nlp.make_doc(text), number=1, repeat=args.repeat))
+    legacyTime = min(timeit.repeat(lambda: legacySentenceBoundary(nlp.make_doc(text)),
+                                   number=1, repeat=args.repeat)) - makeDocTime
+    arrayTime = min(timeit.repeat(lambda: sentencizer._sentence_boundary(nlp.make_doc(text)),
+                                  number=1, repeat=args.repeat)) - makeDocTime
+
+    print("tokens: %d, sentences: %d" % (numTokens, len(list(doc.sents))))
+    print("legacy: %.2f ms, %.0f tokens/sec" % (legacyTime * 1000, numTokens / legacyTime))
+    print("array:  %.2f ms, %.0f tokens/sec" % (arrayTime * 1000, numTokens / arrayTime))
+    print("speedup: %.1fx" % (legacyTime / arrayTime))
+
+
+if __name__ == '__main__':
+    main()
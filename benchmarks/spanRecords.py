@@ -0,0 +1,231 @@
+'''
+Benchmark of the matching to post-processing stages with SpanRecords against the previous dictionary per match,
+on entity-heavy synthetic notes: ICD annotations of keyword matches, formatting, EntityPostProcessor and conversion to dictionaries.
+Reports throughput and the peak memory allocated by each (tracemalloc), and checks that both produce the same entities.
+Uses NLP/icd_10_cm_index_clean.csv when available, otherwise a synthetic ICD index of the same layout.
+Run from the project root: python -m benchmarks.spanRecords
+'''
+from NLP.icdKeywordMatcher import IcdKeywordMatcher
+from NLP.entityPostProcessor import EntityPostProcessor
+from NLP.matcherPatterns import Labels
+from NLP.spanRecord import SpanRecord, toDicts
+from benchmarks.icdKeywordMatcher import writeSyntheticIndex
+import argparse
+import copy
+import os
+import random
+import tempfile
+import timeit
+import tracemalloc
+
+
+class LegacyIcdKeywordMatcher(IcdKeywordMatcher):
+    '''ICD annotations as dictionaries, as before SpanRecords, kept for comparison.'''
+
+    def _handleNormalizedPhrases(self, keywordMatches):
+        output = []
+        for kw in keywordMatches:
+            if 'text' in kw:
+                output.append(kw)
+            if 'normalizedTo' in kw:
+                newKw = copy.deepcopy(kw)
+                newKw['originText'] = newKw['text']
+                newKw['text'] = newKw['normalizedTo']
+                output.append(newKw)
+        return output
+
+    def getIcdAnnotations(self, keywordMatches, phraseNorm, **kwargs):
+        if phraseNorm:
+            keywordMatches = self._handleNormalizedPhrases(keywordMatches)
+
+        icdCodeTuples = self.getICDforTokens(keywordMatches)
+        if not icdCodeTuples:
+            return []
+
+        annotations = []
+        for icdLabel, meta in icdCodeTuples:
+            meta.sort(key=lambda x: x['start'], reverse=False)
+            for i, annotation in enumerate(meta):
+                annot = {"start": annotation['start'], "end": annotation['end'], "tag": icdLabel, "type": Labels.ICD_KEYWORD_LABEL}
+                if i > 0:
+                    prevAnnot['next'] = annot
+                prevAnnot = annot
+                annotations.append(annot)
+
+        return annotations
+
+
+class LegacyEntityPostProcessor(EntityPostProcessor):
+    '''EntityPostProcessor of dictionaries, as before SpanRecords, kept for comparison.'''
+
+    def __init__(self, sections, sentences, entities, entityType):
+        super().__init__(sections, sentences, [], entityType)
+        self.entities = [i for i in entities if i['type'] == entityType]
+
+    def filterAnnotationsFromSections(self, inputEntities, sectionsIgnored):
+        output = []
+        for entity in inputEntities:
+            section = self.sectionIndex.getSpan(entity['start'], entity['end'])
+            if section is None or not section['tag'] in sectionsIgnored:
+                output.append(entity)
+        return output
+
+    def buildHeadItemsList(self, inputEntities):
+        linkedIds = set(id(entity['next']) for entity in inputEntities if 'next' in entity)
+        return [entity for entity in inputEntities if id(entity) not in linkedIds]
+
+    def filterBySentenceDistance(self, headEntities, maxSentDist):
+        filteredHeadEntities = []
+        for entity in headEntities:
+            cursor = entity
+            sentenceIndices = [self._addSentenceIndex(cursor)]
+            while 'next' in cursor:
+                cursor = cursor['next']
+                sentenceIndices.append(self._addSentenceIndex(cursor))
+            if max(sentenceIndices) - min(sentenceIndices) <= maxSentDist:
+                filteredHeadEntities.append(entity)
+        return filteredHeadEntities
+
+    def _addSentenceIndex(self, entity):
+        sentenceIndex = self.sentenceIndex.getOrdinal(entity['start'], entity['end'])
+        if sentenceIndex is not None:
+            entity['sent-idx'] = sentenceIndex
+            return sentenceIndex
+        return 0
+
+    def _getLinkDepth(self, head):
+        i = 1
+        while 'next' in head:
+            i += 1
+            head = head['next']
+        return i
+
+    def _getSpanTuple(self, annot):
+        return (annot['start'], annot['end'])
+
+    def _getSpanSet(self, head):
+        spans = {self._getSpanTuple(head)}
+        while 'next' in head:
+            head = head['next']
+            spans.add(self._getSpanTuple(head))
+        return spans
+
+    def _getFlatList(self, listOfLinkedLists):
+        flatList = []
+        for head in listOfLinkedLists:
+            flatList.append(head)
+            while 'next' in head:
+                head = head['next']
+                flatList.append(head)
+        return flatList
+
+
+def makeNote(keywordPhrases, numKeywords, seed):
+    '''
+    Returns (matches, sentences, sections) of a synthetic note, where matches are (start, end, text, normalizedTo) tuples of keyword
+    matches, a quarter of them normalized, in sentences of about 8 matches and sections of about 20 sentences.
+    '''
+    rng = random.Random(seed)
+    matches = []
+    position = 0
+
+    for _ in range(numKeywords):
+        text = rng.choice(keywordPhrases)
+        normalizedTo = rng.choice(keywordPhrases) if rng.random() < 0.25 else None
+        matches.append((position, position + len(text), text, normalizedTo))
+        position += len(text) + rng.randint(1, 40)
+
+    sentenceLength = max(1, position * 8 // max(numKeywords, 1))
+    sentences = [{'start': start, 'end': min(start + sentenceLength, position), 'tag': ''}
+                 for start in range(0, position, sentenceLength)]
+    sections = [{'start': sentences[i]['start'], 'end': sentences[min(i + 20, len(sentences)) - 1]['end'],
+                 'tag': rng.choice(['hpi', 'pmh', 'fam_hist', 'plan'])} for i in range(0, len(sentences), 20)]
+
+    return matches, sentences, sections
+
+
+def runRecords(matcher, note):
+    matches, sentences, sections = note
+    keywordMatches = [SpanRecord(start, end, text=text, normalizedTo=normalizedTo, type=Labels.ICD_KEYWORD_LABEL)
+                      for start, end, text, normalizedTo in matches]
+
+    icdEntities = matcher.getIcdAnnotations(keywordMatches, True)
+    # as LanguageProcessor._formatIcdEntities()
+    for icdEntity in icdEntities:
+        icdEntity.tag = icdEntity.tag.replace(".", "")
+        icdEntity.confirmed = False
+
+    cleanIcdEntities = EntityPostProcessor(sections, sentences, icdEntities, Labels.ICD_KEYWORD_LABEL).processICD(True, 2, ['fam_hist'])
+    return toDicts(cleanIcdEntities)
+
+
+def runDicts(matcher, note):
+    matches, sentences, sections = note
+    keywordMatches = []
+    for start, end, text, normalizedTo in matches:
+        match = {'start': start, 'end': end, 'text': text, 'type': Labels.ICD_KEYWORD_LABEL}
+        if normalizedTo is not None:
+            match['normalizedTo'] = normalizedTo
+        keywordMatches.append(match)
+
+    icdEntities = matcher.getIcdAnnotations(keywordMatches, True)
+    # as LanguageProcessor._formatIcdEntities() before SpanRecords
+    for icdEntity in icdEntities:
+        icdEntity["tag"] = icdEntity["tag"].replace(".", "")
+        icdEntity["confirmed"] = False
+        currentTag = icdEntity
+        while 'next' in currentTag:
+            currentTag = currentTag["next"]
+            currentTag["tag"] = currentTag["tag"].replace(".", "")
+
+    return LegacyEntityPostProcessor(sections, sentences, icdEntities, Labels.ICD_KEYWORD_LABEL).processICD(True, 2, ['fam_hist'])
+
+
+def measurePeak(function):
+    '''Returns the peak memory in bytes allocated while running function.'''
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 10000],
+                        help="Numbers of keyword matches per note.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--index', default="NLP/icd_10_cm_index_clean.csv", help="ICD index csv file.")
+    args = parser.parse_args()
+
+    indexPath = args.index
+    if not os.path.isfile(indexPath):
+        indexPath = os.path.join(tempfile.mkdtemp(), 'synthetic_icd_index.csv')
+        writeSyntheticIndex(indexPath, 20000, args.seed)
+        print("ICD index not found, using synthetic index", indexPath)
+
+    matcher = IcdKeywordMatcher(indexPath)
+    legacyMatcher = LegacyIcdKeywordMatcher(indexPath)
+
+    print("%10s %10s %12s %12s %16s %16s %10s" % ('keywords', 'entities', 'dicts (ms)', 'records (ms)',
+                                                   'dicts peak KB', 'records peak KB', 'entities/s'))
+
+    for size in args.sizes:
+        note = makeNote(matcher.keywordPhrases, size, args.seed + size)
+
+        result = runRecords(matcher, note)
+        if result != runDicts(legacyMatcher, note):
+            raise AssertionError("Entities differ from the dictionary pipeline for %d keywords" % size)
+
+        dictsTime = min(timeit.repeat(lambda: runDicts(legacyMatcher, note), number=1, repeat=args.repeat))
+        recordsTime = min(timeit.repeat(lambda: runRecords(matcher, note), number=1, repeat=args.repeat))
+        dictsPeak = measurePeak(lambda: runDicts(legacyMatcher, note))
+        recordsPeak = measurePeak(lambda: runRecords(matcher, note))
+
+        print("%10d %10d %12.2f %12.2f %16.1f %16.1f %10.0f" % (size, len(result), dictsTime * 1000, recordsTime * 1000,
+                                                                 dictsPeak / 1024, recordsPeak / 1024, len(result) / recordsTime))
+
+
+if __name__ == '__main__':
+    main()
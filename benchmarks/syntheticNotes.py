@@ -0,0 +1,177 @@
+'''
+Deterministic generator of synthetic clinical notes for benchmarking the NLP pipeline.
+Notes are assembled from the section headers of NLP/sections.json, ICD index phrases, normalization terms and negation cues,
+with small built-in vocabularies in place of knowledge files that are not available.
+The same seed and size always produce the same note.
+Run from the project root to write notes for reportPipelineProfiles: python -m benchmarks.syntheticNotes <output_dir> [--sizes 1000 10000]
+'''
+import argparse
+import csv
+import json
+import os
+import random
+
+SECTIONS_FILE = "NLP/sections.json"
+ICD_INDEX_FILE = "NLP/icd_10_cm_index_clean.csv"
+NORMALIZATION_TERMS_FILE = "NLP/Normalization_terms.csv"
+UMLS_TERMS_FILE = "NLP/UMLS_terms_normalized.csv"
+NEGATION_CUES_FILE = "NLP/neg_list_complete.txt"
+
+# note sizes in characters, from 1KB to 1MB
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+FALLBACK_KEYWORDS = [
+    'hypertension', 'diabetes mellitus', 'type 2', 'chest pain', 'shortness of breath', 'pneumonia', 'atrial fibrillation',
+    'heart failure', 'congestive', 'renal failure', 'acute', 'chronic', 'kidney disease', 'asthma', 'copd', 'anemia',
+    'sepsis', 'urinary tract infection', 'myocardial infarction', 'stroke', 'depression', 'obesity', 'hyperlipidemia',
+    'cellulitis', 'fracture', 'hip', 'left', 'right', 'lower extremity', 'deep vein thrombosis', 'pulmonary embolism',
+]
+FALLBACK_NORMALIZATION = [
+    'htn', 'dm', 'dm2', 'sob', 'cp', 'afib', 'chf', 'ckd', 'mi', 'cva', 'uti', 'dvt', 'pe', 'hld', 'gerd', 'osa',
+]
+FALLBACK_NEGATIONS = ['no', 'denies', 'negative for', 'without', 'no evidence of', 'ruled out', 'not']
+FILLER_WORDS = [
+    'patient', 'presented', 'with', 'and', 'was', 'the', 'of', 'on', 'in', 'to', 'for', 'since', 'yesterday', 'history',
+    'started', 'continued', 'stable', 'improved', 'mg', 'daily', 'twice', 'reports', 'noted', 'given', 'follow', 'up',
+    'blood', 'pressure', 'normal', 'exam', 'today', 'admitted', 'discharged', 'home', 'family', 'mother', 'father',
+]
+
+
+def _readSectionHeaders(path):
+    '''Returns the aliases of all sections in the sections tree.'''
+    with open(path) as file:
+        tree = json.load(file)
+
+    headers = []
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        headers.extend(node.get('aliases', []))
+        nodes.extend(node.get('children', []))
+    return sorted(set(headers))
+
+
+def _readCsvColumns(path, columns, delimiter=','):
+    '''Returns the sorted distinct values of the given columns of a csv file, skipping the header row.'''
+    values = set()
+    with open(path, newline='') as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        next(reader)
+        for row in reader:
+            values.update(row[column] for column in columns if column < len(row) and row[column])
+    return sorted(values)
+
+
+def loadVocabulary():
+    '''
+    Returns a dictionary of phrase lists used to assemble notes, with keys:
+    - headers: section header aliases.
+    - keywords: ICD index phrases.
+    - normalization: phrases normalized by the PhraseNormalizer.
+    - negations: negation cues.
+    '''
+    vocabulary = {
+        'headers': ['history of present illness', 'past medical history', 'medications', 'family history', 'plan'],
+        'keywords': FALLBACK_KEYWORDS,
+        'normalization': FALLBACK_NORMALIZATION,
+        'negations': FALLBACK_NEGATIONS,
+    }
+
+    if os.path.isfile(SECTIONS_FILE):
+        vocabulary['headers'] = _readSectionHeaders(SECTIONS_FILE)
+    if os.path.isfile(ICD_INDEX_FILE):
+        vocabulary['keywords'] = _readCsvColumns(ICD_INDEX_FILE, [4])
+    if os.path.isfile(NORMALIZATION_TERMS_FILE) and os.path.isfile(UMLS_TERMS_FILE):
+        # the columns read as normalization keys by PhraseNormalizer
+        vocabulary['normalization'] = sorted(set(_readCsvColumns(NORMALIZATION_TERMS_FILE, [1, 3])) |
+                                             set(_readCsvColumns(UMLS_TERMS_FILE, [4, 6])))
+    if os.path.isfile(NEGATION_CUES_FILE):
+        vocabulary['negations'] = _readCsvColumns(NEGATION_CUES_FILE, [0], delimiter='\t')
+
+    return vocabulary
+
+
+class SyntheticNoteGenerator:
+    '''
+    Assembles notes of sections with a header line followed by sentences and numbered list items,
+    mixing filler words with ICD keyword phrases, normalization terms and negated findings.
+    '''
+
+    def __init__(self, vocabulary=None, seed=0):
+        self.vocabulary = vocabulary or loadVocabulary()
+        self.seed = seed
+
+    def makeNote(self, size):
+        '''Returns a note of about size characters ending with a complete line, the same for the same seed and size.'''
+        rng = random.Random('%s-%s' % (self.seed, size))
+        parts = []
+        length = 0
+
+        while length < size:
+            section = self._makeSection(rng)
+            parts.append(section)
+            length += len(section)
+
+        note = ''.join(parts)[:size]
+        lastLineEnd = note.rfind('\n')
+        if lastLineEnd > size // 2:
+            note = note[:lastLineEnd + 1]
+        return note
+
+    def _makeSection(self, rng):
+        header = rng.choice(self.vocabulary['headers'])
+        lines = ['\n%s:\n' % header.capitalize()]
+        sectionLength = rng.randint(200, 2000)
+        length = 0
+
+        while length < sectionLength:
+            if rng.random() < 0.3:
+                line = ''.join('%d. %s\n' % (i, self._makeSentence(rng, 4)) for i in range(1, rng.randint(2, 6)))
+            else:
+                line = ' '.join(self._makeSentence(rng, 12) for _ in range(rng.randint(1, 4))) + '\n'
+                if rng.random() < 0.3:
+                    line += '\n'
+            lines.append(line)
+            length += len(line)
+
+        return ''.join(lines)
+
+    def _makeSentence(self, rng, maxWords):
+        words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(2, maxWords))]
+
+        for _ in range(rng.randint(0, 3)):
+            draw = rng.random()
+            if draw < 0.5:
+                phrase = rng.choice(self.vocabulary['keywords'])
+            elif draw < 0.75:
+                phrase = rng.choice(self.vocabulary['normalization'])
+            else:
+                phrase = '%s %s' % (rng.choice(self.vocabulary['negations']), rng.choice(self.vocabulary['keywords']))
+            words.insert(rng.randint(0, len(words)), phrase)
+
+        sentence = ' '.join(words)
+        return sentence[0].upper() + sentence[1:] + '.'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('output', help="Directory to write the notes to, as note_<size>_<n>.txt")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Note sizes in characters.")
+    parser.add_argument('--count', type=int, default=1, help="Number of notes per size.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    vocabulary = loadVocabulary()
+    os.makedirs(args.output, exist_ok=True)
+
+    for n in range(args.count):
+        generator = SyntheticNoteGenerator(vocabulary, seed=args.seed + n)
+        for size in args.sizes:
+            path = os.path.join(args.output, 'note_%d_%d.txt' % (size, n))
+            with open(path, mode='w') as file:
+                file.write(generator.makeNote(size))
+            print("Wrote", path)
+
+
+if __name__ == '__main__':
+    main()
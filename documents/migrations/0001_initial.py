@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParsedDocument',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('textHash', models.CharField(max_length=64)),
+                ('pipelineVersion', models.CharField(max_length=64)),
+                ('snapshot', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'parsed_documents',
+                'unique_together': {('textHash', 'pipelineVersion')},
+            },
+        ),
+    ]
@@ -0,0 +1,14 @@
+from django.db import models
+
+
+class ParsedDocument(models.Model):
+    '''Snapshot of a document parsed by the NLP pipeline (LanguageProcessor.snapshotDoc()), for re-analysis with other parameters.'''
+    id = models.AutoField(primary_key=True)
+    textHash = models.CharField(max_length=64)
+    pipelineVersion = models.CharField(max_length=64)
+    snapshot = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        db_table = "parsed_documents"
+        unique_together = [['textHash', 'pipelineVersion']]
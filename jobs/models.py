@@ -0,0 +1,25 @@
+import uuid
+from django.db import models
+from users.models import CustomUser
+from django.contrib.postgres.fields import JSONField
+
+
+class AnalysisJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.DO_NOTHING)
+    status = models.CharField(max_length=16, default=PENDING, choices=[
+                              (PENDING, PENDING), (RUNNING, RUNNING), (DONE, DONE), (FAILED, FAILED)])
+    filename = models.CharField(max_length=255, blank=True)
+    result = JSONField(null=True)
+    error = models.TextField(null=True, blank=True)
+    callbackUrl = models.URLField(max_length=2048, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    updated = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        db_table = "analysis_jobs"
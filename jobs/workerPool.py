@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from jobs.models import AnalysisJob
+import requests
+
+_executor = None
+
+
+def _getExecutor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.NLP_JOB_WORKERS, thread_name_prefix='analysis-job')
+    return _executor
+
+
+def submitJob(jobId, analyze):
+    '''
+    Run an analysis job in the background worker pool.
+    The pool is in the memory of this process, its pending and running jobs are lost when the process exits,
+    and are reported failed by failIfStale() after settings.NLP_JOB_TIMEOUT.
+    - jobId: id of a pending AnalysisJob.
+    - analyze: function without arguments that returns the json-serializable result of the job.
+    '''
+    _getExecutor().submit(_runJob, jobId, analyze)
+
+
+def failIfStale(job):
+    '''
+    Mark the job failed if it is still pending or running settings.NLP_JOB_TIMEOUT seconds after it was created,
+    e.g. lost in a restart of the process that ran it. Returns whether it was marked failed.
+    '''
+    if job.status not in (AnalysisJob.PENDING, AnalysisJob.RUNNING):
+        return False
+    if job.created > timezone.now() - timedelta(seconds=settings.NLP_JOB_TIMEOUT):
+        return False
+
+    # only if not finished in the meantime
+    updated = AnalysisJob.objects.filter(id=job.id, status__in=[AnalysisJob.PENDING, AnalysisJob.RUNNING]).update(
+        status=AnalysisJob.FAILED, error="Job timed out or was lost in a restart of the server.", updated=timezone.now())
+    job.refresh_from_db()
+    return updated > 0
+
+
+def _runJob(jobId, analyze):
+    # worker threads open their own database connections, which Django does not clean up outside of requests
+    close_old_connections()
+    try:
+        # jobs already reported failed by failIfStale() are not run
+        if not AnalysisJob.objects.filter(id=jobId, status=AnalysisJob.PENDING).update(status=AnalysisJob.RUNNING):
+            return
+        job = AnalysisJob.objects.get(id=jobId)
+
+        try:
+            job.result = analyze()
+            job.status = AnalysisJob.DONE
+        except Exception as e:
+            print("Analysis job", jobId, "failed:", repr(e))
+            job.error = "%s: %s" % (type(e).__name__, e)
+            job.status = AnalysisJob.FAILED
+
+        job.save()
+
+        if job.callbackUrl:
+            _sendCallback(job)
+    finally:
+        close_old_connections()
+
+
+def _sendCallback(job):
+    '''Notify the job's callback url that the job has finished, results are then fetched from the job status endpoint.'''
+    try:
+        requests.post(job.callbackUrl, json={'jobId': str(job.id), 'status': job.status}, timeout=10)
+    except requests.RequestException as e:
+        print("Callback for analysis job", job.id, "failed:", repr(e))